@@ -4,101 +4,95 @@ import logging
 import os
 import ctypes
 import sys
-import math
 import pandas
 import datetime
-import json
+from dataclasses import dataclass, field
+from typing import Callable
+import multiprocessing
 from logging.config import dictConfig
 from PyQt5 import QtCore, QtGui, QtWidgets
 
+try:
+    import pythoncom
+except ImportError:  # Not on Windows, there are no COM objects to print with.
+    pythoncom = None
 
 from utilities import *
+from appsettings import AppSettings
 from errors import *
 from mainwindow import Ui_MainWindow
-from excelparser import parse_excel, REQUIRED_SHEETS, CUT_SHEET_NAME
-from label import Label
+from customwidgets import LabelPreviewWidget, CustomQTableWidget
+from excelparser import (
+    parse_cut_sheet,
+    cut_sheet_table_rows,
+    CutSheetCache,
+    TABLE_COLUMNS,
+    CUT_SHEET_NAME,
+    CUT_SHEET_FILE_FILTER,
+)
+from label import Label, WIRE_BUNDLE_LABEL_FIELDS
+from fieldformulas import (
+    LabelFieldsFunction,
+    field_formulas,
+    compile_field_formulas,
+    job_values,
+)
 from printer import DymoLabelPrinter
+from printerpool import (
+    PrinterPool,
+    DymoPrinterBackend,
+    PrintJob,
+    BatchResult,
+    label_print_jobs,
+    SCHEDULERS,
+    LEAST_LOADED,
+)
+from templateregistry import TemplateRegistry
+from networkprinter import NetworkLabelPrinter
+from renderpool import RenderEngine
+from printbatcher import AdaptiveBatcher
+from jobserver import JobServerClient, CLAIMED, CONNECTED, PRINTED
+from printjournal import JournalEntry, PrintJournal, JOURNAL_FILE_EXTENSION
+from exporter import export, export_labels
+from columnwidths import ColumnWidthCache
+from session import SessionJournal, LOADED, OPTIONS, PREVIOUS_LABEL, CLOSED
+from session import PRINTED as SESSION_PRINTED
+from tablediff import row_hash, diff_table_rows
+from scanstation import ScanIndex, MATCHED, DUPLICATE, UNKNOWN, INVALID
+from materials import MaterialJob, material_report
+from machineprogram import export_program, cut_batches
+from metrics import (
+    MetricEvent,
+    MetricsStore,
+    rollup,
+    ROLLUP_KEYS,
+    ROLLUP_TOTALS,
+    HOUR,
+    DAY,
+    OPERATOR,
+)
 from settings import *
-from update import check_for_updates
+from update import check_for_updates, apply_staged_update, Updater, UpdateThread
 
 
-COLUMNS = ["Line", "Bundles"]
-for required_sheet in REQUIRED_SHEETS:
-    if required_sheet.name != CUT_SHEET_NAME:
-        continue
-    for column in required_sheet.columns:
-        COLUMNS.append(column)
+COLUMNS = TABLE_COLUMNS
+QUICK_FILTER_COLUMNS = ["Gauge", "Type", "Color", "Left Terminal", "Right Terminal"]
+EXACT_FILTER_COLUMNS = ["Gauge"]  # Gauge 1 should not match 16.
 
 
-settings = QtCore.QSettings(COMPANY_NAME, PROGRAM_NAME)
+app_settings = AppSettings().load()
+app_settings.save()  # Save the default value of any new settings.
 
-# Default log settings
+# Log settings
+MAX_LOG_SIZE_MB = app_settings.logging.max_log_size_mb
+MAX_LOG_COUNT = app_settings.logging.max_log_count
+LOG_LEVEL = app_settings.logging.log_level
 
-MAX_LOG_SIZE_MB = (
-    DefaultSetting(
-        settings=settings, group_name="Logging", name="max_log_size_mb", value=5
-    )
-    .initialize_setting()
-    .value
-)
-MAX_LOG_COUNT = (
-    DefaultSetting(
-        settings=settings, group_name="Logging", name="max_log_count", value=3
-    )
-    .initialize_setting()
-    .value
-)
-LOG_LEVEL = (
-    DefaultSetting(
-        settings=settings, group_name="Logging", name="log_level", value=logging.INFO
-    )
-    .initialize_setting()
-    .value
-)
-
-
-# Default program settings
-MAX_LABEL_COUNT = (
-    DefaultSetting(
-        settings=settings, group_name="Program", name="max_label_count", value=100
-    )
-    .initialize_setting()
-    .value
-)
-REMOVE_PRINTED_LABELS = (
-    DefaultSetting(
-        settings=settings,
-        group_name="Program",
-        name="remove_printed_labels",
-        value=True,
-    )
-    .initialize_setting()
-    .value
-)
-DEBUG = (
-    DefaultSetting(settings=settings, group_name="Program", name="debug", value=False)
-    .initialize_setting()
-    .value
-)
-if DEBUG == "true":
-    DEBUG = True
-else:
-    DEBUG = False
-
-DISSABLE_LABEL_PRINTING = (
-    DefaultSetting(
-        settings=settings,
-        group_name="Program",
-        name="disable_label_printing",
-        value=False,
-    )
-    .initialize_setting()
-    .value
-)
-if DISSABLE_LABEL_PRINTING == "true":
-    DISSABLE_LABEL_PRINTING = True
-else:
-    DISSABLE_LABEL_PRINTING = False
+# Program settings
+MAX_LABEL_COUNT = app_settings.program.max_label_count
+REMOVE_PRINTED_LABELS = app_settings.program.remove_printed_labels
+DEBUG = app_settings.program.debug
+DISSABLE_LABEL_PRINTING = app_settings.program.disable_label_printing
 
 
 if DEBUG:
@@ -187,8 +181,8 @@ class UserDialog(QtWidgets.QDialog):
         self.setLayout(self.main_layout)
 
         self.first_name_input.setFocus()
-        self.first_name_input.setText(settings.value("User/first_name", ""))
-        self.last_name_input.setText(settings.value("User/last_name", ""))
+        self.first_name_input.setText(app_settings.user.first_name)
+        self.last_name_input.setText(app_settings.user.last_name)
 
     def accept(self) -> None:
         first_name = self.first_name_input.text().strip()
@@ -203,8 +197,9 @@ class UserDialog(QtWidgets.QDialog):
             return
         self.user = User(first_name, last_name)
         backend_logger.debug(f"Saving User: {self.user}")
-        settings.setValue("User/first_name", first_name)
-        settings.setValue("User/last_name", last_name)
+        app_settings.user.first_name = first_name
+        app_settings.user.last_name = last_name
+        app_settings.save()
         super().accept()
 
 
@@ -260,15 +255,488 @@ class CustomerNameDialog(QtWidgets.QDialog):
         super().accept()
 
 
+class ScanStationDialog(QtWidgets.QDialog):
+    """Checks scanned labels against the print journal. The barcode scanner
+    types each payload into the scan input followed by enter."""
+
+    STATUS_COLORS = {
+        MATCHED: "#2e7d32",
+        DUPLICATE: "#e65100",
+        UNKNOWN: "#c62828",
+        INVALID: "#c62828",
+    }
+
+    def __init__(self, journal: PrintJournal, parent=None):
+        super(ScanStationDialog, self).__init__(parent)
+
+        self.setWindowTitle("Scan Station")
+        self.journal = journal
+        self.index = ScanIndex()
+
+        self.scan_input = QtWidgets.QLineEdit()
+        self.scan_input.setPlaceholderText("Scan a label...")
+        self.scan_input.returnPressed.connect(self.on_scan)
+        self.status_label = QtWidgets.QLabel("")
+        font = self.status_label.font()
+        font.setPointSize(font.pointSize() * 2)
+        self.status_label.setFont(font)
+        self.counts_label = QtWidgets.QLabel("")
+        self.log_listwidget = QtWidgets.QListWidget()
+
+        self.load_button = QtWidgets.QPushButton("Load Journal...")
+        self.load_button.clicked.connect(self.on_load_journal)
+        self.missing_button = QtWidgets.QPushButton("Show Missing")
+        self.missing_button.clicked.connect(self.show_missing)
+
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addWidget(self.scan_input)
+        self.main_layout.addWidget(self.status_label)
+        self.main_layout.addWidget(self.counts_label)
+        self.main_layout.addWidget(self.log_listwidget, stretch=1)
+        button_layout = QtWidgets.QHBoxLayout()
+        button_layout.addWidget(self.load_button)
+        button_layout.addWidget(self.missing_button)
+        self.main_layout.addLayout(button_layout)
+        self.setLayout(self.main_layout)
+
+        if os.path.exists(self.journal.file_path()):
+            self.load_journals([self.journal.file_path()])
+        self.update_counts()
+        self.scan_input.setFocus()
+
+    def load_journals(self, file_paths: list[str]):
+        self.index.load(file_paths)
+        frontend_logger.info(
+            f"Scan station loaded {len(file_paths)} journal(s), {self.index.printed} label(s) printed."
+        )
+        self.update_counts()
+
+    def on_load_journal(self):
+        file_paths, _ = QtWidgets.QFileDialog.getOpenFileNames(
+            self,
+            "Load Print Journal",
+            self.journal.folder,
+            f"Print Journal (*{JOURNAL_FILE_EXTENSION})",
+        )
+        if file_paths:
+            self.load_journals(file_paths)
+        self.scan_input.setFocus()
+
+    def on_scan(self):
+        result = self.index.scan(self.scan_input.text())
+        self.scan_input.clear()
+        if result.label is not None:
+            entry = result.label.entry
+            text = f"{result.status.title()}: {entry.job_id} line {entry.line} ({result.label.scanned}/{result.label.copies})"
+        else:
+            text = f"{result.status.title()}: {result.text}"
+        self.status_label.setText(text)
+        self.status_label.setStyleSheet(f"color: {self.STATUS_COLORS[result.status]}")
+        if result.status != MATCHED:
+            frontend_logger.warning(f"Scan station: {text}")
+            self.log_listwidget.insertItem(0, text)
+        self.update_counts()
+
+    def update_counts(self):
+        counts = self.index.counts
+        self.counts_label.setText(
+            f"Printed: {self.index.printed}  Scanned: {self.index.matched}  "
+            f"Missing: {self.index.outstanding}  Duplicates: {counts[DUPLICATE]}  "
+            f"Unknown: {counts[UNKNOWN] + counts[INVALID]}"
+        )
+
+    def show_missing(self):
+        self.log_listwidget.clear()
+        for label in self.index.missing():
+            entry = label.entry
+            self.log_listwidget.addItem(
+                f"Missing {label.missing}x: {entry.job_id} line {entry.line} (printed {entry.printed_at} on {entry.printer_name})"
+            )
+        self.scan_input.setFocus()
+
+
+class ProductionReportDialog(QtWidgets.QDialog):
+    """Totals of the lines, bundles and wires printed, grouped by time,
+    operator, customer, part number or wire."""
+
+    NO_KEY = "(None)"
+
+    def __init__(self, store: MetricsStore, parent=None):
+        super(ProductionReportDialog, self).__init__(parent)
+
+        self.setWindowTitle("Production Report")
+        self.resize(700, 500)
+        self.store = store
+
+        today = QtCore.QDate.currentDate()
+        self.from_dateedit = QtWidgets.QDateEdit(today.addDays(-6))
+        self.from_dateedit.setCalendarPopup(True)
+        self.to_dateedit = QtWidgets.QDateEdit(today)
+        self.to_dateedit.setCalendarPopup(True)
+        self.group_combobox = QtWidgets.QComboBox()
+        self.group_combobox.addItems(ROLLUP_KEYS)
+        self.group_combobox.setCurrentText(OPERATOR)
+        self.then_combobox = QtWidgets.QComboBox()
+        self.then_combobox.addItems([self.NO_KEY] + ROLLUP_KEYS)
+        self.then_combobox.setCurrentText(DAY)
+        self.tablewidget = CustomQTableWidget()
+        self.totals_label = QtWidgets.QLabel("")
+
+        options_layout = QtWidgets.QHBoxLayout()
+        options_layout.addWidget(QtWidgets.QLabel("From"))
+        options_layout.addWidget(self.from_dateedit)
+        options_layout.addWidget(QtWidgets.QLabel("To"))
+        options_layout.addWidget(self.to_dateedit)
+        options_layout.addWidget(QtWidgets.QLabel("Group By"))
+        options_layout.addWidget(self.group_combobox)
+        options_layout.addWidget(QtWidgets.QLabel("Then By"))
+        options_layout.addWidget(self.then_combobox)
+        options_layout.addStretch()
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addLayout(options_layout)
+        self.main_layout.addWidget(self.tablewidget, stretch=1)
+        self.main_layout.addWidget(self.totals_label)
+        self.setLayout(self.main_layout)
+
+        self.from_dateedit.dateChanged.connect(self.update_report)
+        self.to_dateedit.dateChanged.connect(self.update_report)
+        self.group_combobox.currentTextChanged.connect(self.update_report)
+        self.then_combobox.currentTextChanged.connect(self.update_report)
+        self.update_report()
+
+    def update_report(self):
+        keys = [self.group_combobox.currentText()]
+        then_key = self.then_combobox.currentText()
+        if then_key not in (self.NO_KEY, keys[0]):
+            keys.append(then_key)
+
+        frame = self.store.read(
+            self.from_dateedit.date().toPyDate(), self.to_dateedit.date().toPyDate()
+        )
+        report = rollup(frame, keys)
+
+        headers = [str(column) for column in report.columns]
+        self.tablewidget.set_table_headers(headers)
+        self.tablewidget.setRowCount(0)
+        for column in report.columns:
+            if column == HOUR:
+                report[column] = report[column].dt.strftime("%Y-%m-%d %H:00")
+            elif column == DAY:
+                report[column] = report[column].dt.strftime("%Y-%m-%d")
+        for values in report.astype(str).itertuples(index=False):
+            self.tablewidget.insert_row_data(list(values))
+        self.tablewidget.resize_all_columns()
+
+        totals = ", ".join(
+            f"{column}: {int(report[column].sum())}" for column in ROLLUP_TOTALS
+        )
+        self.totals_label.setText(f"{len(frame)} print(s). {totals}")
+
+
+class PrinterSpeedDialog(QtWidgets.QDialog):
+    """How fast each printer was measured to print, and the batches sent."""
+
+    def __init__(self, batchers: list[AdaptiveBatcher], parent=None):
+        super(PrinterSpeedDialog, self).__init__(parent)
+
+        self.setWindowTitle("Printer Speed")
+        self.resize(800, 250)
+
+        self.tablewidget = CustomQTableWidget()
+        rows = [batcher.diagnostics() for batcher in batchers]
+        if rows:
+            self.tablewidget.set_table_headers(list(rows[0]))
+        for row in rows:
+            self.tablewidget.insert_row_data(
+                ["" if value is None else str(value) for value in row.values()]
+            )
+        self.tablewidget.resize_all_columns()
+
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addWidget(self.tablewidget)
+        self.main_layout.addWidget(
+            QtWidgets.QLabel(
+                "Labels/s: the slower of sending and printing. "
+                "Printed/s: measured from the print queue, if it can be read."
+            )
+        )
+        self.setLayout(self.main_layout)
+
+
+class MaterialReportDialog(QtWidgets.QDialog):
+    """Wire, reels and terminals used by one or more cut sheets."""
+
+    def __init__(self, jobs: list[MaterialJob], harnesses: int, parent=None):
+        super(MaterialReportDialog, self).__init__(parent)
+
+        self.setWindowTitle("Material Report")
+        self.resize(800, 600)
+        self.jobs = list(jobs)
+
+        self.jobs_tablewidget = CustomQTableWidget()
+        self.jobs_tablewidget.set_table_headers(["Job", "Harnesses", "Wires"])
+        self.harnesses_spinbox = QtWidgets.QSpinBox()
+        self.harnesses_spinbox.setRange(1, 100000)
+        self.harnesses_spinbox.setValue(harnesses)
+        self.add_button = QtWidgets.QPushButton("Add Cut Sheets...")
+        self.add_button.clicked.connect(self.add_cut_sheets)
+        self.remove_button = QtWidgets.QPushButton("Remove")
+        self.remove_button.clicked.connect(self.remove_job)
+        self.strip_checkbox = QtWidgets.QCheckBox("Include Strip")
+        self.strip_checkbox.setChecked(True)
+        self.strip_checkbox.toggled.connect(self.update_report)
+
+        self.wire_tablewidget = CustomQTableWidget()
+        self.terminals_tablewidget = CustomQTableWidget()
+        self.tabwidget = QtWidgets.QTabWidget()
+        self.tabwidget.addTab(self.wire_tablewidget, "Wire")
+        self.tabwidget.addTab(self.terminals_tablewidget, "Terminals")
+        self.summary_label = QtWidgets.QLabel("")
+
+        jobs_layout = QtWidgets.QHBoxLayout()
+        jobs_layout.addWidget(QtWidgets.QLabel("Harnesses"))
+        jobs_layout.addWidget(self.harnesses_spinbox)
+        jobs_layout.addWidget(self.add_button)
+        jobs_layout.addWidget(self.remove_button)
+        jobs_layout.addStretch()
+        jobs_layout.addWidget(self.strip_checkbox)
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addWidget(self.jobs_tablewidget, stretch=1)
+        self.main_layout.addLayout(jobs_layout)
+        self.main_layout.addWidget(self.tabwidget, stretch=2)
+        self.main_layout.addWidget(self.summary_label)
+        self.setLayout(self.main_layout)
+        self.update_report()
+
+    def add_cut_sheets(self):
+        file_paths, _ = QtWidgets.QFileDialog.getOpenFileNames(
+            self,
+            "Add Cut Sheets",
+            app_settings.general.initial_cut_sheet_directory,
+            CUT_SHEET_FILE_FILTER,
+        )
+        if not file_paths:
+            return
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            for file_path in file_paths:
+                try:
+                    dataframe = parse_cut_sheet(file_path)
+                except (Error, OSError, ValueError) as error:
+                    backend_logger.exception(error)
+                    QtWidgets.QMessageBox.warning(
+                        self, "Invalid Cut Sheet", f"{file_path}\n{error}"
+                    )
+                    continue
+                self.jobs.append(
+                    MaterialJob(
+                        get_file_name(file_path),
+                        dataframe[CUT_SHEET_NAME],
+                        self.harnesses_spinbox.value(),
+                    )
+                )
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+        self.update_report()
+
+    def remove_job(self):
+        for row in sorted(self.jobs_tablewidget.selected_row_numbers(), reverse=True):
+            del self.jobs[row]
+        self.update_report()
+
+    def reel_lengths(self) -> dict[str, float]:
+        """Feet on a reel per gauge, from the ReelLengths settings."""
+        reel_lengths = {}
+        for gauge, feet in app_settings.reel_lengths.items():
+            try:
+                reel_lengths[gauge] = float(feet)
+            except ValueError:
+                backend_logger.error(f"Invalid reel length for gauge {gauge}: {feet}")
+        return reel_lengths
+
+    def update_report(self):
+        report = material_report(
+            self.jobs, self.reel_lengths(), self.strip_checkbox.isChecked()
+        )
+
+        self.jobs_tablewidget.setRowCount(0)
+        for job in self.jobs:
+            wires = int(pandas.to_numeric(job.cut_sheet["Qty"], errors="coerce").sum())
+            self.jobs_tablewidget.insert_row_data(
+                [job.name, str(job.harnesses), str(wires * job.harnesses)]
+            )
+        self.jobs_tablewidget.resize_all_columns()
+
+        wire = report.wire.round({"Feet": 1, "Left Over": 1})
+        for tablewidget, frame in (
+            (self.wire_tablewidget, wire),
+            (self.terminals_tablewidget, report.terminals),
+        ):
+            tablewidget.set_table_headers([str(column) for column in frame.columns])
+            tablewidget.setRowCount(0)
+            for values in frame.astype(str).itertuples(index=False):
+                tablewidget.insert_row_data(list(values))
+            tablewidget.resize_all_columns()
+
+        text = (
+            f"{len(self.jobs)} job(s). {report.wire['Feet'].sum():,.1f} feet of wire "
+            f"on {report.wire['Reels'].sum()} reel(s), "
+            f"{report.terminals['Count'].sum()} terminal(s)."
+        )
+        if report.invalid_lengths:
+            text += (
+                f" {report.invalid_lengths} row(s) have a length that can not be read."
+            )
+        self.summary_label.setText(text)
+
+
+class JobEventsThread(QtCore.QThread):
+    """Listens for job server events, reconnecting if the server goes away."""
+
+    event_received = QtCore.pyqtSignal(dict)
+
+    def __init__(self, url: str, parent=None):
+        super().__init__(parent)
+        self.url = url
+        self.client = JobServerClient(url, platform.node())
+        self.instance = ""  # Of the server the sequence is from.
+        self.sequence = 0
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            try:
+                for event in self.client.events(self.sequence, self.instance):
+                    if event["type"] == CONNECTED:
+                        # A restarted server counts its events from 0 again.
+                        self.instance = event["instance"]
+                        self.sequence = event["seq"]
+                        continue
+                    self.sequence = event["seq"]
+                    self.event_received.emit(event)
+            except (OSError, ValueError) as error:
+                if self.isInterruptionRequested():
+                    break
+                backend_logger.warning(f"Lost connection to job server: {error}")
+            for _ in range(50):
+                if self.isInterruptionRequested():
+                    break
+                self.msleep(100)
+
+    def stop(self):
+        """Stop listening and wait for the thread to finish."""
+        self.requestInterruption()
+        self.client.close_events()
+        self.wait()
+
+
+class PrintThread(QtCore.QThread):
+    """Prints jobs through a printer pool in the background, so the window
+    is not frozen while it waits on slow printers or before a retry."""
+
+    printed = QtCore.pyqtSignal(object)  # BatchResult
+
+    def __init__(
+        self,
+        printer_pool: PrinterPool,
+        jobs: list[PrintJob],
+        check_printers: bool = False,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.printer_pool = printer_pool
+        self.jobs = jobs
+        self.check_printers = check_printers
+
+    def uses_dymo(self) -> bool:
+        return any(
+            isinstance(printer.backend, DymoPrinterBackend)
+            for printer in self.printer_pool.printers
+        )
+
+    def run(self):
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        dymo_printer = None
+        try:
+            if self.uses_dymo():
+                # COM objects can only be called from the thread that made them.
+                dymo_printer = DymoLabelPrinter()
+            with DymoPrinterBackend.thread_printer(dymo_printer):
+                if self.check_printers:
+                    self.printer_pool.check_printers()
+                result = self.printer_pool.print_batch(
+                    self.jobs, self.isInterruptionRequested
+                )
+        except Exception as error:  # Printer errors are handled by the pool.
+            backend_logger.exception(f"Printing failed: {error}")
+            result = BatchResult()
+            for job in self.jobs:
+                if job.printed:
+                    result.printed.append(job)
+                else:
+                    job.mark_failed(error)
+                    result.failed.append(job)
+        finally:
+            dymo_printer = None  # Released before COM is uninitialized.
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+        self.printed.emit(result)
+
+
+@dataclass(eq=False)
+class OpenJob:
+    """A cut sheet open in a tab. Only the job in the current tab has its rows
+    in the table, the others keep just the rows and what was printed."""
+
+    file_path: str = ""
+    customer_name: str = ""
+    template_name: str = ""
+    total_qty: int = 1
+    batch_size: int = 1
+    rows: list[list[str]] = None  # As last loaded. None until loaded.
+    row_hashes: dict[str, str] = field(default_factory=dict)  # line: row hash
+    printed_lines: set[str] = field(default_factory=set)
+    previous_label: Label = None
+    previous_line: str = ""  # Line of the previous label, for the print journal.
+    label_fields: LabelFieldsFunction = None  # Compiled when the job is shown.
+    sort_column: int = -1  # Table sort and scroll position, while not shown.
+    sort_order: int = QtCore.Qt.AscendingOrder
+    scroll_position: int = 0
+
+    @property
+    def job_id(self) -> str:
+        return get_file_name(self.file_path)
+
+    @property
+    def title(self) -> str:
+        return get_file_name(self.file_path) or "New Job"
+
+
 class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
     def __init__(self) -> object:
         super().__init__()
 
-        self.dataframe = None  # type: pandas.DataFrame
-        self.wire_bundle_label = Label("./templates/WireBundleLabel.label")
+        self.cut_sheets = CutSheetCache()  # Shared by every job tab.
+        self.template_registry = TemplateRegistry(TEMPLATE_FOLDER)
+        self.wire_bundle_label = Label(
+            os.path.join(TEMPLATE_FOLDER, f"{DEFAULT_LABEL_TEMPLATE}.label")
+        )
         self.user = None  # type: User
-        self.previous_label = None  # type: Label
-        self.customer_name = ""
+        self.job = OpenJob()  # The job in the current tab.
+        self.station = platform.node()
+        self.print_journal = PrintJournal()
+        self.metrics = MetricsStore()
+        self.update_thread = None  # type: UpdateThread
+        self.job_events_thread = None  # type: JobEventsThread
+        self.print_thread = None  # type: PrintThread # While labels are printing.
+        self.print_done = None  # Called with the BatchResult once printing is over.
+        self.close_after_printing = False
+        self.session = SessionJournal()
+        self.job_client = None  # type: JobServerClient
+        if app_settings.program.job_server_url:
+            self.job_client = JobServerClient(
+                app_settings.program.job_server_url, self.station
+            )
 
         dialog = UserDialog()
         dialog.exec()
@@ -321,242 +789,1106 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
 
         self.setupUi(self)
         self.tablewidget.set_table_headers(COLUMNS)
+        self.tablewidget.set_key_column(COLUMNS.index("Line"))
+        self.tablewidget.column_width_cache = ColumnWidthCache(
+            app_settings.column_widths
+        )
+        self.label_preview = LabelPreviewWidget(
+            self.centralwidget, LABEL_PREVIEW_DPI, LABEL_PREVIEW_CACHE_SIZE
+        )
+        # Previews show the time the window opened, so a label previewed again
+        # later is the same and its cached image is used.
+        self.preview_timestamp = datetime.datetime.now().strftime(DATE_TIME_FORMAT)
+        self.verticalLayout.insertWidget(
+            self.verticalLayout.indexOf(self.tablewidget) + 1, self.label_preview
+        )
+        self.setup_quick_filter()
+        self.template_combobox = QtWidgets.QComboBox(self.centralwidget)
+        self.template_combobox.setToolTip(
+            "The label template to print with. The selection is remembered for each customer."
+        )
+        self.formLayout.insertRow(1, "Template:", self.template_combobox)
+        self.setup_job_tabs()
+        self.template_combobox.addItems(self.template_registry.names())
+        self.template_combobox.setCurrentText(DEFAULT_LABEL_TEMPLATE)
+        self.set_label_template(self.template_combobox.currentText())
         # self.tablewidget.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
 
+        self.printer_pool = None  # type: PrinterPool
+        self.setup_printers_menu()
+        self.tools_menu = self.menubar.addMenu("Tools")
+        self.tools_menu.addAction("Scan Station...", self.show_scan_station)
+        self.tools_menu.addAction("Export Labels...", self.export_cut_sheet)
+        self.tools_menu.addAction(
+            "Export Machine Program...", self.export_machine_program
+        )
+        self.tools_menu.addAction("Production Report...", self.show_production_report)
+        self.tools_menu.addAction("Material Report...", self.show_material_report)
         self.selected_printer_combobox.addItems(self.printer.PRINTERS)
+        self.build_printer_pool()
         self.batch_size_spinbox.setMaximum(self.total_cut_qty_spinbox.value())
 
         self.setWindowTitle(f"{PROGRAM_NAME} v{VERSION}")
         if DEBUG:
             self.setWindowTitle(f"{PROGRAM_NAME} v{VERSION} - DEBUG MODE")
         self.connect_signals()
+        self.compile_label_fields()
 
-        # Restore program settings
-        settings.beginGroup("MainWindow")
-        try:
-            self.restoreGeometry(settings.value("geometry"))
-            self.selected_printer_combobox.setCurrentText(
-                settings.value("selected_printer_name")
+        if self.job_client is not None:
+            self.job_events_thread = JobEventsThread(
+                app_settings.program.job_server_url, self
             )
-        except Exception:
-            pass
-        settings.endGroup()
+            self.job_events_thread.event_received.connect(self.on_job_event)
+            self.job_events_thread.start()
+
+        # Restore program settings
+        self.restoreGeometry(QtCore.QByteArray(app_settings.main_window.geometry))
+        self.selected_printer_combobox.setCurrentText(
+            app_settings.main_window.selected_printer_name
+        )
+
+        # Write changed settings in batches.
+        self.settings_save_timer = QtCore.QTimer(self)
+        self.settings_save_timer.setInterval(SETTINGS_SAVE_INTERVAL_MS)
+        self.settings_save_timer.timeout.connect(app_settings.save)
+        self.settings_save_timer.start()
+
+        self.resume_session()
 
     def connect_signals(self):
         self.cut_sheet_browse_pushbutton.clicked.connect(self.cut_sheet_browse)
         self.reload_table_pushbutton.clicked.connect(self.reload_table)
         self.print_selected_pushbutton.clicked.connect(self.print_selected)
         self.print_previous_pushbutton.clicked.connect(self.print_previous)
-        self.tablewidget.itemDoubleClicked.connect(self.print_selected)
+        self.tablewidget.doubleClicked.connect(self.print_selected)
+        self.tablewidget.itemSelectionChanged.connect(self.update_label_preview)
         self.print_single_pushbutton.clicked.connect(self.print_single)
         self.total_cut_qty_spinbox.valueChanged.connect(
             self.on_total_cut_qty_spinbox_value_changed
         )
+        self.template_combobox.currentTextChanged.connect(
+            self.on_template_combobox_currentTextChanged
+        )
+        self.batch_size_spinbox.valueChanged.connect(self.record_session_options)
+        self.job_tabbar.currentChanged.connect(self.on_job_tabbar_currentChanged)
+        self.job_tabbar.tabCloseRequested.connect(self.close_job_tab)
 
     def on_total_cut_qty_spinbox_value_changed(self):
         self.batch_size_spinbox.setMaximum(self.total_cut_qty_spinbox.value())
+        self.record_session_options()
+
+    def record_session(self, event_type: str, **data):
+        """Save a change to the session, so it can be resumed after a crash."""
+        try:
+            self.session.record(event_type, **data)
+        except OSError as error:
+            backend_logger.error(f"Could not save session: {error}")
+
+    def record_session_options(self):
+        if self.job.rows is None:
+            return
+        self.record_session(
+            OPTIONS,
+            template_name=self.template_combobox.currentText(),
+            total_qty=self.total_cut_qty_spinbox.value(),
+            batch_size=self.batch_size_spinbox.value(),
+        )
+
+    def resume_session(self):
+        """Restore the table as it was when the program last closed without
+        finishing, IE. a crash, from the saved rows instead of the excel file."""
+        state = self.session.load()
+        if not state.resumable:
+            return
+        frontend_logger.info(f"Resuming session: {state.file_path}")
+        job = OpenJob(
+            file_path=state.file_path,
+            customer_name=state.customer_name,
+            template_name=state.template_name,
+            total_qty=state.total_qty,
+            batch_size=state.batch_size,
+            rows=state.rows,
+            row_hashes={row[0]: row_hash(row) for row in state.rows},
+            printed_lines=set(state.printed_lines),
+        )
+        if state.previous_label is not None:
+            job.previous_label = Label(state.previous_label["file_path"])
+            for field_name, value in state.previous_label["fields"].items():
+                job.previous_label.set_field(field_name, value)
+            job.previous_line = state.previous_label.get("line", "")
+        self.open_job_tab(job)
+        self.statusbar.showMessage(f"Resumed: {state.file_path}", 5000)
+
+    def on_template_combobox_currentTextChanged(self, name: str):
+        frontend_logger.info(f"Selected label template: {name}")
+        self.set_label_template(name)
+        if self.job.customer_name:
+            app_settings.templates[self.job.customer_name] = name
+        self.compile_label_fields()
+        self.record_session_options()
+
+    def set_label_template(self, name: str):
+        """Print and preview using the named label template."""
+        if not name:
+            return
+        try:
+            template = self.template_registry.get(name)
+        except InvalidLabelFileError as error:
+            frontend_logger.error(f"Could not load label template {name}: {error}")
+            self.label_preview.setVisible(False)
+            return
 
+        missing_fields = TemplateRegistry.missing_fields(
+            template, WIRE_BUNDLE_LABEL_FIELDS
+        )
+        if missing_fields:
+            frontend_logger.warning(
+                f"Label template {name} is missing fields {missing_fields}. These fields will not be printed."
+            )
+        self.wire_bundle_label = Label(template.file_path)
+        self.label_preview.set_template(template)
+        self.label_preview.setVisible(True)
+
+    def reload_templates(self):
+        """Rescan the templates folder and select the customer's template."""
+        names = self.template_registry.refresh()
+        current = app_settings.templates.get(
+            self.job.customer_name, self.template_combobox.currentText()
+        )
+        self.template_combobox.blockSignals(True)
+        self.template_combobox.clear()
+        self.template_combobox.addItems(names)
+        self.template_combobox.setCurrentText(current)
+        self.template_combobox.blockSignals(False)
+        self.set_label_template(self.template_combobox.currentText())
+
+    def setup_job_tabs(self):
+        """A tab for each open cut sheet. The widgets below the tabs show the
+        job in the current tab, the other jobs only keep their rows."""
+        self.job_tabbar = QtWidgets.QTabBar(self.centralwidget)
+        self.job_tabbar.setTabsClosable(True)
+        self.job_tabbar.setMovable(True)
+        self.job_tabbar.setExpanding(False)
+        self.job_tabbar.setDocumentMode(True)
+        self.formLayout.insertRow(1, self.job_tabbar)
+        index = self.job_tabbar.addTab(self.job.title)
+        self.job_tabbar.setTabData(index, self.job)
+
+    def jobs(self) -> list[OpenJob]:
+        """The jobs open, in tab order."""
+        return [
+            self.job_tabbar.tabData(index) for index in range(self.job_tabbar.count())
+        ]
+
+    def open_job_tab(self, job: OpenJob):
+        """Show a job in a new tab. An empty tab is used instead, if current."""
+        if self.job.file_path == "":
+            index = self.job_tabbar.currentIndex()
+        else:
+            self.store_job_view()
+            index = self.job_tabbar.addTab("")
+        self.job_tabbar.setTabText(index, job.title)
+        self.job_tabbar.setTabToolTip(index, job.file_path)
+        self.job_tabbar.setTabData(index, job)
+        self.job_tabbar.blockSignals(True)
+        self.job_tabbar.setCurrentIndex(index)
+        self.job_tabbar.blockSignals(False)
+        self.show_job(job)
+
+    def on_job_tabbar_currentChanged(self, index: int):
+        if index == -1:
+            return
+        job = self.job_tabbar.tabData(index)
+        if job is self.job:
+            return
+        self.store_job_view()
+        self.show_job(job)
+
+    def store_job_view(self):
+        """Keep the current job's options and table position, before the
+        table is filled with another job."""
+        self.job.template_name = self.template_combobox.currentText()
+        self.job.total_qty = self.total_cut_qty_spinbox.value()
+        self.job.batch_size = self.batch_size_spinbox.value()
+        header = self.tablewidget.horizontalHeader()
+        self.job.sort_column = header.sortIndicatorSection()
+        self.job.sort_order = header.sortIndicatorOrder()
+        self.job.scroll_position = self.tablewidget.verticalScrollBar().value()
+
+    def show_job(self, job: OpenJob):
+        """Show a job's options and fill the table with its rows."""
+        frontend_logger.info(f"Showing job: {job.file_path or job.title}")
+        self.job = job
+        self.cut_sheet_file_path_lineedit.setText(job.file_path)
+        for spinbox in (self.total_cut_qty_spinbox, self.batch_size_spinbox):
+            spinbox.blockSignals(True)
+        self.total_cut_qty_spinbox.setValue(job.total_qty)
+        self.batch_size_spinbox.setMaximum(job.total_qty)
+        self.batch_size_spinbox.setValue(job.batch_size)
+        for spinbox in (self.total_cut_qty_spinbox, self.batch_size_spinbox):
+            spinbox.blockSignals(False)
+        self.reload_templates()
+        if job.template_name:
+            self.template_combobox.blockSignals(True)
+            self.template_combobox.setCurrentText(job.template_name)
+            self.template_combobox.blockSignals(False)
+            self.set_label_template(self.template_combobox.currentText())
+        self.compile_label_fields()
+
+        self.load_rows(job.rows or [], job.printed_lines)
+        self.tablewidget.horizontalHeader().setSortIndicator(
+            job.sort_column, job.sort_order
+        )
+        self.tablewidget.verticalScrollBar().setValue(job.scroll_position)
+        loaded = job.rows is not None
+        self.print_selected_pushbutton.setEnabled(loaded)
+        self.print_single_pushbutton.setEnabled(loaded)
+        self.reload_table_pushbutton.setEnabled(job.file_path != "")
+        self.print_previous_pushbutton.setEnabled(job.previous_label is not None)
+        if not loaded:
+            return
+
+        # The session follows the job in the current tab.
+        self.record_session(
+            LOADED,
+            file_path=job.file_path,
+            customer_name=job.customer_name,
+            template_name=self.template_combobox.currentText(),
+            total_qty=job.total_qty,
+            batch_size=job.batch_size,
+            rows=job.rows,
+            printed_lines=sorted(job.printed_lines),
+        )
+        if self.job_client is not None:
+            self.open_shared_job(job.rows)
+
+    def close_job_tab(self, index: int):
+        """Close a job, asking first if it has rows left to print."""
+        job = self.job_tabbar.tabData(index)
+        remaining = sum(row[0] not in job.printed_lines for row in job.rows or [])
+        if remaining:
+            answer = QtWidgets.QMessageBox.question(
+                self,
+                "Close Job",
+                f"{job.title} has {remaining} row(s) left to print. Close it anyway?",
+            )
+            if answer != QtWidgets.QMessageBox.Yes:
+                return
+        frontend_logger.info(f"Closing job: {job.file_path or job.title}")
+        if job is self.job:
+            self.record_session(CLOSED)
+        if self.job_tabbar.count() == 1:
+            self.job_tabbar.setTabData(index, OpenJob())
+            self.job_tabbar.setTabText(index, OpenJob().title)
+            self.job_tabbar.setTabToolTip(index, "")
+            self.show_job(self.job_tabbar.tabData(index))
+            return
+        self.job_tabbar.removeTab(index)
+
+    @QtCore.pyqtSlot(int)
     def on_selected_printer_combobox_currentIndexChanged(self, index=None):
         self.printer.set_printer(self.selected_printer_combobox.currentText())
+        self.build_printer_pool()
+
+    def setup_printers_menu(self):
+        """Menu to pick the printers a batch of labels is spread across."""
+        self.printers_menu = self.menubar.addMenu("Printers")
+        self.pool_printer_actions = []  # type: list[QtWidgets.QAction]
+        # Printer name: what was learned about its speed, kept across pools.
+        self.printer_batchers = {}  # type: dict[str, AdaptiveBatcher]
+        pool_printer_names = app_settings.main_window.pool_printer_names
+
+        # Network printers are saved as name: host[:port]
+        self.render_engine = RenderEngine(app_settings.program.render_workers)
+        self.network_printers = {}  # type: dict[str, NetworkLabelPrinter]
+        for printer_name, address in app_settings.network_printers.items():
+            self.network_printers[printer_name] = NetworkLabelPrinter.from_setting(
+                printer_name, address, self.template_registry, self.render_engine
+            )
+
+        for printer_name in self.printer.PRINTERS + list(self.network_printers):
+            action = self.printers_menu.addAction(printer_name)
+            action.setCheckable(True)
+            action.setChecked(printer_name in pool_printer_names)
+            action.toggled.connect(lambda checked: self.build_printer_pool())
+            self.pool_printer_actions.append(action)
+
+        self.printers_menu.addSeparator()
+        scheduler_menu = self.printers_menu.addMenu("Scheduler")
+        scheduler_group = QtWidgets.QActionGroup(self)
+        self.pool_scheduler = app_settings.main_window.pool_scheduler
+        if self.pool_scheduler not in SCHEDULERS:
+            self.pool_scheduler = LEAST_LOADED
+        for scheduler in SCHEDULERS:
+            action = scheduler_menu.addAction(scheduler.replace("_", " ").title())
+            action.setData(scheduler)
+            action.setCheckable(True)
+            action.setChecked(scheduler == self.pool_scheduler)
+            scheduler_group.addAction(action)
+        scheduler_group.triggered.connect(self.on_pool_scheduler_triggered)
+
+        self.printers_menu.addAction("Check Printers", self.check_printers)
+        self.printers_menu.addAction("Printer Speed...", self.show_printer_speed)
+
+    def setup_quick_filter(self):
+        """Filter box above the wire table, by any column or a single column."""
+        self.filter_column_combobox = QtWidgets.QComboBox(self.centralwidget)
+        self.filter_column_combobox.addItem("All Columns", -1)
+        for column_name in QUICK_FILTER_COLUMNS:
+            self.filter_column_combobox.addItem(column_name, COLUMNS.index(column_name))
+        self.filter_lineedit = QtWidgets.QLineEdit(self.centralwidget)
+        self.filter_lineedit.setPlaceholderText("Filter...")
+        self.filter_lineedit.setClearButtonEnabled(True)
+
+        layout = QtWidgets.QHBoxLayout()
+        layout.addWidget(QtWidgets.QLabel("Filter:"))
+        layout.addWidget(self.filter_column_combobox)
+        layout.addWidget(self.filter_lineedit, stretch=1)
+        self.verticalLayout.insertLayout(
+            self.verticalLayout.indexOf(self.tablewidget), layout
+        )
+        self.filter_lineedit.textChanged.connect(self.apply_quick_filter)
+        self.filter_column_combobox.currentIndexChanged.connect(self.apply_quick_filter)
+
+    def apply_quick_filter(self):
+        column_name = self.filter_column_combobox.currentText()
+        self.tablewidget.set_filter(
+            self.filter_lineedit.text().strip(),
+            self.filter_column_combobox.currentData(),
+            exact=column_name in EXACT_FILTER_COLUMNS,
+        )
+
+    def on_pool_scheduler_triggered(self, action: QtWidgets.QAction):
+        self.pool_scheduler = action.data()
+        frontend_logger.info(f"Printer pool scheduler set to: {self.pool_scheduler}")
+        self.build_printer_pool()
+
+    def build_printer_pool(self):
+        """Print to the printers checked in the Printers menu. If none are
+        checked, print to the selected printer."""
+        printer_names = [
+            action.text() for action in self.pool_printer_actions if action.isChecked()
+        ]
+        if not printer_names:
+            printer_names = [self.selected_printer_combobox.currentText()]
+        backends = []
+        for printer_name in printer_names:
+            if printer_name in self.network_printers:
+                backends.append(self.network_printers[printer_name])
+            elif printer_name:
+                backends.append(DymoPrinterBackend(self.printer, printer_name))
+        self.printer_pool = PrinterPool(
+            backends,
+            self.pool_scheduler,
+            app_settings.program.print_retries,
+            batchers=self.printer_batchers,
+        )
+        backend_logger.info(
+            f"Printing to: {self.printer_pool.printer_names} using {self.pool_scheduler}"
+        )
+
+    def check_printers(self):
+        printer_names = self.printer_pool.check_printers()
+        self.statusbar.showMessage(f"Printers in rotation: {', '.join(printer_names)}")
+
+    def show_printer_speed(self):
+        dialog = PrinterSpeedDialog(list(self.printer_batchers.values()), self)
+        dialog.exec()
 
     def closeEvent(self, event=None):
+        if self.print_thread is not None:
+            # Closing now would lose the journal of the labels printing. Stop
+            # sending labels and close once the sent ones are recorded.
+            self.close_after_printing = True
+            self.print_thread.requestInterruption()
+            self.statusbar.showMessage("Stopping printing...")
+            if event is not None:
+                event.ignore()
+            return
         root_logger.info("Closing application.")
 
         backend_logger.debug("Saving window settings.")
-        settings.beginGroup("MainWindow")
-        settings.setValue("geometry", self.saveGeometry())
-        settings.setValue(
-            "selected_printer_name", self.selected_printer_combobox.currentText()
+        app_settings.main_window.geometry = bytes(self.saveGeometry())
+        app_settings.main_window.selected_printer_name = (
+            self.selected_printer_combobox.currentText()
         )
-        settings.endGroup()
+        app_settings.main_window.pool_printer_names = [
+            action.text() for action in self.pool_printer_actions if action.isChecked()
+        ]
+        app_settings.main_window.pool_scheduler = self.pool_scheduler
+        app_settings.save()
+        self.record_session(CLOSED)
+        self.session.close()
+        if self.update_thread is not None:
+            self.update_thread.requestInterruption()
+            self.update_thread.wait()
+        if self.job_events_thread is not None:
+            self.job_events_thread.stop()
+        self.render_engine.close()
 
         self.close()
 
     def cut_sheet_browse(self):
-        dir = settings.value("initial_cut_sheet_directory", "")
+        dir = app_settings.general.initial_cut_sheet_directory
         file_path = QtWidgets.QFileDialog.getOpenFileName(
-            self, "Select Cut Sheet", dir, "Excel Files (*.xlsx)"
+            self, "Select Cut Sheet", dir, CUT_SHEET_FILE_FILTER
         )[0]
 
         frontend_logger.info(f"Selected cut sheet: {file_path}")
 
         if file_path == "":
             return
+        for index, job in enumerate(self.jobs()):
+            if job.file_path == file_path:  # Already open, reload it.
+                self.job_tabbar.setCurrentIndex(index)
+                self.reload_table()
+                return
         try:
-            self.customer_name = get_customer_name(file_path)
-            frontend_logger.info(f"Customer Name: {self.customer_name}")
+            customer_name = get_customer_name(file_path)
+            frontend_logger.info(f"Customer Name: {customer_name}")
         except IndexError:
             frontend_logger.error("Could not find customer name. Prompting user.")
             dialog = CustomerNameDialog()
             dialog.exec()
-            self.customer_name = dialog.customer_name
-
-        self.cut_sheet_file_path_lineedit.setText(file_path)
+            customer_name = dialog.customer_name
+
+        self.open_job_tab(
+            OpenJob(
+                file_path=file_path,
+                customer_name=customer_name,
+                total_qty=self.total_cut_qty_spinbox.value(),
+                batch_size=self.batch_size_spinbox.value(),
+            )
+        )
         self.reload_table()
-        self.print_selected_pushbutton.setEnabled(True)
-        self.print_single_pushbutton.setEnabled(True)
-        self.reload_table_pushbutton.setEnabled(True)
 
     def print_previous(self):
         frontend_logger.info("Printing previous label.")
-        if self.previous_label is None:
+        if self.job.previous_label is None:
             return
 
         timestamp = datetime.datetime.now().strftime(DATE_TIME_FORMAT)
         text = ", ".join(
-            f"{key}: {value}" for key, value in self.previous_label.fields.items()
+            f"{key}: {value}" for key, value in self.job.previous_label.fields.items()
         )
 
         if DISSABLE_LABEL_PRINTING:
             frontend_logger.info(f"Printing label: {text}")
             return
 
-        self.previous_label.set_field("timestamp", timestamp)
-        self.printer.print(self.previous_label)
+        self.job.previous_label.set_field("timestamp", timestamp)
+        jobs = [PrintJob(self.job.previous_label)]
+        data = [{"Line": self.job.previous_line}]
+        # Journaled like any print, so the reprint scans as a reprint.
+        self.deliver(jobs, lambda result: self.write_print_journal(data, jobs))
+
+    def selected_rows(self) -> tuple[list[dict[str, str]], list[int]]:
+        """Get the data for the selected rows, keyed by column header.
+        Also returns the row index of each selected row."""
+        rows = self.tablewidget.selected_row_numbers()
+        data = [dict(zip(COLUMNS, self.tablewidget.row_values(row))) for row in rows]
+        return data, rows
+
+    def compile_label_fields(self):
+        """Compile the current job's label field formulas. Formulas that can
+        not be used are reported and the default formulas used instead."""
+        values = job_values(
+            self.user, self.job.customer_name, get_part_number(self.job.file_path)
+        )
+        try:
+            formulas = field_formulas(
+                app_settings.label_formulas,
+                self.job.customer_name,
+                self.template_combobox.currentText(),
+            )
+            self.job.label_fields = compile_field_formulas(formulas, values)
+        except InvalidFieldFormulaError as error:
+            frontend_logger.error(f"Invalid label field formula: {error}")
+            QtWidgets.QMessageBox.warning(
+                self,
+                "Invalid Label Formula",
+                f"{error}\n\nThe default label fields are used instead.",
+            )
+            self.job.label_fields = compile_field_formulas(
+                DEFAULT_FIELD_FORMULAS, values
+            )
+
+    def label_fields(
+        self, row: dict[str, str], timestamp: str = None
+    ) -> dict[str, str]:
+        """Get the label field values for a table row."""
+        timestamp = timestamp or datetime.datetime.now().strftime(DATE_TIME_FORMAT)
+        return self.job.label_fields(row, timestamp)
+
+    def update_label_preview(self):
+        if self.label_preview.isHidden():
+            return
+        try:
+            template = self.template_registry.get(self.template_combobox.currentText())
+        except InvalidLabelFileError as error:
+            backend_logger.error(error)
+            return
+        if template is not self.label_preview.template:
+            self.label_preview.set_template(template)  # Template file was changed.
+        data, _ = self.selected_rows()
+        if not data:
+            self.label_preview.clear()
+            return
+        self.label_preview.show_label(
+            self.label_fields(data[0], self.preview_timestamp)
+        )
 
     def print_single(self):
         frontend_logger.info("Printing selected rows.")
-        row_items = (
-            self.tablewidget.selectedItems()
-        )  # Flat list of all the selected items.
-        column_count = self.tablewidget.columnCount()
-        row_count = len(row_items) // column_count
-
-        data = []
-        to_remove = []
-        for row in range(row_count):
-            row_data = {}
-            for column in range(column_count):
-                column_heder = self.tablewidget.horizontalHeaderItem(column).text()
-                row_data[column_heder] = row_items[row * column_count + column].text()
-            to_remove.append(row_items[row * column_count + column].row())
-            data.append(row_data)
-            
-        row["Bundles"] = 1
+        data, _ = self.selected_rows()
+        for row in data:
+            row["Bundles"] = "1"
         self.print(data)
 
-    def print(self, data: dict):
-        part_number = get_part_number(self.cut_sheet_file_path_lineedit.text())
-        for row in data:
-            copies = int(row["Bundles"])
-            timestamp = datetime.datetime.now().strftime(DATE_TIME_FORMAT)
-            text = ""
-            text += f"Cut By: {self.user.initials}\n"
-            text += f"{self.customer_name} {part_number}\n"
-            text += f'{row["Gauge"]}GA {row["Color"]} {row["Type"]}\n'
-            text += f'{row["Length"]}\n'
-            text += f'{row["Left Terminal"]}\n'
-            text += f'{row["Right Terminal"]}'
-
-            barcode = {
-                "Timestamp": timestamp,
-                "Cut By": self.user.json,
-                "Customer": self.customer_name,
-                "PN": part_number,
-                "Wire": row["Gauge"] + "GA " + row["Color"] + " " + row["Type"],
-                "Length": row["Length"].replace('"', ""),
-                "Left Term": row["Left Terminal"],
-                "Right Term": row["Right Terminal"],
-            }
+    def print(
+        self,
+        data: list[dict[str, str]],
+        done: Callable[[list[PrintJob]], None] = None,
+    ):
+        """Print the labels for each row in the background. Once printing is
+        over, `done` is called with the print job of each row."""
+        timestamp = datetime.datetime.now().strftime(DATE_TIME_FORMAT)
+        jobs = label_print_jobs(
+            self.wire_bundle_label.file_path, data, self.label_fields, timestamp
+        )
+        if jobs:
+            self.job.previous_label = jobs[-1].label
+            self.job.previous_line = data[-1]["Line"]
+            self.print_previous_pushbutton.setEnabled(True)
+            self.record_session(
+                PREVIOUS_LABEL,
+                file_path=self.job.previous_label.file_path,
+                fields=self.job.previous_label.fields,
+                line=self.job.previous_line,
+            )
 
-            self.wire_bundle_label.set_field("timestamp", timestamp)
-            self.wire_bundle_label.set_field("left_text_box", text)
-            self.wire_bundle_label.set_field("right_text_box", text)
-            self.wire_bundle_label.set_field("barcode", json.dumps(barcode))
+        if DISSABLE_LABEL_PRINTING:
+            for job in jobs:
+                text = ", ".join(
+                    f"{key}: {value}" for key, value in job.label.fields.items()
+                )
+                frontend_logger.info(f"Printing label: {text}")
+            if done is not None:
+                done(jobs)
+            return
 
-            self.previous_label = self.wire_bundle_label
+        def printed(result: BatchResult):
+            self.write_print_journal(data, jobs)
+            self.record_metrics(data, jobs)
+            if done is not None:
+                done(jobs)
+
+        self.deliver(jobs, printed)
+
+    def deliver(
+        self,
+        jobs: list[PrintJob],
+        done: Callable[[BatchResult], None] = None,
+        check_printers: bool = False,
+    ):
+        """Print the jobs in a PrintThread. If any fail, the operator can
+        resubmit them, only the labels that did not print are sent again.
+        Once they stop, `done` is called with the last result."""
+        self.set_printing(True)
+        self.print_done = done
+        self.print_thread = PrintThread(self.printer_pool, jobs, check_printers, self)
+        self.print_thread.printed.connect(self.on_batch_printed)
+        self.print_thread.finished.connect(self.print_thread.deleteLater)
+        self.print_thread.start()
+
+    def on_batch_printed(self, result: BatchResult):
+        thread, self.print_thread = self.print_thread, None
+        if self.close_after_printing:
+            # The labels not sent are left unprinted in the table.
+            self.set_printing(False)
+            done, self.print_done = self.print_done, None
+            if done is not None:
+                done(result)
+            thread.wait()
+            self.close()
+            return
+        if not result.ok and self.show_print_errors(result.failed):
+            frontend_logger.info(f"Resubmitting {len(result.failed)} label(s).")
+            self.deliver(result.failed, self.print_done, check_printers=True)
+            return
+        self.set_printing(False)
+        done, self.print_done = self.print_done, None
+        if done is not None:
+            done(result)
+
+    def set_printing(self, printing: bool):
+        """While labels are printing, the job and the printers can not be
+        changed and nothing else can be printed."""
+        for widget in (
+            self.job_tabbar,
+            self.cut_sheet_browse_pushbutton,
+            self.total_cut_qty_spinbox,
+            self.batch_size_spinbox,
+            self.template_combobox,
+            self.selected_printer_combobox,
+            self.printers_menu,
+        ):
+            widget.setEnabled(not printing)
+        loaded = self.job.rows is not None
+        self.print_selected_pushbutton.setEnabled(loaded and not printing)
+        self.print_single_pushbutton.setEnabled(loaded and not printing)
+        self.reload_table_pushbutton.setEnabled(
+            self.job.file_path != "" and not printing
+        )
+        self.print_previous_pushbutton.setEnabled(
+            self.job.previous_label is not None and not printing
+        )
+        if printing:
+            self.statusbar.showMessage("Printing...")
+        else:
+            self.statusbar.clearMessage()
+
+    def write_print_journal(self, data: list[dict[str, str]], jobs: list[PrintJob]):
+        """Record the printed labels, so they can be checked at a scan station."""
+        printed_at = datetime.datetime.now().isoformat(timespec="seconds")
+        entries = [
+            JournalEntry(
+                printed_at,
+                self.station,
+                job.printer_name,
+                self.job.job_id,
+                row["Line"],
+                job.copies,
+                job.label.fields.get("barcode", ""),
+                job.job_id,
+            )
+            for row, job in zip(data, jobs)
+            if job.error is None
+        ]
+        try:
+            self.print_journal.write(entries)
+        except OSError as error:
+            backend_logger.error(f"Could not write print journal: {error}")
+
+    def record_metrics(self, data: list[dict[str, str]], jobs: list[PrintJob]):
+        """Record the printed rows for the production report."""
+        timestamp = datetime.datetime.now().replace(microsecond=0)
+        part_number = get_part_number(self.job.file_path)
+        batch_size = self.batch_size_spinbox.value()
+        events = [
+            MetricEvent(
+                timestamp,
+                self.user.initials,
+                self.job.customer_name,
+                part_number,
+                row["Gauge"],
+                row["Type"],
+                job.copies,
+                job.copies * batch_size,
+            )
+            for row, job in zip(data, jobs)
+            if job.error is None
+        ]
+        try:
+            self.metrics.record(events)
+        except OSError as error:
+            backend_logger.error(f"Could not record production metrics: {error}")
 
-            self.print_previous_pushbutton.setEnabled(True)
+    def export_cut_sheet(self):
+        """Export the labels of the whole cut sheet to a CSV, JSON lines or PDF file."""
+        file_path = self.job.file_path
+        if file_path == "":
+            QtWidgets.QMessageBox.warning(
+                self, "No Cut Sheet", "Please select a cut sheet to export."
+            )
+            return
+        dataframe = self.load_cut_sheet(file_path)
+        if dataframe is None:
+            return
+        export_path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self,
+            "Export Labels",
+            os.path.splitext(file_path)[0] + ".pdf",
+            "PDF Files (*.pdf);;CSV Files (*.csv);;JSON Lines Files (*.jsonl)",
+        )
+        if export_path == "":
+            return
 
-            if DISSABLE_LABEL_PRINTING:
-                text = text = ", ".join(
-                    f"{key}: {value}"
-                    for key, value in self.wire_bundle_label.fields.items()
+        labels = export_labels(
+            dataframe[CUT_SHEET_NAME],
+            self.total_cut_qty_spinbox.value(),
+            self.batch_size_spinbox.value(),
+            self.user,
+            self.job.customer_name,
+            get_part_number(file_path),
+            label_fields=self.job.label_fields,
+        )
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            template = self.template_registry.get(self.template_combobox.currentText())
+            count = export(labels, export_path, template=template)
+        except (Error, OSError) as error:
+            backend_logger.exception(error)
+            QtWidgets.QMessageBox.warning(self, "Export Failed", str(error))
+            return
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+        frontend_logger.info(f"Exported {count} label(s) to: {export_path}")
+        self.statusbar.showMessage(f"Exported {count} label(s) to: {export_path}", 5000)
+
+    def export_machine_program(self):
+        """Export the cut sheet as a batch program for a cut and strip machine."""
+        file_path = self.job.file_path
+        if file_path == "":
+            QtWidgets.QMessageBox.warning(
+                self, "No Cut Sheet", "Please select a cut sheet to export."
+            )
+            return
+        dataframe = self.load_cut_sheet(file_path)
+        if dataframe is None:
+            return
+        export_path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self,
+            "Export Machine Program",
+            os.path.splitext(file_path)[0] + ".xml",
+            "XML Files (*.xml);;CSV Files (*.csv)",
+        )
+        if export_path == "":
+            return
+
+        batches = cut_batches(
+            dataframe[CUT_SHEET_NAME],
+            self.total_cut_qty_spinbox.value(),
+            self.batch_size_spinbox.value(),
+            app_settings.program.machine_units,
+            app_settings.program.optimize_cut_order,
+        )
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            count = export_program(batches, export_path)
+        except (Error, OSError, ValueError) as error:
+            backend_logger.exception(error)
+            QtWidgets.QMessageBox.warning(self, "Export Failed", str(error))
+            return
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+        frontend_logger.info(f"Exported {count} batch(es) to: {export_path}")
+        self.statusbar.showMessage(
+            f"Exported {count} batch(es) to: {export_path}", 5000
+        )
+
+    def start_update_download(self):
+        """Download the latest release in the background, to install it the
+        next time the program starts."""
+        updater = Updater(cache_folder=app_settings.program.update_cache_folder)
+        self.update_thread = UpdateThread(updater, self)
+        self.update_thread.progress.connect(self.on_update_progress)
+        self.update_thread.staged.connect(self.on_update_staged)
+        self.update_thread.start()
+
+    def on_update_progress(self, downloaded: int, total: int):
+        percent = downloaded * 100 // total if total else 0
+        self.statusbar.showMessage(f"Downloading update... {percent}%", 2000)
+
+    def on_update_staged(self, version: str):
+        root_logger.info(f"Update {version} will be installed on next start.")
+        self.statusbar.showMessage(
+            f"Update {version} downloaded. It will be installed the next time the program starts."
+        )
+
+    def show_scan_station(self):
+        dialog = ScanStationDialog(self.print_journal, self)
+        dialog.exec()
+
+    def show_production_report(self):
+        dialog = ProductionReportDialog(self.metrics, self)
+        dialog.exec()
+
+    def show_material_report(self):
+        """Show the material report, for the open cut sheets to start with."""
+        self.store_job_view()
+        jobs = []
+        for job in self.jobs():
+            if job.file_path == "":
+                continue
+            dataframe = self.load_cut_sheet(job.file_path)
+            if dataframe is not None:
+                jobs.append(
+                    MaterialJob(
+                        get_file_name(job.file_path),
+                        dataframe[CUT_SHEET_NAME],
+                        job.total_qty,
+                    )
                 )
-                frontend_logger.info(f"Printing label: {text}")
+        dialog = MaterialReportDialog(jobs, self.total_cut_qty_spinbox.value(), self)
+        dialog.exec()
+
+    def show_print_errors(self, failed_jobs: list[PrintJob]) -> bool:
+        """Tell the operator labels failed. Returns True to resubmit them."""
+        frontend_logger.error(
+            f"{len(failed_jobs)} print job(s) failed: {', '.join(job.job_id for job in failed_jobs)}"
+        )
+        answer = QtWidgets.QMessageBox.warning(
+            self,
+            "Print Failed",
+            f"{len(failed_jobs)} label(s) could not be printed: {failed_jobs[0].error}\n"
+            f"Printers in rotation: {', '.join(p.backend.name for p in self.printer_pool.available) or 'None'}\n\n"
+            "Resubmit the labels that failed? Labels already printed are not printed again.",
+            QtWidgets.QMessageBox.Retry | QtWidgets.QMessageBox.Cancel,
+        )
+        return answer == QtWidgets.QMessageBox.Retry
+
+    def job_server_call(self, method, *args) -> bool:
+        """Call the job server. If it can not be reached, printing carries on
+        without it and True is returned."""
+        try:
+            return method(self.job.job_id, *args)
+        except OSError as error:
+            backend_logger.error(f"Could not reach job server: {error}")
+            self.statusbar.showMessage("Job server is not reachable.", 5000)
+            return True
+
+    def claim_rows(
+        self, data: list[dict[str, str]], rows: list[int]
+    ) -> tuple[list[dict[str, str]], list[int]]:
+        """Claim the rows on the job server. Returns only the rows claimed."""
+        if self.job_client is None:
+            return data, rows
+        claimed_data, claimed_rows = [], []
+        for row_data, row in zip(data, rows):
+            if self.job_server_call(self.job_client.claim, row_data["Line"]):
+                claimed_data.append(row_data)
+                claimed_rows.append(row)
             else:
-                self.printer.print(self.wire_bundle_label, copies)
+                frontend_logger.warning(
+                    f"Line {row_data['Line']} is taken by another station."
+                )
+                QtWidgets.QMessageBox.warning(
+                    self,
+                    "Already Taken",
+                    f"Line {row_data['Line']} was already claimed or printed by another station.",
+                )
+        return claimed_data, claimed_rows
+
+    def on_job_event(self, event: dict):
+        if event["job_id"] != self.job.job_id or event.get("station") == self.station:
+            return
+        row = self.tablewidget.find_row(COLUMNS.index("Line"), event.get("line"))
+        if row == -1:
+            return
+        frontend_logger.debug(f"Job server event: {event}")
+        if event["type"] == PRINTED:
+            self.mark_printed(row, event["line"], f"Printed by {event['station']}")
+        elif event["type"] == CLAIMED:
+            self.tablewidget.set_row_status(
+                row, QtGui.QColor("#fff2b0"), f"Claimed by {event['station']}"
+            )
+        else:
+            self.tablewidget.set_row_status(row)
 
     def print_selected(self):
         frontend_logger.info("Printing selected rows.")
-        row_items = (
-            self.tablewidget.selectedItems()
-        )  # Flat list of all the selected items.
-        column_count = self.tablewidget.columnCount()
-        row_count = len(row_items) // column_count
-
-        data = []
-        to_remove = []
-        for row in range(row_count):
-            row_data = {}
-            for column in range(column_count):
-                column_heder = self.tablewidget.horizontalHeaderItem(column).text()
-                row_data[column_heder] = row_items[row * column_count + column].text()
-            to_remove.append(row_items[row * column_count + column].row())
-            data.append(row_data)
-
-        self.print(data)
-
-        if REMOVE_PRINTED_LABELS == "true":
-            frontend_logger.info(f"Removing {len(to_remove)} label(s) from table.")
-            for index in to_remove:
-                frontend_logger.debug(f"Removing row: {index}")
-                self.tablewidget.removeRow(index)
+        data, rows = self.selected_rows()
+        data, _ = self.claim_rows(data, rows)
+        self.print(data, lambda jobs: self.on_selected_printed(data, jobs))
+
+    def on_selected_printed(self, data: list[dict[str, str]], jobs: list[PrintJob]):
+        """Mark the rows printed. Rows are found by their line, as the table
+        can change while the labels print."""
+        printed = [
+            (self.tablewidget.key_row(row_data["Line"]), row_data["Line"])
+            for row_data, job in zip(data, jobs)
+            if job.error is None
+        ]
+
+        if self.job_client is not None:
+            for row_data, job in zip(data, jobs):
+                if job.error is None:
+                    self.job_server_call(self.job_client.mark_printed, row_data["Line"])
+                else:
+                    self.job_server_call(self.job_client.release, row_data["Line"])
+
+        if REMOVE_PRINTED_LABELS:
+            frontend_logger.info(f"Removing {len(printed)} label(s) from table.")
+        # Highest row first, so removing a row does not move the next one.
+        for row, line in sorted(printed, reverse=True):
+            self.mark_printed(row, line, "Printed")
+
+    def mark_printed(self, row: int, line: str, tooltip: str):
+        """Remember a line was printed, and remove or grey out its row, if it
+        is still in the table."""
+        self.job.printed_lines.add(line)
+        self.record_session(SESSION_PRINTED, lines=[line])
+        if row == -1:
+            return
+        if REMOVE_PRINTED_LABELS:
+            frontend_logger.debug(f"Removing row: {row}")
+            self.tablewidget.removeRow(row)
+        else:
+            self.tablewidget.set_row_status(row, QtGui.QColor("#c0c0c0"), tooltip)
+
+    def load_cut_sheet(self, file_path: str) -> dict[str, pandas.DataFrame]:
+        """Get a cut sheet from the cache, reading it again if it changed.
+        Returns None if it can not be read, after telling the user."""
+        try:
+            return self.cut_sheets.get(file_path)
+        except (Error, OSError, ValueError) as error:
+            backend_logger.exception(error)
+            QtWidgets.QMessageBox.warning(
+                self, "Invalid Cut Sheet", f"{file_path}\n{error}"
+            )
+            return None
 
     def reload_table(self):
         frontend_logger.debug("Reloading table.")
-        file_path = self.cut_sheet_file_path_lineedit.text()
+        file_path = self.job.file_path
         if file_path == "":
             return
-        self.dataframe = parse_excel(file_path)
+        dataframe = self.load_cut_sheet(file_path)
+        if dataframe is None:
+            return
 
-        cut_sheet = self.dataframe["Cut Sheet"]
+        cut_sheet = dataframe[CUT_SHEET_NAME]
+        rows = cut_sheet_table_rows(
+            cut_sheet,
+            self.total_cut_qty_spinbox.value(),
+            self.batch_size_spinbox.value(),
+        )
+        row_hashes = {row[0]: row_hash(row) for row in rows}
+
+        if self.job.rows is not None:
+            self.patch_table(rows, row_hashes)
+        else:
+            self.load_rows(rows)
+            frontend_logger.debug(f"Inserted {len(rows)} rows.")
+        self.job.rows = rows
+        self.job.row_hashes = row_hashes
+        self.record_session(
+            LOADED,
+            file_path=file_path,
+            customer_name=self.job.customer_name,
+            template_name=self.template_combobox.currentText(),
+            total_qty=self.total_cut_qty_spinbox.value(),
+            batch_size=self.batch_size_spinbox.value(),
+            rows=rows,
+            printed_lines=sorted(self.job.printed_lines),
+        )
+
+        self.print_selected_pushbutton.setEnabled(True)
+        self.print_single_pushbutton.setEnabled(True)
+        if self.job_client is not None:
+            self.open_shared_job(rows)
+
+    def load_rows(self, rows: list[list[str]], printed_lines: list[str] = ()):
+        """Fill the table with rows. Printed rows are removed or greyed out."""
         self.tablewidget.set_table_headers(COLUMNS)
         self.tablewidget.setRowCount(0)
-
-        for row_index, row in cut_sheet.iterrows():
-            if str(row["Qty"]) == "nan":
-                frontend_logger.debug(
-                    f"Skipping blank row {row_index + 2}."
-                )  # +2 to make the number match the excel row number
+        self.job.printed_lines = set(printed_lines)
+        for row in rows:
+            printed = row[0] in self.job.printed_lines
+            if printed and REMOVE_PRINTED_LABELS:
                 continue
-
-            total_qty = self.total_cut_qty_spinbox.value()
-            batch_size = self.batch_size_spinbox.value()
-            bundles = math.ceil(total_qty / batch_size) * int(row["Qty"])
-
-            self.tablewidget.insert_row_data(
-                [
-                    str(row_index + 1),
-                    str(bundles),
-                    str(int(row["Qty"])),
-                    str(int(row["Gauge"])),
-                    str(row["Type"]),
-                    str(row["Color"]),
-                    str(row["Length"]),
-                    str(row["Left Strip"]),
-                    str(row["Left Gap"]),
-                    str(row["Right Strip"]),
-                    str(row["Right Gap"]),
-                    str(row["Left Terminal"]),
-                    str(row["Right Terminal"]),
-                ]
+            self.tablewidget.insert_row_data(row)
+            if printed:
+                self.tablewidget.set_row_status(
+                    self.tablewidget.rowCount() - 1, QtGui.QColor("#c0c0c0"), "Printed"
+                )
+        self.tablewidget.resize_all_columns(use_cache=True)
+
+    def patch_table(self, rows: list[list[str]], row_hashes: dict[str, str]):
+        """Apply only the changes since the cut sheet was last loaded. Rows
+        that did not change keep their printed status, and only their bundles
+        are updated, if the total qty or batch size changed."""
+        diff = diff_table_rows(self.job.row_hashes, row_hashes)
+        frontend_logger.info(f"Reloaded cut sheet: {diff}")
+        new_rows = {row[0]: row for row in rows}
+        old_bundles = {row[0]: row[1] for row in self.job.rows}
+        rebundled = [
+            line for line in diff.unchanged if old_bundles[line] != new_rows[line][1]
+        ]
+        if not diff.changed and not rebundled:
+            return
+        table = self.tablewidget
+        # The items of the rows, before any line numbers are changed.
+        items = {}  # type: dict[str, QtGui.QStandardItem]
+        for line in [*rebundled, *diff.moved, *diff.updated, *diff.deleted]:
+            row = table.key_row(line)
+            if row != -1:
+                items[line] = table.item(row, COLUMNS.index("Line"))
+        printed_lines = {
+            line for line in diff.unchanged if line in self.job.printed_lines
+        }
+
+        for line in rebundled:
+            if line in items:
+                table.set_row_data(items[line].row(), new_rows[line])
+
+        for old_line, line in diff.moved.items():
+            if old_line in self.job.printed_lines:
+                printed_lines.add(line)
+            if old_line in items:
+                table.set_row_data(items[old_line].row(), new_rows[line])
+
+        to_insert = list(diff.inserted)
+        for line in diff.updated:
+            if line in items:
+                table.set_row_data(items[line].row(), new_rows[line])
+                table.set_row_status(items[line].row())
+            else:  # Printed and removed, it needs cutting again.
+                to_insert.append(line)
+
+        to_remove = [items[line].row() for line in diff.deleted if line in items]
+        for row in sorted(to_remove, reverse=True):
+            table.removeRow(row)
+
+        # Insert each new row after the row of the line before it on the cut
+        # sheet, the rows of the table may not be in line order.
+        positions = {line: index for index, line in enumerate(new_rows)}
+        for line in sorted(to_insert, key=positions.get):
+            row = 0
+            for index in range(positions[line] - 1, -1, -1):
+                previous_row = table.key_row(rows[index][0])
+                if previous_row != -1:
+                    row = previous_row + 1
+                    break
+            table.insert_row_data(new_rows[line], row)
+        self.job.printed_lines = printed_lines
+
+    def open_shared_job(self, rows: list[list[str]]):
+        """Open the job on the job server and show what other stations did."""
+        line_column = COLUMNS.index("Line")
+        try:
+            job = self.job_client.open_job(
+                self.job.job_id, [row[line_column] for row in rows]
             )
+        except OSError as error:
+            backend_logger.error(f"Could not reach job server: {error}")
+            self.statusbar.showMessage("Job server is not reachable.", 5000)
+            return
 
-        self.tablewidget.resizeColumnsToContents()
-        self.print_previous_pushbutton.setEnabled(False)
-        frontend_logger.debug(f"Inserted {len(cut_sheet)} rows.")
+        for bundle in job.get("bundles", []):
+            if bundle["station"] == self.station:
+                continue
+            event_type = bundle["state"]
+            self.on_job_event({"job_id": self.job.job_id, "type": event_type, **bundle})
 
 
 def main():
+    if apply_staged_update():
+        root_logger.info("Closing to install update.")
+        return
     app = QtWidgets.QApplication([])
     window = MainWindow()
     window.show()
-    check_for_updates()
+    if app_settings.program.download_updates:
+        window.start_update_download()
+    else:
+        check_for_updates()
     app.exec_()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Lets the render workers start when frozen.
     root_logger.info("=" * 80)
     root_logger.info(f"Starting application... Version: {VERSION}")
 
@@ -0,0 +1,300 @@
+"""Module to load the user settings once into typed groups.
+
+Every setting is read from the backend (the windows registry through QSettings,
+or an INI file) when the program starts. Reads are served from memory and
+changes are written back together when `save` is called."""
+
+from __future__ import annotations
+import os
+import base64
+import logging
+import platform
+import configparser
+from dataclasses import dataclass, field, fields
+from PyQt5 import QtCore
+
+from settings import *
+from printerpool import LEAST_LOADED
+
+backend_logger = logging.getLogger("backend")
+
+SETTINGS_FILE_ENVIRONMENT_VARIABLE = "WIRE_LABEL_SETTINGS_FILE"
+ROOT_GROUP = "General"  # Settings saved without a group.
+
+
+class SettingsGroup:
+    """Base class for a group of typed settings. Remembers which settings
+    were changed since the last save."""
+
+    group_name = ""
+
+    def __setattr__(self, name: str, value):
+        super().__setattr__(name, value)
+        changed = self.__dict__.get("_changed")
+        if changed is not None and not name.startswith("_"):
+            changed.add(name)
+
+    def track_changes(self):
+        self.__dict__["_changed"] = set()
+
+    def pop_changes(self) -> dict[str, object]:
+        """Get the changed settings, then forget they were changed."""
+        changes = {name: getattr(self, name) for name in self._changed}
+        self._changed.clear()
+        return changes
+
+
+@dataclass
+class GeneralSettings(SettingsGroup):
+    group_name = ROOT_GROUP
+
+    initial_cut_sheet_directory: str = ""
+
+
+@dataclass
+class LoggingSettings(SettingsGroup):
+    group_name = "Logging"
+
+    log_level: int = logging.INFO
+    max_log_count: int = 3
+    max_log_size_mb: int = 5
+
+
+@dataclass
+class ProgramSettings(SettingsGroup):
+    group_name = "Program"
+
+    max_label_count: int = 100
+    remove_printed_labels: bool = True
+    debug: bool = False
+    disable_label_printing: bool = False
+    job_server_url: str = ""  # IE. http://localhost:8765, blank to disable.
+    download_updates: bool = True  # Otherwise open the release page.
+    update_cache_folder: str = ""  # IE. \\server\updates, shared by every PC.
+    machine_units: str = "mm"  # Units of machine programs, mm or in.
+    optimize_cut_order: bool = False  # Cut the same wire one after the other.
+    render_workers: int = 0  # Label rendering processes, 0 for one per CPU.
+    print_retries: int = PRINT_RETRIES  # Retries of labels no printer could print.
+
+
+@dataclass
+class UserSettings(SettingsGroup):
+    group_name = "User"
+
+    first_name: str = ""
+    last_name: str = ""
+
+
+@dataclass
+class MainWindowSettings(SettingsGroup):
+    group_name = "MainWindow"
+
+    geometry: bytes = b""
+    selected_printer_name: str = ""
+    pool_printer_names: list = field(default_factory=list)
+    pool_scheduler: str = LEAST_LOADED
+
+
+class SettingsDict(dict):
+    """A group of settings with user defined keys, such as one per customer."""
+
+    def __init__(self, group_name: str):
+        super().__init__()
+        self.group_name = group_name
+        self._changed = None  # type: set[str]
+
+    def __setitem__(self, key: str, value):
+        super().__setitem__(key, value)
+        if self._changed is not None:
+            self._changed.add(key)
+
+    def track_changes(self):
+        self._changed = set()
+
+    def pop_changes(self) -> dict[str, object]:
+        changes = {key: self[key] for key in self._changed if key in self}
+        self._changed.clear()
+        return changes
+
+
+def to_type(value, type_name: str):
+    """Convert a value read from a settings backend to a setting's type.
+    QSettings returns most values as strings, IE. booleans as "true"."""
+    if type_name == "bool":
+        if isinstance(value, str):
+            return value.lower() in ("true", "1", "yes")
+        return bool(value)
+    if type_name == "int":
+        return int(value)
+    if type_name == "list":
+        if value is None or value == "":
+            return []
+        if isinstance(value, str):
+            return [item for item in value.split(",") if item]
+        return list(value)
+    if type_name == "bytes":
+        if isinstance(value, str):
+            return base64.b64decode(value)
+        return bytes(value)
+    return "" if value is None else str(value)
+
+
+class SettingsBackend:
+    """Base class for where settings are stored."""
+
+    def load(self) -> dict[str, dict[str, object]]:
+        """Read every setting. Returns {group_name: {name: value}}."""
+        raise NotImplementedError
+
+    def save(self, changes: dict[str, dict[str, object]]):
+        """Write the changed settings. Takes {group_name: {name: value}}."""
+        raise NotImplementedError
+
+
+class QSettingsBackend(SettingsBackend):
+    """Settings saved to the windows registry."""
+
+    def __init__(self):
+        self.settings = QtCore.QSettings(COMPANY_NAME, PROGRAM_NAME)
+
+    def load(self) -> dict[str, dict[str, object]]:
+        values = {}
+        for key in self.settings.allKeys():
+            group_name, _, name = key.rpartition("/")
+            value = self.settings.value(key)
+            if isinstance(value, QtCore.QByteArray):
+                value = bytes(value)
+            values.setdefault(group_name or ROOT_GROUP, {})[name] = value
+        return values
+
+    def save(self, changes: dict[str, dict[str, object]]):
+        for group_name, values in changes.items():
+            prefix = "" if group_name == ROOT_GROUP else f"{group_name}/"
+            for name, value in values.items():
+                if isinstance(value, bytes):
+                    value = QtCore.QByteArray(value)
+                self.settings.setValue(prefix + name, value)
+        self.settings.sync()
+
+
+class IniSettingsBackend(SettingsBackend):
+    """Settings saved to an INI file, for running without the registry."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.parser = configparser.ConfigParser(interpolation=None)
+        self.parser.optionxform = str  # Keep the case of setting names.
+
+    def load(self) -> dict[str, dict[str, object]]:
+        self.parser.read(self.file_path, encoding="utf-8")
+        return {
+            section: dict(self.parser.items(section))
+            for section in self.parser.sections()
+        }
+
+    def save(self, changes: dict[str, dict[str, object]]):
+        for group_name, values in changes.items():
+            if not self.parser.has_section(group_name):
+                self.parser.add_section(group_name)
+            for name, value in values.items():
+                if isinstance(value, bytes):
+                    value = base64.b64encode(value).decode("ascii")
+                elif isinstance(value, (list, tuple)):
+                    value = ",".join(value)
+                elif isinstance(value, bool):
+                    value = "true" if value else "false"
+                self.parser.set(group_name, name, str(value))
+
+        temp_file_path = f"{self.file_path}.tmp"
+        with open(temp_file_path, "w", encoding="utf-8") as file:
+            self.parser.write(file)
+        os.replace(temp_file_path, self.file_path)
+
+
+def default_backend() -> SettingsBackend:
+    """Use the registry on windows, otherwise an INI file. The environment
+    variable WIRE_LABEL_SETTINGS_FILE forces an INI file."""
+    file_path = os.environ.get(SETTINGS_FILE_ENVIRONMENT_VARIABLE)
+    if file_path:
+        return IniSettingsBackend(file_path)
+    if platform.system() != "Windows":
+        return IniSettingsBackend(SETTINGS_INI_FILE)
+    return QSettingsBackend()
+
+
+class AppSettings:
+    """Typed snapshot of every setting."""
+
+    def __init__(self, backend: SettingsBackend = None):
+        self.backend = backend or default_backend()
+        self.general = GeneralSettings()
+        self.logging = LoggingSettings()
+        self.program = ProgramSettings()
+        self.user = UserSettings()
+        self.main_window = MainWindowSettings()
+        self.templates = SettingsDict("Templates")  # customer_name: template_name
+        self.network_printers = SettingsDict("NetworkPrinters")  # name: host:port
+        self.column_widths = SettingsDict("ColumnWidths")  # schema: widths json
+        self.reel_lengths = SettingsDict("ReelLengths")  # gauge: feet
+        # customer or template name: json of field name: formula
+        self.label_formulas = SettingsDict("LabelFormulas")
+
+    @property
+    def groups(self) -> list[SettingsGroup]:
+        return [self.general, self.logging, self.program, self.user, self.main_window]
+
+    @property
+    def dicts(self) -> list[SettingsDict]:
+        return [
+            self.templates,
+            self.network_printers,
+            self.column_widths,
+            self.reel_lengths,
+            self.label_formulas,
+        ]
+
+    def load(self) -> AppSettings:
+        """Read every setting from the backend. Settings that are not saved
+        yet keep their default value, and are saved on the next save."""
+        values = self.backend.load()
+        for group in self.groups:
+            group_values = values.get(group.group_name, {})
+            missing = []
+            for setting in fields(group):
+                if setting.name not in group_values:
+                    missing.append(setting.name)
+                    continue
+                try:
+                    value = to_type(group_values[setting.name], setting.type)
+                except (TypeError, ValueError):
+                    backend_logger.error(
+                        f"Invalid value for setting {group.group_name}/{setting.name}: {group_values[setting.name]}"
+                    )
+                    missing.append(setting.name)
+                    continue
+                object.__setattr__(group, setting.name, value)
+            group.track_changes()
+            group._changed.update(missing)
+
+        for settings_dict in self.dicts:
+            dict.clear(settings_dict)
+            for name, value in values.get(settings_dict.group_name, {}).items():
+                dict.__setitem__(settings_dict, name, to_type(value, "str"))
+            settings_dict.track_changes()
+        return self
+
+    @property
+    def has_changes(self) -> bool:
+        return any(group._changed for group in self.groups + self.dicts)
+
+    def save(self):
+        """Write every changed setting to the backend in one batch."""
+        changes = {}
+        for group in self.groups + self.dicts:
+            group_changes = group.pop_changes()
+            if group_changes:
+                changes[group.group_name] = group_changes
+        if not changes:
+            return
+        backend_logger.debug(f"Saving settings: {list(changes)}")
+        self.backend.save(changes)
@@ -0,0 +1,119 @@
+"""Module to generate QR code matrices for rendered labels.
+The Dymo software encodes barcodes itself, this is only needed when
+a label is drawn by this program (previews, exports, raster printers).
+
+Encoding is most of the time it takes to draw a label. The payloads of a batch
+repeat, only the timestamp changes and only once a minute, so encoded matrices
+are kept in a least recently used cache."""
+
+from __future__ import annotations
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import qrcode
+except ImportError:  # Optional, previews fall back to a placeholder.
+    qrcode = None
+
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+# Dymo <ECLevel> values to qrcode error correction levels.
+ERROR_CORRECTION_LEVELS = {0: "L", 1: "M", 2: "Q", 3: "H"}
+
+# Rows of modules, True is a dark module.
+Matrix = tuple[tuple[bool, ...], ...]
+
+
+def is_available() -> bool:
+    """Check if QR code generation is available."""
+    return qrcode is not None
+
+
+def encode(payload: str, error_correction: int = 0) -> Matrix:
+    """Encode a payload as a QR code, without the cache. Returns None if the
+    qrcode package is not installed."""
+    if qrcode is None:
+        return None
+    level = ERROR_CORRECTION_LEVELS.get(error_correction, "L")
+    qr = qrcode.QRCode(
+        error_correction=getattr(qrcode.constants, f"ERROR_CORRECT_{level}"),
+        border=0,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+
+class QRCodeCache:
+    """Least recently used cache of encoded QR codes, keyed by payload and
+    error correction level. Safe to use from several threads."""
+
+    def __init__(self, max_size: int = QR_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._matrices = OrderedDict()  # type: OrderedDict[tuple[str, int], Matrix]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._matrices)
+
+    def get(self, payload: str, error_correction: int = 0) -> Matrix:
+        """Get the QR code, encoding it only if it is not cached."""
+        key = (payload, error_correction)
+        with self._lock:
+            matrix = self._matrices.get(key)
+            if matrix is not None:
+                self.hits += 1
+                self._matrices.move_to_end(key)
+                return matrix
+            self.misses += 1
+
+        # Encoded without the lock, so other threads are not held up.
+        matrix = encode(payload, error_correction)
+        if matrix is not None:
+            with self._lock:
+                self._matrices[key] = matrix
+                if len(self._matrices) > self.max_size:
+                    self._matrices.popitem(last=False)
+        return matrix
+
+    def get_many(self, payloads: list[str], error_correction: int = 0) -> list[Matrix]:
+        """Get the QR codes of a batch of payloads, in the same order. Each
+        distinct payload is looked up and encoded once, however many times it
+        repeats in the batch."""
+        matrices = {
+            payload: self.get(payload, error_correction)
+            for payload in dict.fromkeys(payloads)
+        }
+        return [matrices[payload] for payload in payloads]
+
+    def clear(self):
+        with self._lock:
+            self._matrices.clear()
+
+
+default_qr_cache = QRCodeCache()
+
+
+def qr_matrix(payload: str, error_correction: int = 0) -> Matrix:
+    """Encode a payload as a QR code.
+
+    Args:
+        payload (str): The text to encode.
+        error_correction (int, optional): Dymo ECLevel (0-3). Defaults to 0.
+
+    Returns:
+        Matrix: Rows of modules, True is a dark module. The same matrix is
+            returned for the same payload. Returns None if the qrcode package
+            is not installed.
+    """
+    return default_qr_cache.get(payload, error_correction)
+
+
+def qr_matrices(payloads: list[str], error_correction: int = 0) -> list[Matrix]:
+    """Encode a batch of payloads as QR codes, each distinct payload once."""
+    return default_qr_cache.get_many(payloads, error_correction)
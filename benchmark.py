@@ -0,0 +1,356 @@
+"""Print throughput benchmark.
+
+Drives a synthetic cut sheet through the same steps as the GUI: parse the
+excel file, calculate the bundles for the wire table, build the label fields
+for each row and print them through DymoLabelPrinter. The Dymo COM objects are
+replaced by a fake that sleeps for a fixed time on every call, so this runs
+anywhere, including on Linux.
+
+    python benchmark.py --rows 100 1000 10000 --latency-ms 0.1 --json bench.json
+
+With --printer-speed, the labels are instead printed to simulated printers of
+each speed, in labels per second, in simulated time. Sending a job per label
+is compared with the adaptive batches sized from the printer's measured speed.
+
+    python benchmark.py --rows 300 --printer-speed 1 5
+
+With --network, the labels are rendered and sent as ZPL to a stub network
+printer on a local TCP port, which counts the labels it receives.
+
+    python benchmark.py --rows 100 1000 --network
+
+With --fail-after-bytes, the connection to the stub printer fails part way
+through a write, to check that no label is printed twice or lost.
+
+    python benchmark.py --rows 100 --network --fail-after-bytes 500000 0 300
+"""
+
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+try:
+    import win32com.client
+except ImportError:  # Not on Windows, the fake engine is used either way.
+    win32com = types.ModuleType("win32com")
+    win32com.client = types.ModuleType("win32com.client")
+    win32com.client.Dispatch = None
+    sys.modules["win32com"] = win32com
+    sys.modules["win32com.client"] = win32com.client
+
+import pandas
+from PyQt5 import QtGui
+
+from excelparser import parse_cut_sheet, cut_sheet_table_rows, TABLE_COLUMNS
+from fakeprinter import (
+    FakeDymoEngine,
+    FaultyConnectionPool,
+    SimulatedClock,
+    SimulatedPrinter,
+    ZplPrinterServer,
+)
+from fieldformulas import compile_field_formulas, job_values
+from label import Label
+from networkprinter import ConnectionPool, NetworkLabelPrinter
+from printer import DymoLabelPrinter
+from printbatcher import AdaptiveBatcher
+from printerpool import PrinterPool, DymoPrinterBackend, PrintJob, label_print_jobs
+from settings import *
+from templateregistry import TemplateRegistry
+from utilities import User
+
+LABEL_FILE = os.path.join(TEMPLATE_FOLDER, f"{DEFAULT_LABEL_TEMPLATE}.label")
+GAUGES = [10, 12, 14, 16, 18, 20, 22]
+TYPES = ["GPT", "GXL", "TXL", "SXL"]
+COLORS = ["BLACK", "RED", "BLUE", "WHITE", "GREEN/BLACK", "BLUE/BLACK"]
+TERMINALS = ["SPLICE", "14/16 AMPHENOL SOCKET", "RING 1/4", "BUTT", "FLAG"]
+
+
+def write_cut_sheet(file_path: str, rows: int, seed: int = 0):
+    """Write a synthetic cut sheet excel file."""
+    generator = random.Random(seed)
+    data = {
+        "Qty": [generator.randint(1, 4) for _ in range(rows)],
+        "Gauge": [generator.choice(GAUGES) for _ in range(rows)],
+        "Type": [generator.choice(TYPES) for _ in range(rows)],
+        "Color": [generator.choice(COLORS) for _ in range(rows)],
+        "Length": [f'{generator.randint(6, 120)}"' for _ in range(rows)],
+        "Left Strip": [generator.choice([0.25, 0.5]) for _ in range(rows)],
+        "Left Gap": [generator.choice([0, 0.125]) for _ in range(rows)],
+        "Right Strip": [generator.choice([0.25, 0.5]) for _ in range(rows)],
+        "Right Gap": [generator.choice([0, 0.125]) for _ in range(rows)],
+        "Left Terminal": [generator.choice(TERMINALS) for _ in range(rows)],
+        "Right Terminal": [generator.choice(TERMINALS) for _ in range(rows)],
+    }
+    pandas.DataFrame(data).to_excel(file_path, sheet_name=CUT_SHEET_NAME, index=False)
+
+
+def run(file_path: str, latency: float, total_qty: int, batch_size: int) -> dict:
+    """Run the print path once. Returns the timings and counters."""
+    engine = FakeDymoEngine(latency=latency)
+    printer = DymoLabelPrinter(engine, engine)
+    pool = PrinterPool([DymoPrinterBackend(printer, engine.printers[0])])
+    user = User("Bench", "Mark")
+    timings = {}
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    dataframe = parse_cut_sheet(file_path)
+    timings["parse_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows = cut_sheet_table_rows(dataframe[CUT_SHEET_NAME], total_qty, batch_size)
+    timings["bundles_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    label_fields = compile_field_formulas(
+        DEFAULT_FIELD_FORMULAS, job_values(user, "Customer", "PN-1")
+    )
+    data = [dict(zip(TABLE_COLUMNS, row)) for row in rows]
+    jobs = label_print_jobs(LABEL_FILE, data, label_fields, "now")
+    timings["compose_s"] = time.perf_counter() - start
+
+    calls_before = engine.call_count
+    start = time.perf_counter()
+    result = pool.print_batch(jobs)
+    timings["print_s"] = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    labels = sum(job.copies for job in result.printed)
+    total = sum(timings.values())
+    return {
+        "rows": len(rows),
+        "labels": labels,
+        **{key: round(value, 4) for key, value in timings.items()},
+        "total_s": round(total, 4),
+        "labels_per_s": round(labels / total, 1) if total else 0,
+        "print_labels_per_s": (
+            round(labels / timings["print_s"], 1) if timings["print_s"] else 0
+        ),
+        "com_calls_per_label": (
+            round((engine.call_count - calls_before) / labels, 2) if labels else 0
+        ),
+        "com_calls": dict(engine.calls),
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def run_network(
+    file_path: str, total_qty: int, batch_size: int, fail_after_bytes: list[int] = ()
+) -> dict:
+    """Print the cut sheet to a stub network printer. Returns the labels sent
+    and received, and the rate they were received from the start of printing.
+
+    Args:
+        fail_after_bytes (list[int]): Bytes each connection to the printer
+            writes before it fails, see FaultyConnectionPool.
+    """
+    server = ZplPrinterServer().start()
+    connection_pool = (
+        FaultyConnectionPool(fail_after_bytes) if fail_after_bytes else ConnectionPool()
+    )
+    printer = NetworkLabelPrinter(
+        "Stub Printer",
+        *server.address,
+        TemplateRegistry(TEMPLATE_FOLDER),
+        connection_pool=connection_pool,
+    )
+    # The stub is back at once, there is no need to wait before a retry.
+    pool = PrinterPool([printer], retry_delay=0.0)
+    dataframe = parse_cut_sheet(file_path)
+    rows = cut_sheet_table_rows(dataframe[CUT_SHEET_NAME], total_qty, batch_size)
+    label_fields = compile_field_formulas(
+        DEFAULT_FIELD_FORMULAS, job_values(User("Bench", "Mark"), "Customer", "PN-1")
+    )
+    data = [dict(zip(TABLE_COLUMNS, row)) for row in rows]
+    jobs = label_print_jobs(LABEL_FILE, data, label_fields, "now")
+
+    start = time.perf_counter()
+    result = pool.print_batch(jobs)
+    sent_s = time.perf_counter() - start
+    labels = sum(job.copies for job in result.printed)
+    server.wait_for_labels(labels)
+    total_s = (server.last_at or start) - start
+    connection_pool.close()
+    server.close()
+    return {
+        "rows": len(rows),
+        "labels": labels,
+        "failed": sum(job.copies for job in result.failed),
+        "received": server.labels,
+        "duplicates": server.duplicates,
+        "cut_off": server.cut_off,
+        "sent_s": round(sent_s, 4),
+        "megabytes": round(server.bytes_received / 1024 / 1024, 2),
+        "total_s": round(total_s, 4),
+        "labels_per_s": round(server.labels / total_s, 1) if total_s else 0,
+        "receive_labels_per_s": _round(server.labels_per_second, 1),
+    }
+
+
+def _round(value: float, digits: int) -> float:
+    return None if value is None else round(value, digits)
+
+
+def main_network(args) -> list[dict]:
+    # Labels can not be drawn without an application.
+    if sys.platform != "win32":
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    application = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication(sys.argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in args.rows:
+            file_path = os.path.join(folder, f"PN-{rows} Benchmark.xlsx")
+            write_cut_sheet(file_path, rows)
+            result = run_network(
+                file_path, args.total_qty, args.batch_size, args.fail_after_bytes
+            )
+            results.append(result)
+            print(
+                f"{result['rows']:>6} rows | {result['labels_per_s']:>9} labels/s | "
+                f"{result['received']} of {result['labels']} labels received, "
+                f"{result['duplicates']} duplicate(s), {result['failed']} failed, "
+                f"{result['cut_off']} cut off | "
+                f"{result['megabytes']} MB in {result['sent_s']:.3f}s"
+            )
+    return results
+
+
+def network_ok(results: list[dict]) -> bool:
+    """True if every label printed reached the stub printer exactly once."""
+    return all(
+        not result["duplicates"] and result["received"] == result["labels"]
+        for result in results
+    )
+
+
+def run_simulated(
+    labels_per_second: float, rows: int, adaptive: bool, seed: int = 0
+) -> dict:
+    """Print to a simulated printer, one job per label or in adaptive batches.
+    Returns the simulated timings and what was learned about the printer."""
+    clock = SimulatedClock()
+    printer = SimulatedPrinter(labels_per_second=labels_per_second, clock=clock)
+    batchers = {}
+    if not adaptive:
+        batchers[printer.name] = AdaptiveBatcher(
+            printer.name,
+            max_batch_labels=1,
+            max_queue_seconds=float("inf"),
+            clock=clock.now,
+            sleep=clock.sleep,
+        )
+    pool = PrinterPool([printer], sleep=clock.sleep, clock=clock.now, batchers=batchers)
+    generator = random.Random(seed)
+    jobs = [PrintJob(Label(LABEL_FILE), generator.randint(1, 4)) for _ in range(rows)]
+
+    pool.print_batch(jobs)
+    sent_s = clock.now()
+    total_s = printer.finish()
+    labels = sum(job.copies for job in jobs)
+    return {
+        "labels_per_second": labels_per_second,
+        "adaptive": adaptive,
+        "labels": labels,
+        "jobs": printer.jobs,
+        "total_s": round(total_s, 1),
+        "printing_s": round(labels / labels_per_second, 1),
+        "sent_s": round(sent_s, 1),
+        "max_queued": printer.max_queued,
+        "utilization": round(printer.utilization, 3),
+        "learned": pool.diagnostics()[0],
+    }
+
+
+def main_simulated(args) -> list[dict]:
+    results = []
+    for labels_per_second in args.printer_speed:
+        for adaptive in (False, True):
+            result = run_simulated(labels_per_second, args.rows[0], adaptive)
+            results.append(result)
+            print(
+                f"{labels_per_second:>5g} labels/s {'adaptive' if adaptive else 'per label':>9} | "
+                f"{result['labels']} labels in {result['jobs']:>4} jobs | "
+                f"done {result['total_s']:>7}s (printing {result['printing_s']}s) | "
+                f"max queued {result['max_queued']:>4} | "
+                f"learned {result['learned']['Labels/s']} labels/s, batch {result['learned']['Batch']}"
+            )
+    return results
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument(
+        "--latency-ms", type=float, default=0.1, help="Delay for every COM call."
+    )
+    parser.add_argument("--total-qty", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument(
+        "--printer-speed",
+        type=float,
+        nargs="+",
+        help="Print to simulated printers of these labels per second instead.",
+    )
+    parser.add_argument(
+        "--network",
+        action="store_true",
+        help="Print as ZPL to a stub network printer on a local port instead.",
+    )
+    parser.add_argument(
+        "--fail-after-bytes",
+        type=int,
+        nargs="+",
+        default=[],
+        help="With --network, bytes each connection writes before it fails.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.printer_speed or args.network:
+        results = main_simulated(args) if args.printer_speed else main_network(args)
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump({"results": results}, file, indent=4)
+        if args.network and not network_ok(results):
+            print("Labels were printed twice or lost.")
+            return 1
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in args.rows:
+            file_path = os.path.join(folder, f"PN-{rows} Benchmark.xlsx")
+            write_cut_sheet(file_path, rows)
+            result = run(
+                file_path, args.latency_ms / 1000, args.total_qty, args.batch_size
+            )
+            results.append(result)
+            print(
+                f"{result['rows']:>6} rows | {result['labels_per_s']:>9} labels/s "
+                f"(print {result['print_labels_per_s']:>9}) | "
+                f"{result['com_calls_per_label']:>5} COM calls/label | "
+                f"parse {result['parse_s']:.3f}s bundles {result['bundles_s']:.3f}s "
+                f"compose {result['compose_s']:.3f}s print {result['print_s']:.3f}s | "
+                f"peak {result['peak_memory_mb']} MB"
+            )
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(
+                {"latency_ms": args.latency_ms, "results": results}, file, indent=4
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
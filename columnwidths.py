@@ -0,0 +1,79 @@
+"""Module to size table columns without measuring every cell.
+
+Column widths are estimated from the header, an evenly spaced sample of rows
+and the longest text in each column. Widths are cached per set of column
+headers (the schema), along with the longest text length they were measured
+for, so a table with the same columns and no longer text is sized without
+measuring anything."""
+
+from __future__ import annotations
+import json
+import hashlib
+import logging
+from typing import MutableMapping
+from PyQt5 import QtGui
+
+backend_logger = logging.getLogger("backend")
+
+DEFAULT_SAMPLE_SIZE = 100  # Rows measured per column.
+CELL_PADDING = 12  # Pixels, for the cell margins and grid line.
+HEADER_PADDING = 24  # Pixels, for the header margins and sort indicator.
+MAX_COLUMN_WIDTH = 600
+
+
+def schema_key(headers: list[str]) -> str:
+    """Short key for a set of column headers."""
+    return hashlib.sha1("\x1f".join(headers).encode("utf-8")).hexdigest()[:16]
+
+
+def sample_rows(row_count: int, sample_size: int = DEFAULT_SAMPLE_SIZE) -> list[int]:
+    """Evenly spaced row numbers, at most sample_size of them."""
+    if row_count <= sample_size:
+        return list(range(row_count))
+    step = row_count / sample_size
+    return [int(index * step) for index in range(sample_size)]
+
+
+def estimate_width(
+    font_metrics: QtGui.QFontMetrics,
+    header_font_metrics: QtGui.QFontMetrics,
+    header: str,
+    texts: list[str],
+) -> int:
+    """Width in pixels to fit the header and the given cell texts."""
+    width = header_font_metrics.horizontalAdvance(header) + HEADER_PADDING
+    for text in texts:
+        width = max(width, font_metrics.horizontalAdvance(text) + CELL_PADDING)
+    return min(width, MAX_COLUMN_WIDTH)
+
+
+class ColumnWidthCache:
+    """Column widths saved per schema, in a settings group.
+
+    Each value is JSON: {"widths": [...], "lengths": [...]}, where lengths are
+    the longest text lengths, in characters, the widths were measured for."""
+
+    def __init__(self, settings: MutableMapping[str, str]):
+        self.settings = settings
+
+    def get(self, headers: list[str], lengths: list[int]) -> list[int]:
+        """Get the cached widths, if they fit text of the given lengths."""
+        value = self.settings.get(schema_key(headers))
+        if not value:
+            return None
+        try:
+            cached = json.loads(value)
+            widths, cached_lengths = cached["widths"], cached["lengths"]
+        except (ValueError, KeyError, TypeError):
+            backend_logger.warning(f"Invalid cached column widths: {value}")
+            return None
+        if len(widths) != len(headers) or len(cached_lengths) != len(lengths):
+            return None
+        if any(length > cached for length, cached in zip(lengths, cached_lengths)):
+            return None
+        return widths
+
+    def set(self, headers: list[str], widths: list[int], lengths: list[int]):
+        self.settings[schema_key(headers)] = json.dumps(
+            {"widths": widths, "lengths": lengths}
+        )
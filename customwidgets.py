@@ -1,12 +1,63 @@
 from __future__ import annotations
+import os
+import math
 from PyQt5 import QtCore, QtGui, QtWidgets
 
+from label import LabelTemplate
+from labelrenderer import LabelRenderer, RenderCache
+from columnwidths import estimate_width, sample_rows
+from tableexport import format_table, CSV, TSV, HTML, FILE_EXTENSIONS
+
+
+SORT_ROLE = QtCore.Qt.UserRole + 1
+
+
+def sort_key(text: str):
+    """Typed sort key for a cell, worked out once when the cell is set.
+    Numbers, IE. 8, 0.125 or 46 1/2", sort by value, anything else by text."""
+    value = text.strip().rstrip('"').strip()
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+        whole, _, fraction = value.rpartition(" ")
+        numerator, slash, denominator = fraction.partition("/")
+        if slash:
+            try:
+                number = float(whole or 0) + float(numerator) / float(denominator)
+            except (ValueError, ZeroDivisionError):
+                pass
+    if number is None or not math.isfinite(number):
+        return text.casefold()
+    return number
+
+
+class CustomQTableWidget(QtWidgets.QTableView):
+    """Table of rows of text. Rows are stored in a model and shown through a
+    sort and filter proxy, so sorting and filtering run in Qt. Row numbers
+    passed to and returned from this class are model rows, which do not
+    change when the table is sorted or filtered."""
 
-class CustomQTableWidget(QtWidgets.QTableWidget):
     column_visibility_changed = QtCore.pyqtSignal(int, bool)
+    itemSelectionChanged = QtCore.pyqtSignal()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.source_model = QtGui.QStandardItemModel(self)
+        self.proxy_model = QtCore.QSortFilterProxyModel(self)
+        self.proxy_model.setSourceModel(self.source_model)
+        self.proxy_model.setSortRole(SORT_ROLE)
+        self.proxy_model.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        self.proxy_model.setFilterKeyColumn(-1)
+        self.setModel(self.proxy_model)
+        self.column_width_cache = None  # type: ColumnWidthCache
+        self._longest_text = []  # type: list[str]  # Per column.
+        self.key_column = None  # type: int # Rows are found by their text in it.
+        self._key_items = {}  # type: dict[str, QtGui.QStandardItem]
+        self.selectionModel().selectionChanged.connect(
+            lambda selected, deselected: self.itemSelectionChanged.emit()
+        )
+
         self.header_context_menu = self.set_header_context_menu()
 
         self.mouse_over_column = -1  # -1 means no column is currently being hovered over
@@ -24,7 +75,9 @@ class CustomQTableWidget(QtWidgets.QTableWidget):
             self.show_header_context_menu)
         self.horizontalHeader().setDefaultSectionSize(75)
         self.horizontalHeader().setSortIndicatorShown(True)
-        self.horizontalHeader().sortIndicatorChanged.connect(self.sort_table)
+        # Start in the order rows were added, until a header is clicked.
+        self.horizontalHeader().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+        self.setSortingEnabled(True)
         self.horizontalHeader().setStretchLastSection(True)
         self.verticalHeader().setVisible(False)
         self.verticalHeader().setStretchLastSection(False)
@@ -34,23 +87,177 @@ class CustomQTableWidget(QtWidgets.QTableWidget):
         font.setBold(True)
         self.horizontalHeader().setFont(font)
 
-    def insert_row_data(self, data: list[str]):
+    def rowCount(self) -> int:
+        return self.source_model.rowCount()
+
+    def columnCount(self) -> int:
+        return self.source_model.columnCount()
+
+    def setRowCount(self, count: int):
+        for row in range(count, self.rowCount()):
+            self._forget_key(row)
+        self.source_model.setRowCount(count)
+        if count == 0:
+            self._longest_text = [""] * self.columnCount()
+
+    def set_key_column(self, column: int):
+        """Keep an index of the rows by their text in a column, IE. a line
+        number, kept up to date as rows change so finding a row is quick."""
+        self.key_column = column
+        self._key_items = {}
+        for row in range(self.rowCount()):
+            item = self.item(row, column)
+            if item is not None:
+                self._key_items[item.text()] = item
+
+    def key_row(self, text: str) -> int:
+        """Get the row with the text in the key column. Returns -1 if not found."""
+        item = self._key_items.get(text)
+        return -1 if item is None else item.row()
+
+    def _forget_key(self, row: int):
+        if self.key_column is None:
+            return
+        item = self.item(row, self.key_column)
+        if item is not None and self._key_items.get(item.text()) is item:
+            del self._key_items[item.text()]
+
+    def setColumnCount(self, count: int):
+        self.source_model.setColumnCount(count)
+        self._longest_text = [""] * count
+
+    def _track_longest_text(self, column: int, text: str):
+        if len(text) > len(self._longest_text[column]):
+            self._longest_text[column] = text
+
+    def item(self, row: int, column: int) -> QtGui.QStandardItem:
+        return self.source_model.item(row, column)
+
+    def horizontalHeaderItem(self, column: int) -> QtGui.QStandardItem:
+        return self.source_model.horizontalHeaderItem(column)
+
+    def removeRow(self, row: int):
+        self._forget_key(row)
+        self.source_model.removeRow(row)
+
+    @staticmethod
+    def _new_item(text: str) -> QtGui.QStandardItem:
+        item = QtGui.QStandardItem(text)
+        item.setData(sort_key(text), SORT_ROLE)
+        item.setEditable(False)
+        return item
+
+    def insert_row_data(self, data: list[str], row: int = None):
+        """Insert a row, at the end of the table if no row is given."""
         column_count = self.columnCount()
         assert len(data) == column_count
 
-        row_count = self.rowCount()
-        self.insertRow(row_count)
+        if row is None:
+            row = self.rowCount()
+        items = [self._new_item(text) for text in data]
+        self.source_model.insertRow(row, items)
+        if self.key_column is not None:
+            self._key_items[data[self.key_column]] = items[self.key_column]
+        for column, text in enumerate(data):
+            self._track_longest_text(column, text)
+
+    def set_row_data(self, row: int, data: list[str]):
+        """Replace the text of a row, only touching the cells that changed."""
+        if self.key_column is not None:
+            self._forget_key(row)
         for column, text in enumerate(data):
-            item = QtWidgets.QTableWidgetItem(text)
-            self.setItem(row_count, column, item)
+            self._track_longest_text(column, text)
+            item = self.item(row, column)
+            if item is None:
+                item = self._new_item(text)
+                self.source_model.setItem(row, column, item)
+            elif item.text() != text:
+                item.setText(text)
+                item.setData(sort_key(text), SORT_ROLE)
+            if column == self.key_column:
+                self._key_items[text] = item
+
+    def row_values(self, row: int) -> list[str]:
+        values = []
+        for column in range(self.columnCount()):
+            item = self.item(row, column)
+            values.append("" if item is None else item.text())
+        return values
+
+    def row_index(self, column: int) -> dict[str, int]:
+        """Map the text in a column to its row."""
+        index = {}
+        for row in range(self.rowCount()):
+            item = self.item(row, column)
+            if item is not None:
+                index[item.text()] = row
+        return index
+
+    def find_row(self, column: int, text: str) -> int:
+        """Get the first row with the text in a column. Returns -1 if not found."""
+        if column == self.key_column:
+            return self.key_row(text)
+        for row in range(self.rowCount()):
+            item = self.item(row, column)
+            if item is not None and item.text() == text:
+                return row
+        return -1
+
+    def set_row_status(self, row: int, color: QtGui.QColor = None, tooltip: str = ""):
+        """Highlight a row, or clear the highlight when no color is given."""
+        brush = QtGui.QBrush(color) if color is not None else QtGui.QBrush()
+        for column in range(self.columnCount()):
+            item = self.item(row, column)
+            if item is None:
+                continue
+            item.setBackground(brush)
+            item.setToolTip(tooltip)
 
     def set_table_headers(self, headers: list[str]):
         self.setColumnCount(len(headers))
-        self.setHorizontalHeaderLabels(headers)
+        self.source_model.setHorizontalHeaderLabels(headers)
         self.header_context_menu = self.set_header_context_menu()
 
-    def sort_table(self, column: int, order):
-        self.sortItems(column, order)
+    def set_filter(self, text: str, column: int = -1, exact: bool = False):
+        """Only show rows containing the text, in a column or any column.
+
+        Args:
+            text (str): The text to find, ignoring case. Blank shows every row.
+            column (int, optional): The column to search. Defaults to all.
+            exact (bool, optional): Match the whole cell, IE. gauge 1 does
+                not match 16. Defaults to False.
+        """
+        self.proxy_model.setFilterKeyColumn(column)
+        if exact and text:
+            pattern = QtCore.QRegularExpression.escape(text)
+            self.proxy_model.setFilterRegularExpression(
+                QtCore.QRegularExpression(
+                    f"^{pattern}$", QtCore.QRegularExpression.CaseInsensitiveOption
+                )
+            )
+        else:
+            self.proxy_model.setFilterFixedString(text)
+
+    def view_rows(self) -> list[int]:
+        """The rows shown, in the order shown."""
+        proxy = self.proxy_model
+        return [
+            proxy.mapToSource(proxy.index(row, 0)).row()
+            for row in range(proxy.rowCount())
+        ]
+
+    def selected_row_numbers(self) -> list[int]:
+        """The selected rows, in the order shown."""
+        indexes = sorted(
+            self.selectionModel().selectedRows(), key=lambda index: index.row()
+        )
+        return [self.proxy_model.mapToSource(index).row() for index in indexes]
+
+    def select_row(self, row: int):
+        """Select a model row."""
+        index = self.proxy_model.mapFromSource(self.source_model.index(row, 0))
+        if index.isValid():
+            self.selectRow(index.row())
 
     def toggle_column(self, checked):
         action = self.sender()
@@ -92,39 +299,170 @@ class CustomQTableWidget(QtWidgets.QTableWidget):
         point = header.mapToGlobal(pos)
         self.header_context_menu.exec_(point)
 
+    def estimate_column_width(self, column: int) -> int:
+        """Estimate the width of a column from a sample of rows and its
+        longest text, instead of measuring every cell."""
+        texts = [self._longest_text[column]]
+        for row in sample_rows(self.rowCount()):
+            item = self.item(row, column)
+            if item is not None:
+                texts.append(item.text())
+        return estimate_width(
+            self.fontMetrics(),
+            QtGui.QFontMetrics(self.horizontalHeader().font()),
+            self.horizontalHeaderItem(column).text(),
+            texts,
+        )
+
     def resize_current_column(self):
         current_column = self.mouse_over_column
-        self.resizeColumnToContents(current_column)
-
-    def resize_all_columns(self):
-        for column in range(self.columnCount()):
-            self.resizeColumnToContents(column)
+        self.setColumnWidth(current_column, self.estimate_column_width(current_column))
+
+    def resize_all_columns(self, use_cache: bool = False):
+        """Size every column to fit its text. Cached widths for the same
+        headers are used if the text is no longer than when they were measured."""
+        headers = [
+            self.horizontalHeaderItem(column).text()
+            for column in range(self.columnCount())
+        ]
+        lengths = [len(text) for text in self._longest_text]
+        widths = None
+        if use_cache and self.column_width_cache is not None:
+            widths = self.column_width_cache.get(headers, lengths)
+        if widths is None:
+            widths = [
+                self.estimate_column_width(column)
+                for column in range(self.columnCount())
+            ]
+            if self.column_width_cache is not None:
+                self.column_width_cache.set(headers, widths, lengths)
+        for column, width in enumerate(widths):
+            self.setColumnWidth(column, width)
 
     def show_row_context_menu(self, pos):
         menu = QtWidgets.QMenu()
         menu.addAction("Copy", self.copy_selected_rows)
+        menu.addAction("Copy All Rows", self.copy_all_rows)
+        menu.addSeparator()
+        menu.addAction("Export Selection...", self.export_selected_rows)
+        menu.addAction("Export All Rows...", self.export_all_rows)
         menu.exec_(self.mapToGlobal(pos))
 
+    def visible_columns(self) -> list[int]:
+        """The columns not hidden, in the order they are shown."""
+        header = self.horizontalHeader()
+        columns = [header.logicalIndex(index) for index in range(header.count())]
+        return [column for column in columns if not self.isColumnHidden(column)]
+
+    def table_data(self, rows: list[int] = None) -> tuple[list[str], list[list[str]]]:
+        """Get the headers and text of the visible columns, in the order shown.
+
+        Args:
+            rows (list[int], optional): The rows to get. Defaults to the rows shown.
+
+        Returns:
+            tuple[list[str], list[list[str]]]: The headers and the rows.
+        """
+        columns = self.visible_columns()
+        headers = [self.horizontalHeaderItem(column).text() for column in columns]
+        if rows is None:
+            rows = self.view_rows()
+        data = []
+        for row in rows:
+            row_data = []
+            for column in columns:
+                item = self.item(row, column)
+                row_data.append("" if item is None else item.text())
+            data.append(row_data)
+        return headers, data
+
+    def copy_rows(self, rows: list[int] = None):
+        """Copy rows to the clipboard as tab separated text, which Excel pastes
+        into cells, along with CSV and HTML versions."""
+        headers, data = self.table_data(rows)
+        mime_data = QtCore.QMimeData()
+        mime_data.setText(format_table(headers, data, TSV))
+        mime_data.setHtml(format_table(headers, data, HTML))
+        mime_data.setData("text/csv", format_table(headers, data, CSV).encode("utf-8"))
+        QtWidgets.QApplication.clipboard().setMimeData(mime_data)
+
     def copy_selected_rows(self):
-        rows = self.selectionModel().selectedRows()
+        rows = self.selected_row_numbers()
         if not rows:
             return
-        row_count = len(rows)
-        column_count = self.columnCount()
-        clipboard = QtWidgets.QApplication.clipboard()
-        clipboard.clear()
-        column_headers = [
-            f'"{self.horizontalHeaderItem(i).text()}"' for i in range(column_count)]
-        clipboard.setText(", ".join(column_headers) + "\n")
-        for row in rows:
-            row_data = []
-            for column in range(column_count):
-                item = self.item(row.row(), column)
-                if item is None:
-                    row_data.append("")
-                else:
-                    row_data.append(f"'{item.text()}'")
-            clipboard.setText(clipboard.text() + ", ".join(row_data) + "\n")
+        self.copy_rows(rows)
+
+    def copy_all_rows(self):
+        self.copy_rows()
+
+    def export_rows(self, rows: list[int] = None, file_path: str = None) -> bool:
+        """Write rows to a CSV, TSV or HTML file, asking for the file if not given."""
+        if file_path is None:
+            file_path, _ = QtWidgets.QFileDialog.getSaveFileName(
+                self,
+                "Export Rows",
+                "",
+                "CSV Files (*.csv);;Tab Separated Files (*.tsv *.txt);;HTML Files (*.html *.htm)",
+            )
+            if file_path == "":
+                return False
+
+        extension = os.path.splitext(file_path)[1].lower()
+        table_format = FILE_EXTENSIONS.get(extension, CSV)
+        headers, data = self.table_data(rows)
+        try:
+            with open(file_path, "w", newline="", encoding="utf-8-sig") as file:
+                file.write(format_table(headers, data, table_format))
+        except OSError as error:
+            QtWidgets.QMessageBox.warning(self, "Export Failed", str(error))
+            return False
+        return True
+
+    def export_selected_rows(self) -> bool:
+        rows = self.selected_row_numbers()
+        if not rows:
+            return False
+        return self.export_rows(rows)
+
+    def export_all_rows(self) -> bool:
+        return self.export_rows()
+
+
+class LabelPreviewWidget(QtWidgets.QLabel):
+    """Shows a rendered preview of a label."""
+
+    def __init__(self, parent=None, dpi: int = 150, cache_size: int = 256):
+        super().__init__(parent)
+        self.dpi = dpi
+        self.cache_size = cache_size
+        self.render_cache = None  # type: RenderCache
+
+        self.setAlignment(QtCore.Qt.AlignCenter)
+        self.setMinimumHeight(100)
+        self.setSizePolicy(
+            QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed
+        )
+        self.setStyleSheet("QLabel { background-color: #d0d0d0; }")
+
+    @property
+    def template(self) -> LabelTemplate:
+        if self.render_cache is None:
+            return None
+        return self.render_cache.renderer.template
+
+    def set_template(self, template: LabelTemplate):
+        """Set the label template to preview. Clears any cached previews."""
+        renderer = LabelRenderer(template, self.dpi)
+        self.render_cache = RenderCache(renderer, self.cache_size)
+        self.setFixedHeight(renderer.size.height() + 10)
+        self.clear()
+
+    def show_label(self, fields: dict[str, str]):
+        """Preview a label with the given field values."""
+        if self.render_cache is None:
+            return
+        image = self.render_cache.get(fields)
+        self.setPixmap(QtGui.QPixmap.fromImage(image))
 
 
 class SearchWidget(QtWidgets.QWidget):
@@ -242,11 +580,9 @@ class SearchWidget(QtWidgets.QWidget):
         # Update table
         records = self.pagination_records[self.pagination_start_record -
                                           1:self.pagination_start_record + self.pagination_record_limit - 1]
-        self.results_table.setRowCount(len(records))
-        for row, record in enumerate(records):
-            for col, value in enumerate(record):
-                self.results_table.setItem(
-                    row, col, QtWidgets.QTableWidgetItem(value))
+        self.results_table.setRowCount(0)
+        for record in records:
+            self.results_table.insert_row_data(record)
 
     def next_page(self) -> None:
         """Moves to the next page"""
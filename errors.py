@@ -32,3 +32,60 @@ class MissingRequiredColumnError(Error):
     """Raised when a required column is missing."""
 
     pass
+
+
+class NoPrinterAvailableError(Error):
+    """Raised when no printer is available to print to."""
+
+    pass
+
+
+class PrinterQueueTimeoutError(Error):
+    """Raised when a printer's queue does not drain in time."""
+
+    pass
+
+
+class PrintInterruptedError(Error):
+    """Raised when printing is stopped before every label was sent."""
+
+    pass
+
+
+class UnsupportedExportFormatError(Error):
+    """Raised when exporting to a file type that is not supported."""
+
+    pass
+
+
+class UpdateError(Error):
+    """Raised when an update can not be downloaded or installed."""
+
+    pass
+
+
+class ChecksumMismatchError(UpdateError):
+    """Raised when a downloaded file does not match its checksum."""
+
+    pass
+
+
+class InvalidLengthError(Error):
+    """Raised when a cut sheet length can not be read."""
+
+    pass
+
+
+class InvalidFieldFormulaError(Error):
+    """Raised when a label field formula can not be read or uses an unknown name."""
+
+    pass
+
+
+class PrinterSendError(Error):
+    """Raised when data could not be sent to a printer. `sent` is the bytes
+    written before the failure, they may have printed."""
+
+    def __init__(self, message: str, sent: int = 0):
+        super().__init__(message)
+        self.sent = sent
@@ -1,33 +1,50 @@
+import os
+import math
+import logging
+import importlib.util
 import pandas
-from dataclasses import dataclass
+from collections import OrderedDict
+from typing import Callable, Iterator
 from errors import *
+from settings import *
 
+backend_logger = logging.getLogger("backend")
 
-@dataclass
-class RequiredSheet:
-    """A class to represent a required sheet."""
-
-    name: str
-    columns: list
 
+CSV = ".csv"
+PARQUET = ".parquet"
+XLSX = ".xlsx"
+ODS = ".ods"
+CUT_SHEET_EXTENSIONS = [XLSX, ODS, CSV, PARQUET]
+CUT_SHEET_FILE_FILTER = ";;".join(
+    [
+        f"Cut Sheets ({' '.join('*' + extension for extension in CUT_SHEET_EXTENSIONS)})",
+        "Excel Files (*.xlsx)",
+        "OpenDocument Spreadsheets (*.ods)",
+        "CSV Files (*.csv)",
+        "Parquet Files (*.parquet)",
+    ]
+)
 
-from settings import *
+ZIP_MAGIC = b"PK\x03\x04"
+PARQUET_MAGIC = b"PAR1"
+ODS_MIMETYPE = b"application/vnd.oasis.opendocument.spreadsheet"
 
 
-def validate_dataframe(dataframe: pandas.DataFrame):
-    """Validate the dataframe."""
+def validate_dataframe(dataframe: dict[str, pandas.DataFrame]):
+    """Validate the dataframe, every required sheet must have every required
+    column. Other sheets and columns are allowed."""
     missing_sheets = []
     missing_columns = []
     for required_sheet in REQUIRED_SHEETS:
         if required_sheet.name not in dataframe:
             missing_sheets.append(required_sheet.name)
+            continue
 
-        if (
-            not dataframe[required_sheet.name]
-            .columns.isin(required_sheet.columns)
-            .all()
-        ):
-            missing_columns.append(required_sheet.name)
+        columns = dataframe[required_sheet.name].columns
+        missing = [column for column in required_sheet.columns if column not in columns]
+        if missing:
+            missing_columns.append(f"{required_sheet.name}: {missing}")
 
     if missing_sheets:
         raise MissingRequiredSheetError(f"Missing required sheets: {missing_sheets}")
@@ -35,8 +52,183 @@ def validate_dataframe(dataframe: pandas.DataFrame):
         raise MissingRequiredColumnError(f"Missing required columns: {missing_columns}")
 
 
-def parse_excel(file_path: str) -> pandas.DataFrame:
-    """Parse an excel file."""
-    df = pandas.read_excel(file_path, sheet_name=None)
-    validate_dataframe(df)
-    return df
+def required_columns(sheet_name: str = CUT_SHEET_NAME) -> list[str]:
+    for required_sheet in REQUIRED_SHEETS:
+        if required_sheet.name == sheet_name:
+            return required_sheet.columns
+    return []
+
+
+def read_spreadsheet(file_path: str, engine: str = None) -> dict[str, pandas.DataFrame]:
+    """Read the required sheets of an excel or OpenDocument file."""
+    sheet_names = [required_sheet.name for required_sheet in REQUIRED_SHEETS]
+    try:
+        return pandas.read_excel(file_path, sheet_name=sheet_names, engine=engine)
+    except ImportError as error:
+        # IE. Missing optional dependency 'odfpy'.
+        raise MissingRequiredSoftwareError(f"Can not read {file_path}. {error}")
+    except ValueError as error:
+        if "not found" not in str(error):
+            raise
+        raise MissingRequiredSheetError(f"Missing required sheets: {error}")
+
+
+def read_ods(file_path: str) -> dict[str, pandas.DataFrame]:
+    return read_spreadsheet(file_path, engine="odf")
+
+
+def read_csv(file_path: str) -> dict[str, pandas.DataFrame]:
+    """Read a CSV file as the cut sheet. Uses the multi threaded pyarrow
+    reader when installed, otherwise the C reader skipping unused columns.
+    Only the Cut Sheet columns are kept."""
+    columns = set(required_columns())
+    if importlib.util.find_spec("pyarrow") is not None:
+        options = {"engine": "pyarrow"}
+    else:
+        options = {"engine": "c", "usecols": lambda column: column in columns}
+    dataframe = pandas.read_csv(file_path, encoding="utf-8-sig", **options)
+    # The pyarrow reader reads every column.
+    dataframe = dataframe[[column for column in dataframe.columns if column in columns]]
+    return {CUT_SHEET_NAME: dataframe}
+
+
+def read_parquet(file_path: str) -> dict[str, pandas.DataFrame]:
+    """Read a Parquet file as the cut sheet, only reading the required columns."""
+    try:
+        dataframe = pandas.read_parquet(file_path, columns=required_columns())
+    except ImportError:
+        raise MissingRequiredSoftwareError(
+            "Reading Parquet files needs pyarrow or fastparquet. Please install one."
+        )
+    except (KeyError, ValueError) as error:
+        # Raised when a column is not in the file.
+        raise MissingRequiredColumnError(f"Missing required columns: {error}")
+    return {CUT_SHEET_NAME: dataframe}
+
+
+CUT_SHEET_READERS: dict[str, Callable[[str], dict[str, pandas.DataFrame]]] = {
+    XLSX: read_spreadsheet,
+    ODS: read_ods,
+    CSV: read_csv,
+    PARQUET: read_parquet,
+}
+
+
+def detect_format(file_path: str) -> str:
+    """Get the format of a file from its first bytes, as a file extension.
+    Anything that is not a zip or Parquet file is read as CSV."""
+    with open(file_path, "rb") as file:
+        header = file.read(128)
+    if header.startswith(PARQUET_MAGIC):
+        return PARQUET
+    if header.startswith(ZIP_MAGIC):
+        # OpenDocument files start with an uncompressed mimetype entry.
+        return ODS if ODS_MIMETYPE in header else XLSX
+    return CSV
+
+
+def parse_cut_sheet(file_path: str) -> dict[str, pandas.DataFrame]:
+    """Parse a cut sheet file. The format is picked by the file extension, or
+    from the file contents if the extension is not known.
+
+    Returns:
+        dict[str, pandas.DataFrame]: sheet_name: dataframe, for each required sheet.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in CUT_SHEET_READERS:
+        extension = detect_format(file_path)
+    backend_logger.debug(f"Reading {file_path} as {extension}")
+    dataframe = CUT_SHEET_READERS[extension](file_path)
+    validate_dataframe(dataframe)
+    return dataframe
+
+
+class CutSheetCache:
+    """Parsed cut sheets, shared by every open job. A file is parsed again
+    only once it changes on disk. The least recently used are dropped past
+    max_size. The dataframes are shared, do not change them."""
+
+    def __init__(self, max_size: int = CUT_SHEET_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # path: ((modified time, size), dataframe)
+        self._cut_sheets = OrderedDict()  # type: OrderedDict[str, tuple]
+
+    def __len__(self) -> int:
+        return len(self._cut_sheets)
+
+    def get(self, file_path: str) -> dict[str, pandas.DataFrame]:
+        """Get the parsed cut sheet, parsing it if it is not cached or the
+        file changed since."""
+        key = os.path.normcase(os.path.abspath(file_path))
+        stat = os.stat(file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._cut_sheets.get(key)
+        if cached is not None and cached[0] == signature:
+            self.hits += 1
+            self._cut_sheets.move_to_end(key)
+            return cached[1]
+
+        self.misses += 1
+        dataframe = parse_cut_sheet(file_path)
+        self._cut_sheets[key] = (signature, dataframe)
+        self._cut_sheets.move_to_end(key)
+        if len(self._cut_sheets) > self.max_size:
+            self._cut_sheets.popitem(last=False)
+        return dataframe
+
+    def clear(self):
+        self._cut_sheets.clear()
+
+
+def bundle_count(qty: int, total_qty: int, batch_size: int) -> int:
+    """Get the number of bundles (labels) to cut for a wire."""
+    return math.ceil(total_qty / batch_size) * int(qty)
+
+
+def iter_cut_sheet_table_rows(
+    cut_sheet: pandas.DataFrame, total_qty: int, batch_size: int
+) -> Iterator[list[str]]:
+    """Build the wire table rows for a cut sheet, one row at a time.
+
+    Args:
+        cut_sheet (pandas.DataFrame): The parsed cut sheet.
+        total_qty (int): The number of harnesses being cut.
+        batch_size (int): The number of harnesses in each batch.
+
+    Yields:
+        list[str]: One row per wire, in the order of TABLE_COLUMNS.
+    """
+    columns = TABLE_COLUMNS[2:]  # The cut sheet columns, after Line and Bundles.
+    # Tuples of plain values, much cheaper per row than iterrows.
+    for row_index, *values in cut_sheet[columns].itertuples(name=None):
+        row = dict(zip(columns, values))
+        if str(row["Qty"]) == "nan":
+            backend_logger.debug(
+                f"Skipping blank row {row_index + 2}."
+            )  # +2 to make the number match the excel row number
+            continue
+
+        yield [
+            str(row_index + 1),
+            str(bundle_count(row["Qty"], total_qty, batch_size)),
+            str(int(row["Qty"])),
+            str(int(row["Gauge"])),
+            str(row["Type"]),
+            str(row["Color"]),
+            str(row["Length"]),
+            str(row["Left Strip"]),
+            str(row["Left Gap"]),
+            str(row["Right Strip"]),
+            str(row["Right Gap"]),
+            str(row["Left Terminal"]),
+            str(row["Right Terminal"]),
+        ]
+
+
+def cut_sheet_table_rows(
+    cut_sheet: pandas.DataFrame, total_qty: int, batch_size: int
+) -> list[list[str]]:
+    """Build the wire table rows for a cut sheet. Blank rows are skipped."""
+    return list(iter_cut_sheet_table_rows(cut_sheet, total_qty, batch_size))
@@ -0,0 +1,225 @@
+"""Module to export the labels of a cut sheet instead of printing them.
+
+Labels are built one row at a time with the same fields as a printed label and
+written as they are built, so memory use does not grow with the cut sheet.
+
+    python exporter.py "PN-12345 Customer.xlsx" labels.pdf --first-name Test --last-name User
+"""
+
+from __future__ import annotations
+import os
+import sys
+import csv
+import json
+import logging
+import argparse
+import datetime
+from dataclasses import dataclass
+from typing import Iterator
+import pandas
+from PyQt5 import QtCore, QtGui
+
+from errors import *
+from excelparser import parse_cut_sheet, iter_cut_sheet_table_rows
+from fieldformulas import (
+    LabelFieldsFunction,
+    compile_field_formulas,
+    job_values,
+)
+from label import LabelTemplate, TWIPS_PER_INCH, WIRE_BUNDLE_LABEL_FIELDS
+from labelrenderer import LabelRenderer
+from templateregistry import TemplateRegistry
+from utilities import User, get_part_number, get_customer_name
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+MILLIMETERS_PER_INCH = 25.4
+PDF_DPI = 300
+
+
+@dataclass
+class ExportLabel:
+    """A wire table row and the label fields built from it."""
+
+    row: dict[str, str]
+    fields: dict[str, str]
+
+
+def export_labels(
+    cut_sheet: pandas.DataFrame,
+    total_qty: int,
+    batch_size: int,
+    user: User,
+    customer_name: str,
+    part_number: str,
+    timestamp: str = None,
+    label_fields: LabelFieldsFunction = None,
+) -> Iterator[ExportLabel]:
+    """Build the label for each wire table row of a cut sheet, one at a time.
+    The fields are built by label_fields, DEFAULT_FIELD_FORMULAS if not given."""
+    timestamp = timestamp or datetime.datetime.now().strftime(DATE_TIME_FORMAT)
+    if label_fields is None:
+        label_fields = compile_field_formulas(
+            DEFAULT_FIELD_FORMULAS, job_values(user, customer_name, part_number)
+        )
+    for values in iter_cut_sheet_table_rows(cut_sheet, total_qty, batch_size):
+        row = dict(zip(TABLE_COLUMNS, values))
+        yield ExportLabel(row, label_fields(row, timestamp))
+
+
+def write_csv(labels: Iterator[ExportLabel], file_path: str, **_) -> int:
+    """Write one line per label with the table columns and label fields."""
+    count = 0
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(TABLE_COLUMNS + WIRE_BUNDLE_LABEL_FIELDS)
+        for label in labels:
+            writer.writerow(
+                [label.row[column] for column in TABLE_COLUMNS]
+                + [label.fields.get(name, "") for name in WIRE_BUNDLE_LABEL_FIELDS]
+            )
+            count += 1
+    return count
+
+
+def write_jsonl(labels: Iterator[ExportLabel], file_path: str, **_) -> int:
+    """Write one JSON object per line: {"row": {...}, "fields": {...}}."""
+    count = 0
+    with open(file_path, "w", encoding="utf-8") as file:
+        for label in labels:
+            file.write(json.dumps({"row": label.row, "fields": label.fields}) + "\n")
+            count += 1
+    return count
+
+
+def write_pdf(
+    labels: Iterator[ExportLabel],
+    file_path: str,
+    template: LabelTemplate = None,
+    copies: bool = True,
+    **_,
+) -> int:
+    """Draw each label on its own page, the size of the label.
+
+    Args:
+        labels (Iterator[ExportLabel]): The labels to export.
+        file_path (str): The PDF file to write.
+        template (LabelTemplate): The label template to draw.
+        copies (bool): Add a page for every bundle, as if printed. Otherwise
+            one page per line.
+
+    Returns:
+        int: The number of pages written.
+    """
+    if template is None:
+        raise InvalidLabelFileError("A label template is needed to export a PDF.")
+    renderer = LabelRenderer(template, PDF_DPI)
+    writer = QtGui.QPdfWriter(file_path)
+    writer.setResolution(PDF_DPI)
+    writer.setPageSize(
+        QtGui.QPageSize(
+            QtCore.QSizeF(
+                template.width / TWIPS_PER_INCH * MILLIMETERS_PER_INCH,
+                template.height / TWIPS_PER_INCH * MILLIMETERS_PER_INCH,
+            ),
+            QtGui.QPageSize.Millimeter,
+        )
+    )
+    writer.setPageMargins(QtCore.QMarginsF(0, 0, 0, 0))
+
+    painter = None  # type: QtGui.QPainter
+    pages = 0
+    try:
+        for label in labels:
+            for _ in range(int(label.row["Bundles"]) if copies else 1):
+                if painter is None:
+                    # The first page is started by QPainter.begin
+                    painter = QtGui.QPainter(writer)
+                    painter.scale(renderer.scale, renderer.scale)
+                else:
+                    writer.newPage()
+                renderer.paint(painter, label.fields)
+                pages += 1
+    finally:
+        if painter is not None:
+            painter.end()
+    return pages
+
+
+EXPORT_FORMATS = {
+    ".csv": write_csv,
+    ".jsonl": write_jsonl,
+    ".pdf": write_pdf,
+}
+
+
+def export(labels: Iterator[ExportLabel], file_path: str, **options) -> int:
+    """Write labels to a file. The format is picked from the file extension.
+
+    Returns:
+        int: The number of labels, or pages for a PDF, written.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    writer = EXPORT_FORMATS.get(extension)
+    if writer is None:
+        raise UnsupportedExportFormatError(
+            f"Can not export to {extension} files. Supported: {', '.join(EXPORT_FORMATS)}"
+        )
+    backend_logger.info(f"Exporting labels to: {file_path}")
+    return writer(labels, file_path, **options)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cut_sheet", help="The cut sheet excel file.")
+    parser.add_argument(
+        "output", help=f"The file to write. One of: {', '.join(EXPORT_FORMATS)}"
+    )
+    parser.add_argument("--first-name", required=True, help="Cut by first name.")
+    parser.add_argument("--last-name", required=True, help="Cut by last name.")
+    parser.add_argument("--customer", help="Defaults to the cut sheet file name.")
+    parser.add_argument("--total-qty", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--template", default=DEFAULT_LABEL_TEMPLATE)
+    parser.add_argument(
+        "--single-copy",
+        action="store_true",
+        help="One PDF page per line, instead of one per bundle.",
+    )
+    args = parser.parse_args(argv)
+
+    # Fonts can not be used to draw a PDF without an application.
+    application = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication(sys.argv)
+
+    file_path = args.cut_sheet.replace("\\", "/")
+    try:
+        customer_name = args.customer or get_customer_name(file_path)
+    except IndexError:
+        print(
+            f"Could not get the customer name from {file_path}, pass it with --customer."
+        )
+        return 1
+    dataframe = parse_cut_sheet(file_path)
+    labels = export_labels(
+        dataframe[CUT_SHEET_NAME],
+        args.total_qty,
+        args.batch_size,
+        User(args.first_name, args.last_name),
+        customer_name,
+        get_part_number(file_path),
+    )
+    try:
+        template = TemplateRegistry(TEMPLATE_FOLDER).get(args.template)
+        count = export(
+            labels, args.output, template=template, copies=not args.single_copy
+        )
+    except Error as error:
+        print(error)
+        return 1
+    print(f"Exported {count} to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
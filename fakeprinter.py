@@ -0,0 +1,375 @@
+"""Fake printers used to benchmark and exercise the print path without the
+Dymo software or a physical printer."""
+
+from __future__ import annotations
+import re
+import math
+import time
+import random
+import socket
+import hashlib
+import threading
+from collections import Counter, deque
+
+from label import Label
+from networkprinter import ConnectionPool
+from printerpool import PrinterBackend, PrintJob
+
+
+class FakeDymoEngine:
+    """Stands in for both the `Dymo.DymoAddIn` and `Dymo.DymoLabels` COM
+    objects. Every method call sleeps for `latency` seconds and is counted."""
+
+    def __init__(self, printers: list[str] = None, latency: float = 0.0):
+        self.printers = printers or ["Fake LabelWriter 450"]
+        self.latency = latency
+        self.calls = Counter()  # type: Counter[str]
+        self.printed = 0  # Copies printed.
+        self.selected_printer = None
+
+    @property
+    def call_count(self) -> int:
+        return sum(self.calls.values())
+
+    def _call(self, name: str):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def GetDymoPrinters(self) -> str:
+        self._call("GetDymoPrinters")
+        return "|".join(self.printers) + "|"
+
+    def IsPrinterOnline(self, printer_name: str) -> bool:
+        self._call("IsPrinterOnline")
+        return printer_name in self.printers
+
+    def SelectPrinter(self, printer_name: str):
+        self._call("SelectPrinter")
+        self.selected_printer = printer_name
+
+    def Open(self, file_path: str) -> bool:
+        self._call("Open")
+        return True
+
+    def SetField(self, field_name: str, value: str) -> bool:
+        self._call("SetField")
+        return True
+
+    def StartPrintJob(self):
+        self._call("StartPrintJob")
+
+    def EndPrintJob(self):
+        self._call("EndPrintJob")
+
+    def Print(self, copies: int, show_dialog: bool):
+        self._call("Print")
+        self.printed += copies
+
+
+class FaultyPrinterBackend(PrinterBackend):
+    """A printer that fails on purpose, to exercise retries and resubmits.
+
+    Args:
+        fail_labels (set[int]): Labels that fail when sent, counting every
+            label sent from 1, IE. {3} fails the third label sent.
+        failure_rate (float): Chance any other label fails.
+        healthy (bool): Result of the health check.
+        seed (int): Seed of the failures picked by failure_rate.
+    """
+
+    def __init__(
+        self,
+        name: str = "Faulty Printer",
+        fail_labels: set[int] = (),
+        failure_rate: float = 0.0,
+        healthy: bool = True,
+        seed: int = None,
+    ):
+        self.name = name
+        self.fail_labels = set(fail_labels)
+        self.failure_rate = failure_rate
+        self.healthy = healthy
+        self.random = random.Random(seed)
+        self.sent = 0  # Labels sent, including those that failed.
+        self.printed = []  # type: list[Label] # Labels printed, in order.
+
+    @property
+    def duplicates(self) -> int:
+        """Labels printed more than once."""
+        return len(self.printed) - len({id(label) for label in self.printed})
+
+    def print(self, label: Label, copies: int = 1):
+        self.sent += 1
+        if self.sent in self.fail_labels or self.random.random() < self.failure_rate:
+            raise OSError(f"Injected failure sending label {self.sent}.")
+        self.printed.append(label)
+
+    def health_check(self) -> bool:
+        return self.healthy
+
+
+class FaultyConnection:
+    """A socket that fails part way through a write once `fail_after_bytes`
+    were written, like a printer dropping the connection."""
+
+    def __init__(self, connection: socket.socket, fail_after_bytes: int):
+        self.connection = connection
+        self.fail_after_bytes = fail_after_bytes
+        self.written = 0
+
+    def send(self, data: bytes) -> int:
+        left = self.fail_after_bytes - self.written
+        if left <= 0:
+            raise ConnectionResetError(
+                f"Injected failure after {self.written} bytes written."
+            )
+        sent = self.connection.send(data[:left])
+        self.written += sent
+        return sent
+
+    def close(self):
+        self.connection.close()
+
+
+class FaultyConnectionPool(ConnectionPool):
+    """Connections to network printers that fail part way through a write.
+
+    Args:
+        fail_after_bytes (list[int]): Bytes each connection writes before it
+            fails, counting every connection made, IE. [0, 500] fails the
+            first connection at once and the second after 500 bytes. Later
+            connections do not fail.
+    """
+
+    def __init__(self, fail_after_bytes: list[int], timeout: float = 5.0):
+        super().__init__(timeout)
+        self.fail_after_bytes = deque(fail_after_bytes)
+
+    def connect(self, address: tuple[str, int]) -> socket.socket:
+        connection = super().connect(address)
+        if not self.fail_after_bytes:
+            return connection
+        return FaultyConnection(connection, self.fail_after_bytes.popleft())
+
+
+class SimulatedClock:
+    """Time that only moves when slept, so a simulated print run of minutes
+    takes no time at all."""
+
+    def __init__(self):
+        self.time = 0.0
+
+    def now(self) -> float:
+        return self.time
+
+    def sleep(self, seconds: float):
+        self.time += max(0.0, seconds)
+
+
+class SimulatedPrinter(PrinterBackend):
+    """A printer with a set speed. Each job sent takes `submit_seconds` to
+    send and waits in the printer's queue. The printer takes `job_seconds` to
+    start each job and prints `labels_per_second`. Sending blocks while the
+    queue holds `buffer_labels`, like a full spooler or printer buffer.
+
+    Args:
+        clock (SimulatedClock): Shared with the pool printing to it.
+        reports_queue (bool): If False, queued_labels returns None, like a
+            printer whose queue can not be read.
+    """
+
+    def __init__(
+        self,
+        name: str = "Simulated Printer",
+        labels_per_second: float = 2.0,
+        job_seconds: float = 0.5,
+        submit_seconds: float = 0.05,
+        buffer_labels: int = 200,
+        clock: SimulatedClock = None,
+        reports_queue: bool = True,
+    ):
+        self.name = name
+        self.labels_per_second = labels_per_second
+        self.job_seconds = job_seconds
+        self.submit_seconds = submit_seconds
+        self.buffer_labels = buffer_labels
+        self.clock = clock or SimulatedClock()
+        self.reports_queue = reports_queue
+        # [seconds left to start the job, labels left] of each queued job.
+        self._queue = deque()  # type: deque[list[float]]
+        self._updated = self.clock.now()
+        self.jobs = 0  # Jobs sent.
+        self.printed = 0  # Labels printed.
+        self.busy_seconds = 0.0
+        self.max_queued = 0
+        self.started_at = None  # type: float # When the first job was sent.
+
+    def _advance(self):
+        """Print for the time passed since the last update."""
+        now = self.clock.now()
+        elapsed = now - self._updated
+        self._updated = now
+        while elapsed > 0 and self._queue:
+            job = self._queue[0]
+            job_time = job[0] + job[1] / self.labels_per_second
+            step = min(elapsed, job_time)
+            self.busy_seconds += step
+            elapsed -= step
+            starting = min(step, job[0])
+            job[0] -= starting
+            printed = (step - starting) * self.labels_per_second
+            job[1] -= printed
+            self.printed += printed
+            if step >= job_time - 1e-9:  # Left over by rounding.
+                self._queue.popleft()
+
+    @property
+    def queued(self) -> float:
+        return sum(labels for _, labels in self._queue)
+
+    def queued_labels(self) -> int:
+        if not self.reports_queue:
+            return None
+        self._advance()
+        return math.ceil(self.queued - 1e-9)
+
+    def print_many(self, jobs: list[PrintJob]):
+        labels = sum(job.copies for job in jobs)
+        if self.started_at is None:
+            self.started_at = self.clock.now()
+        self.clock.sleep(self.submit_seconds)
+        self._advance()
+        while self._queue and self.queued + labels > self.buffer_labels:
+            job = self._queue[0]
+            self.clock.sleep(job[0] + job[1] / self.labels_per_second)
+            self._advance()
+        self._queue.append([self.job_seconds, float(labels)])
+        self.jobs += 1
+        self.max_queued = max(self.max_queued, math.ceil(self.queued))
+        for job in jobs:
+            job.mark_printed(self.name)
+
+    def print(self, label: Label, copies: int = 1):
+        self.print_many([PrintJob(label, copies)])
+
+    def finish(self) -> float:
+        """Wait for every label to print. Returns the seconds from the first
+        job sent to the last label printed."""
+        self._advance()
+        while self._queue:
+            job = self._queue[0]
+            self.clock.sleep(job[0] + job[1] / self.labels_per_second)
+            self._advance()
+        if self.started_at is None:
+            return 0.0
+        return self.clock.now() - self.started_at
+
+    @property
+    def utilization(self) -> float:
+        """Share of the time the printer was printing, up to now."""
+        if self.started_at is None:
+            return 0.0
+        elapsed = self.clock.now() - self.started_at
+        return self.busy_seconds / elapsed if elapsed else 0.0
+
+
+class ZplPrinterServer:
+    """A network label printer on a local TCP port, taking the ZPL a
+    NetworkLabelPrinter sends to port 9100. Each label format received,
+    from ^XA to ^XZ, counts its ^PQ copies. A format received twice is
+    counted as a duplicate, and a format cut off by a closed connection is
+    not printed, like on a printer.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on, 0 for any free port.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()[:2]  # type: tuple[str, int]
+        self.connections = 0
+        self.formats = 0  # Label formats received.
+        self.labels = 0  # Copies of the formats received.
+        self.duplicates = 0  # Formats received more than once.
+        self.cut_off = 0  # Formats left unfinished by a closed connection.
+        self.bytes_received = 0
+        self.first_at = None  # type: float # When the first data arrived.
+        self.last_at = None  # type: float # When the last label arrived.
+        self._digests = set()  # type: set[bytes]
+        self._received = threading.Condition()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def start(self) -> ZplPrinterServer:
+        self._thread.start()
+        return self
+
+    def close(self):
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)  # Wakes the accept.
+        except OSError:
+            pass
+        self._server.close()
+
+    @property
+    def labels_per_second(self) -> float:
+        """Rate labels arrived, from the first data to the last label."""
+        if self.last_at is None or self.last_at <= self.first_at:
+            return None
+        return self.labels / (self.last_at - self.first_at)
+
+    def wait_for_labels(self, labels: int, timeout: float = 10.0) -> bool:
+        """Wait until at least `labels` were received. Returns False on timeout."""
+        with self._received:
+            return self._received.wait_for(lambda: self.labels >= labels, timeout)
+
+    def _serve(self):
+        """Take one connection at a time, like a printer."""
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:  # Closed.
+                return
+            self.connections += 1
+            with connection:
+                self._receive(connection)
+
+    def _receive(self, connection: socket.socket):
+        data = b""
+        while True:
+            try:
+                chunk = connection.recv(64 * 1024)
+            except OSError:
+                chunk = b""
+            if not chunk:
+                break
+            if self.first_at is None:
+                self.first_at = time.perf_counter()
+            self.bytes_received += len(chunk)
+            # Only search the new data, and the end of the old for a split ^XZ.
+            search_from = max(0, len(data) - 2)
+            data += chunk
+            end = data.rfind(b"^XZ", search_from)
+            if end >= 0:
+                self._print(data[: end + 3])
+                data = data[end + 3 :]
+        if data.strip():
+            self.cut_off += data.count(b"^XA")
+
+    def _print(self, data: bytes):
+        with self._received:
+            for label_format in data.split(b"^XZ")[:-1]:
+                start = label_format.find(b"^XA")
+                if start < 0:
+                    continue
+                label_format = label_format[start:]
+                digest = hashlib.sha1(label_format).digest()
+                if digest in self._digests:
+                    self.duplicates += 1
+                self._digests.add(digest)
+                copies = re.search(rb"\^PQ(\d+)", label_format)
+                self.formats += 1
+                self.labels += int(copies.group(1)) if copies else 1
+            self.last_at = time.perf_counter()
+            self._received.notify_all()
@@ -0,0 +1,225 @@
+"""Module to build label field values from formulas.
+
+A formula is text with the names of values in braces, IE. `{Gauge}GA {Color}`.
+A formula can also be a JSON object of formulas, which is written as JSON, IE.
+for the barcode. The names are the wire table columns and a few values of the
+job, see JOB_VALUES. A name may be followed by a conversion, `!u` upper case,
+`!l` lower case or `!n` without the inch mark, and a format spec, IE.
+`{Gauge:>2}`.
+
+Formulas are checked and compiled into a single Python function for a job,
+with the job's values already filled in. Building a label's fields is one
+call of that function, the formulas are not read again for each label."""
+
+from __future__ import annotations
+import json
+import string
+import logging
+from typing import Callable, Mapping, Union
+
+from errors import *
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+# A formula, or a JSON object of formulas.
+Formula = Union[str, dict]
+# Builds the fields of a label from a wire table row and the print timestamp.
+LabelFieldsFunction = Callable[[Mapping[str, str], str], dict[str, str]]
+
+TIMESTAMP = "timestamp"
+JOB_VALUES = [
+    "initials",
+    "user",  # Full name.
+    "first_name",
+    "last_name",
+    "customer",
+    "part_number",
+    TIMESTAMP,
+]
+
+CONVERSIONS = {
+    "u": "str.upper",
+    "l": "str.lower",
+    "n": "_without_inch_mark",
+}
+
+_formatter = string.Formatter()
+
+
+def _without_inch_mark(text: str) -> str:
+    return text.replace('"', "")
+
+
+def column_names() -> list[str]:
+    """The wire table columns a formula can use, from REQUIRED_SHEETS."""
+    return TABLE_COLUMNS
+
+
+def value_names() -> list[str]:
+    return column_names() + JOB_VALUES
+
+
+def validate_formula(formula: Formula):
+    """Check every name in a formula is known.
+
+    Raises:
+        InvalidFieldFormulaError: If the formula can not be read or uses an
+            unknown name or conversion.
+    """
+    _compile_formula(formula, {name: name for name in JOB_VALUES})
+
+
+def parse_field_formulas(text: str) -> dict[str, Formula]:
+    """Read a settings value, a JSON object of field name: formula.
+
+    Raises:
+        InvalidFieldFormulaError: If the value is not a valid JSON object of
+            formulas.
+    """
+    try:
+        formulas = json.loads(text)
+    except ValueError as error:
+        raise InvalidFieldFormulaError(f"Field formulas are not valid JSON: {error}")
+    if not isinstance(formulas, dict):
+        raise InvalidFieldFormulaError(f"Field formulas must be a JSON object: {text}")
+    for field_name, formula in formulas.items():
+        try:
+            validate_formula(formula)
+        except InvalidFieldFormulaError as error:
+            raise InvalidFieldFormulaError(f"Field {field_name}: {error}")
+    return formulas
+
+
+def field_formulas(
+    settings: Mapping[str, str], customer_name: str = "", template_name: str = ""
+) -> dict[str, Formula]:
+    """Get the formulas for a job. Fields set for the customer are used over
+    those set for the template, and those over DEFAULT_FIELD_FORMULAS.
+
+    Args:
+        settings (Mapping[str, str]): Customer or template name: JSON object
+            of field name: formula.
+    """
+    formulas = dict(DEFAULT_FIELD_FORMULAS)
+    for key in (template_name, customer_name):
+        if key and settings.get(key):
+            try:
+                formulas.update(parse_field_formulas(settings[key]))
+            except InvalidFieldFormulaError as error:
+                raise InvalidFieldFormulaError(f"{key}: {error}")
+    return formulas
+
+
+def job_values(user, customer_name: str, part_number: str) -> dict[str, str]:
+    """The values of a job, by name. The timestamp is set for each print."""
+    return {
+        "initials": user.initials,
+        "user": user.full_name,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "customer": customer_name,
+        "part_number": part_number,
+    }
+
+
+def compile_field_formulas(
+    formulas: Mapping[str, Formula], values: Mapping[str, str]
+) -> LabelFieldsFunction:
+    """Compile the formulas of every field into one function.
+
+    Args:
+        formulas (Mapping[str, Formula]): field_name: formula.
+        values (Mapping[str, str]): The job's values, as from job_values.
+
+    Returns:
+        LabelFieldsFunction: Called with a wire table row, keyed by column,
+            and the timestamp. Returns field_name: value.
+
+    Raises:
+        InvalidFieldFormulaError: If a formula uses an unknown name.
+    """
+    entries = []
+    for field_name, formula in formulas.items():
+        try:
+            expression = _compile_formula(formula, values)
+        except InvalidFieldFormulaError as error:
+            raise InvalidFieldFormulaError(f"Field {field_name}: {error}")
+        if isinstance(formula, dict):
+            expression = f"_json_dumps({expression})"
+        entries.append(f"{field_name!r}: {expression}")
+    source = f"lambda row, timestamp: {{{', '.join(entries)}}}"
+    backend_logger.debug(f"Compiled label fields: {source}")
+    # Only validated names and quoted text make it into the source.
+    return eval(
+        compile(source, "<field formulas>", "eval"),
+        {
+            "__builtins__": {"str": str, "format": format},
+            "_json_dumps": json.dumps,
+            "_without_inch_mark": _without_inch_mark,
+        },
+    )
+
+
+def _compile_formula(formula: Formula, values: Mapping[str, str]) -> str:
+    """Get the Python expression for a formula. Job values are filled in."""
+    if isinstance(formula, dict):
+        items = [
+            f"{str(key)!r}: {_compile_formula(value, values)}"
+            for key, value in formula.items()
+        ]
+        return f"{{{', '.join(items)}}}"
+    if not isinstance(formula, str):
+        raise InvalidFieldFormulaError(f"Not a formula: {formula!r}")
+
+    try:
+        segments = list(_formatter.parse(formula))
+    except ValueError as error:
+        raise InvalidFieldFormulaError(f"Can not read formula {formula!r}: {error}")
+
+    parts = []  # type: list[str]  # Python expressions
+    text = ""  # Text not added to parts yet, joined to the next text.
+    for literal, name, format_spec, conversion in segments:
+        text += literal
+        if name is None:
+            continue
+        if name in values and name != TIMESTAMP and not format_spec and not conversion:
+            text += values[name]
+            continue
+
+        if name == TIMESTAMP:
+            expression = "timestamp"
+        elif name in values:
+            expression = repr(values[name])
+        elif name in column_names():
+            expression = f"row[{name!r}]"
+        else:
+            raise InvalidFieldFormulaError(
+                f"Unknown name {{{name}}} in {formula!r}. Names: {', '.join(value_names())}"
+            )
+        if conversion:
+            if conversion not in CONVERSIONS:
+                raise InvalidFieldFormulaError(
+                    f"Unknown conversion !{conversion} in {formula!r}. Conversions: {', '.join(CONVERSIONS)}"
+                )
+            expression = f"{CONVERSIONS[conversion]}({expression})"
+        if format_spec:
+            if "{" in format_spec:
+                raise InvalidFieldFormulaError(
+                    f"Nested names are not supported: {formula!r}"
+                )
+            try:
+                format("", format_spec)  # Every value is text.
+            except ValueError as error:
+                raise InvalidFieldFormulaError(
+                    f"Format :{format_spec} can not be used in {formula!r}, values are text: {error}"
+                )
+            expression = f"format({expression}, {format_spec!r})"
+
+        if text:
+            parts.append(repr(text))
+            text = ""
+        parts.append(expression)
+    if text or not parts:
+        parts.append(repr(text))
+    return " + ".join(parts)
@@ -0,0 +1,386 @@
+"""Module to share job state between stations through a small local server.
+
+The server holds every open job and the state of each bundle (wire table line):
+open, claimed by a station or printed by a station. Stations claim a bundle
+before printing it, so the same bundle can not be printed twice, and subscribe
+to a stream of events to see what the other stations are doing.
+
+Run the server with:
+
+    python jobserver.py --host 0.0.0.0 --port 8765
+
+HTTP/JSON endpoints:
+    GET  /jobs                                  List the open jobs.
+    PUT  /jobs/<job_id>                         Open a job, if not already open.
+    GET  /jobs/<job_id>                         Get a job and its bundles.
+    POST /jobs/<job_id>/bundles/<line>/claim    Claim a bundle. 409 if taken.
+    POST /jobs/<job_id>/bundles/<line>/release  Release a claimed bundle.
+    POST /jobs/<job_id>/bundles/<line>/printed  Mark a bundle printed.
+    GET  /events?since=<seq>&instance=<id>      Stream events as JSON lines.
+
+The first line of the event stream is a "connected" event with the server's
+instance ID. A client that reconnects with the ID of a previous run of the
+server, which lost its jobs and started counting events again, gets every
+event. A blank line is sent when there are no events, so a client can tell
+the server is still there.
+"""
+
+from __future__ import annotations
+import json
+import uuid
+import socket
+import asyncio
+import logging
+import argparse
+import http.client
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from urllib.parse import urlsplit, parse_qs, quote, unquote
+
+backend_logger = logging.getLogger("backend")
+
+DEFAULT_PORT = 8765
+MAX_EVENT_HISTORY = 10000
+EVENT_KEEPALIVE_SECONDS = 15.0  # Most time without a line on the event stream.
+EVENT_TIMEOUT_SECONDS = 2 * EVENT_KEEPALIVE_SECONDS  # The server is taken as lost.
+
+OPEN = "open"
+CLAIMED = "claimed"
+PRINTED = "printed"
+CONNECTED = "connected"
+
+
+@dataclass
+class BundleState:
+    """The state of a single bundle (wire table line) of a job."""
+
+    line: str
+    state: str = OPEN
+    station: str = ""
+
+
+@dataclass
+class Job:
+    job_id: str
+    bundles: dict[str, BundleState] = field(default_factory=dict)
+
+    def json(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "bundles": [asdict(bundle) for bundle in self.bundles.values()],
+        }
+
+
+class JobStore:
+    """Holds the jobs and the events raised when a bundle changes state.
+    Only used from the event loop, so every operation is atomic."""
+
+    def __init__(self):
+        self.jobs = {}  # type: dict[str, Job]
+        self.events = deque(maxlen=MAX_EVENT_HISTORY)  # type: deque[dict]
+        self.sequence = 0
+        self.new_event = asyncio.Condition()
+        self.instance = uuid.uuid4().hex  # Tells a restarted server apart.
+
+    async def publish(self, event_type: str, job_id: str, **data) -> dict:
+        self.sequence += 1
+        event = {"seq": self.sequence, "type": event_type, "job_id": job_id, **data}
+        self.events.append(event)
+        async with self.new_event:
+            self.new_event.notify_all()
+        return event
+
+    async def open_job(self, job_id: str, lines: list[str]) -> Job:
+        """Open a job. Returns the existing job if it is already open."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        job = Job(job_id, {line: BundleState(line) for line in lines})
+        self.jobs[job_id] = job
+        await self.publish("opened", job_id, lines=lines)
+        return job
+
+    async def set_state(
+        self, job_id: str, line: str, state: str, station: str
+    ) -> tuple[bool, BundleState]:
+        """Change the state of a bundle. Returns False if another station
+        already holds it, or it was already printed."""
+        job = self.jobs.get(job_id)
+        if job is None or line not in job.bundles:
+            raise KeyError(f"{job_id}/{line}")
+        bundle = job.bundles[line]
+
+        if state == CLAIMED:
+            if bundle.state == PRINTED:
+                return False, bundle
+            if bundle.state == CLAIMED and bundle.station != station:
+                return False, bundle
+        elif state == OPEN:
+            if bundle.state != CLAIMED or bundle.station != station:
+                return False, bundle
+        elif state == PRINTED:
+            if bundle.state == CLAIMED and bundle.station != station:
+                return False, bundle
+
+        bundle.state = state
+        bundle.station = station if state != OPEN else ""
+        event_type = "released" if state == OPEN else state
+        await self.publish(event_type, job_id, line=line, station=station)
+        return True, bundle
+
+    def events_since(self, sequence: int) -> list[dict]:
+        return [event for event in self.events if event["seq"] > sequence]
+
+
+class JobServer:
+    """Serves a JobStore over HTTP/JSON with persistent connections."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.store = None  # type: JobStore
+        self.server = None  # type: asyncio.base_events.Server
+
+    async def start(self):
+        self.store = JobStore()
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        backend_logger.info(f"Job server listening on {self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+
+                url = urlsplit(target)
+                if method == "GET" and url.path == "/events":
+                    query = parse_qs(url.query)
+                    since = int(query.get("since", ["0"])[0])
+                    instance = query.get("instance", [""])[0]
+                    await self.stream_events(writer, since, instance)
+                    break
+
+                status, response = await self.route(method, url.path, body)
+                self.write_json(writer, status, response)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as error:
+            backend_logger.debug(f"Job server connection closed: {error}")
+        finally:
+            writer.close()
+
+    async def route(self, method: str, path: str, body: dict) -> tuple[int, dict]:
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        store = self.store
+        try:
+            if parts == ["jobs"] and method == "GET":
+                return 200, {"jobs": list(store.jobs)}
+            if len(parts) == 2 and parts[0] == "jobs":
+                if method == "PUT":
+                    job = await store.open_job(parts[1], body.get("lines", []))
+                    return 200, job.json()
+                if method == "GET" and parts[1] in store.jobs:
+                    return 200, store.jobs[parts[1]].json()
+            if len(parts) == 5 and parts[0] == "jobs" and parts[2] == "bundles":
+                state = {"claim": CLAIMED, "release": OPEN, "printed": PRINTED}.get(
+                    parts[4]
+                )
+                if method == "POST" and state is not None:
+                    ok, bundle = await store.set_state(
+                        parts[1], parts[3], state, body.get("station", "")
+                    )
+                    return (200 if ok else 409), asdict(bundle)
+        except KeyError as error:
+            return 404, {"error": f"Not found: {error}"}
+        return 404, {"error": f"Not found: {method} {path}"}
+
+    @staticmethod
+    def write_json(writer: asyncio.StreamWriter, status: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {http.client.responses.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+
+    async def stream_events(
+        self, writer: asyncio.StreamWriter, since: int, instance: str = ""
+    ):
+        """Write events as JSON lines until the client disconnects. Events of
+        another instance of the server are not these, so all are sent."""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        store = self.store
+        if instance and instance != store.instance:
+            since = 0
+        connected = {"seq": since, "type": CONNECTED, "instance": store.instance}
+        writer.write(json.dumps(connected).encode("utf-8") + b"\n")
+        while True:
+            for event in store.events_since(since):
+                writer.write(json.dumps(event).encode("utf-8") + b"\n")
+                since = event["seq"]
+            await writer.drain()
+            async with store.new_event:
+                try:
+                    await asyncio.wait_for(
+                        store.new_event.wait_for(lambda: store.sequence > since),
+                        EVENT_KEEPALIVE_SECONDS,
+                    )
+                except asyncio.TimeoutError:
+                    writer.write(b"\n")
+
+
+class JobServerClient:
+    """Blocking client for a JobServer. Keeps its connection open between
+    requests. Not thread safe, use one client per thread."""
+
+    def __init__(self, url: str, station: str, timeout: float = 5.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or DEFAULT_PORT
+        self.station = station
+        self.timeout = timeout
+        self.connection = None  # type: http.client.HTTPConnection
+        self.events_socket = None  # type: socket.socket
+        # job_id: lines, to open a job again if the server restarted.
+        self.job_lines = {}  # type: dict[str, list[str]]
+
+    def request(self, method: str, path: str, data: dict = None) -> tuple[int, dict]:
+        body = json.dumps(data or {})
+        headers = {"Content-Type": "application/json"}
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+            try:
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                return response.status, json.loads(response.read())
+            except (ConnectionError, http.client.HTTPException):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @staticmethod
+    def _bundle_path(job_id: str, line: str, action: str) -> str:
+        return f"/jobs/{quote(job_id, safe='')}/bundles/{quote(line, safe='')}/{action}"
+
+    def open_job(self, job_id: str, lines: list[str]) -> dict:
+        """Open a job on the server. Returns the job and its bundle states."""
+        self.job_lines[job_id] = lines
+        _, job = self.request(
+            "PUT", f"/jobs/{quote(job_id, safe='')}", {"lines": lines}
+        )
+        return job
+
+    def bundle_request(self, job_id: str, line: str, action: str) -> int:
+        """Change the state of a bundle. Returns the HTTP status. A job the
+        server does not know, as it restarted, is opened again with the lines
+        it was last opened with and the change is tried again."""
+        path = self._bundle_path(job_id, line, action)
+        status, _ = self.request("POST", path, {"station": self.station})
+        if status == 404 and job_id in self.job_lines:
+            backend_logger.warning(
+                f"Job server does not know {job_id}/{line}, opening the job again."
+            )
+            self.open_job(job_id, self.job_lines[job_id])
+            status, _ = self.request("POST", path, {"station": self.station})
+        return status
+
+    def claim(self, job_id: str, line: str) -> bool:
+        """Claim a bundle for this station. Returns False if another station
+        claimed or printed it. A bundle the server does not have is not taken."""
+        status = self.bundle_request(job_id, line, "claim")
+        if status == 404:
+            backend_logger.warning(f"Job server does not know line {line}.")
+        return status != 409
+
+    def release(self, job_id: str, line: str) -> bool:
+        return self.bundle_request(job_id, line, "release") == 200
+
+    def mark_printed(self, job_id: str, line: str) -> bool:
+        return self.bundle_request(job_id, line, "printed") == 200
+
+    def events(self, since: int = 0, instance: str = ""):
+        """Yield events as they happen, after the "connected" event. Blocks,
+        run it on its own thread. Raises socket.timeout if the server sends
+        nothing for EVENT_TIMEOUT_SECONDS, and stops after close_events."""
+        connection = http.client.HTTPConnection(
+            self.host, self.port, timeout=EVENT_TIMEOUT_SECONDS
+        )
+        try:
+            connection.connect()
+            # The connection lets go of its socket once the response starts.
+            self.events_socket = connection.sock
+            connection.request(
+                "GET", f"/events?since={since}&instance={quote(instance, safe='')}"
+            )
+            response = connection.getresponse()
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                if line.strip():  # Blank lines keep the connection alive.
+                    yield json.loads(line)
+        finally:
+            self.events_socket = None
+            connection.close()
+
+    def close_events(self):
+        """Stop events. Can be called from another thread."""
+        events_socket = self.events_socket
+        if events_socket is not None:
+            try:
+                events_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Wire label job server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(JobServer(args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
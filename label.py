@@ -1,4 +1,14 @@
 from __future__ import annotations
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass, field
+
+from errors import InvalidLabelFileError
+
+TWIPS_PER_INCH = 1440
+TWIPS_PER_POINT = 20
+
+# Fields set on the wire bundle label for every print.
+WIRE_BUNDLE_LABEL_FIELDS = ["timestamp", "left_text_box", "right_text_box", "barcode"]
 
 
 class Label:
@@ -12,3 +22,135 @@ class Label:
     def set_field(self, field_name: str, value: str):
         """Set a field of the label."""
         self.fields[field_name] = value
+
+
+@dataclass
+class Bounds:
+    """The position and size of a label object, in twips."""
+
+    x: float
+    y: float
+    width: float
+    height: float
+
+
+@dataclass
+class LabelObject:
+    """A single named object (text box or barcode) on a label template."""
+
+    name: str
+    object_type: str  # TextObject or BarcodeObject
+    bounds: Bounds
+    rotation: int = 0  # Degrees, counter clockwise
+    horizontal_alignment: str = "Left"
+    vertical_alignment: str = "Top"
+    text_fit_mode: str = "None"
+    font_family: str = "Arial"
+    font_size: float = 10
+    bold: bool = False
+    italic: bool = False
+    text: str = ""
+    barcode_type: str = ""
+    error_correction: int = 0
+
+    @property
+    def is_barcode(self) -> bool:
+        return self.object_type == "BarcodeObject"
+
+
+@dataclass
+class LabelTemplate:
+    """Object model of a Dymo `.label` file."""
+
+    file_path: str
+    paper_name: str
+    width: float  # Twips, as drawn after applying the paper orientation.
+    height: float
+    objects: list[LabelObject] = field(default_factory=list)
+
+    def get_object(self, name: str) -> LabelObject:
+        """Get a label object by name. Returns None if not found."""
+        for label_object in self.objects:
+            if label_object.name == name:
+                return label_object
+        return None
+
+    @staticmethod
+    def from_file(file_path: str) -> LabelTemplate:
+        """Parse a Dymo `.label` file."""
+        try:
+            root = ElementTree.parse(file_path).getroot()
+        except (OSError, ElementTree.ParseError) as error:
+            raise InvalidLabelFileError(
+                f"Could not parse label file: {file_path}. {error}"
+            )
+        if root.tag != "DieCutLabel":
+            raise InvalidLabelFileError(
+                f"Unsupported label type {root.tag} in file: {file_path}"
+            )
+
+        shape = root.find("DrawCommands/RoundRectangle")
+        if shape is None:
+            shape = root.find("DrawCommands/Rectangle")
+        if shape is None:
+            raise InvalidLabelFileError(f"Label file has no paper size: {file_path}")
+        width = float(shape.get("Width"))
+        height = float(shape.get("Height"))
+        if root.findtext("PaperOrientation", "Portrait") == "Landscape":
+            width, height = height, width
+
+        template = LabelTemplate(
+            file_path=file_path,
+            paper_name=root.findtext("PaperName", ""),
+            width=width,
+            height=height,
+        )
+        for object_info in root.iter("ObjectInfo"):
+            label_object = _parse_label_object(object_info)
+            if label_object is not None:
+                template.objects.append(label_object)
+        return template
+
+
+def _parse_label_object(object_info: ElementTree.Element) -> LabelObject:
+    """Parse an `ObjectInfo` element. Returns None for unsupported objects."""
+    element = object_info.find("TextObject")
+    if element is None:
+        element = object_info.find("BarcodeObject")
+    if element is None:
+        return None
+
+    bounds_element = object_info.find("Bounds")
+    bounds = Bounds(
+        x=float(bounds_element.get("X")),
+        y=float(bounds_element.get("Y")),
+        width=float(bounds_element.get("Width")),
+        height=float(bounds_element.get("Height")),
+    )
+    label_object = LabelObject(
+        name=element.findtext("Name", ""),
+        object_type=element.tag,
+        bounds=bounds,
+        rotation=int(element.findtext("Rotation", "Rotation0").replace("Rotation", "")),
+        horizontal_alignment=element.findtext("HorizontalAlignment", "Left"),
+        vertical_alignment=element.findtext("VerticalAlignment", "Top"),
+        text_fit_mode=element.findtext("TextFitMode", "None"),
+    )
+
+    if label_object.is_barcode:
+        label_object.barcode_type = element.findtext("Type", "")
+        label_object.error_correction = int(element.findtext("ECLevel", "0"))
+        label_object.text = element.findtext("Text", "")
+        font = element.find("TextFont")
+    else:
+        label_object.text = "".join(
+            string.text or "" for string in element.iter("String")
+        )
+        font = element.find("StyledText/Element/Attributes/Font")
+
+    if font is not None:
+        label_object.font_family = font.get("Family", "Arial")
+        label_object.font_size = float(font.get("Size", 10))
+        label_object.bold = font.get("Bold") == "True"
+        label_object.italic = font.get("Italic") == "True"
+    return label_object
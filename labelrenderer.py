@@ -0,0 +1,216 @@
+"""Module to draw Dymo label templates without the Dymo software.
+Used to preview labels before they are sent to the printer."""
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from PyQt5 import QtCore, QtGui
+
+import barcode
+from label import LabelObject, LabelTemplate, TWIPS_PER_INCH, TWIPS_PER_POINT
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+HORIZONTAL_ALIGNMENTS = {
+    "Left": QtCore.Qt.AlignLeft,
+    "Center": QtCore.Qt.AlignHCenter,
+    "Right": QtCore.Qt.AlignRight,
+}
+VERTICAL_ALIGNMENTS = {
+    "Top": QtCore.Qt.AlignTop,
+    "Middle": QtCore.Qt.AlignVCenter,
+    "Bottom": QtCore.Qt.AlignBottom,
+}
+
+
+def fields_hash(fields: dict[str, str]) -> str:
+    """Get a stable hash of a label's field values."""
+    data = json.dumps(fields, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+class LabelRenderer:
+    """Draws a label template with field values onto an image. Can be used
+    from several threads at once."""
+
+    def __init__(self, template: LabelTemplate, dpi: int = 150):
+        self.template = template
+        self.dpi = dpi
+        self.scale = dpi / TWIPS_PER_INCH  # Pixels per twip
+        # Drawn QR codes. (payload, error correction, width, height): path
+        self._paths = OrderedDict()  # type: OrderedDict[tuple, QtGui.QPainterPath]
+        self._paths_lock = threading.Lock()
+
+    @property
+    def size(self) -> QtCore.QSize:
+        """The rendered image size in pixels."""
+        return QtCore.QSize(
+            round(self.template.width * self.scale),
+            round(self.template.height * self.scale),
+        )
+
+    def render(self, fields: dict[str, str]) -> QtGui.QImage:
+        """Render the label. Fields not set use the template's default text."""
+        image = QtGui.QImage(self.size, QtGui.QImage.Format_RGB32)
+        image.fill(QtCore.Qt.white)
+
+        painter = QtGui.QPainter(image)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setRenderHint(QtGui.QPainter.TextAntialiasing)
+        painter.scale(self.scale, self.scale)  # Draw in twips from here on.
+        self.paint(painter, fields)
+        painter.end()
+        return image
+
+    def encode_barcodes(self, fields_list: list[dict[str, str]]):
+        """Encode the QR codes of a batch of labels together, ahead of
+        rendering them. Each distinct payload is encoded once."""
+        for label_object in self.template.objects:
+            if label_object.is_barcode and label_object.barcode_type == "QRCode":
+                barcode.qr_matrices(
+                    [
+                        fields.get(label_object.name, label_object.text)
+                        for fields in fields_list
+                    ],
+                    label_object.error_correction,
+                )
+
+    def paint(self, painter: QtGui.QPainter, fields: dict[str, str]):
+        """Draw the label with a painter scaled to twips. Used to draw onto
+        other paint devices, IE. a page of a PDF."""
+        for label_object in self.template.objects:
+            text = fields.get(label_object.name, label_object.text)
+            painter.save()
+            self._rotate(painter, label_object)
+            if label_object.is_barcode:
+                self.draw_barcode(painter, label_object, text)
+            else:
+                self.draw_text(painter, label_object, text)
+            painter.restore()
+
+    @staticmethod
+    def _rotate(painter: QtGui.QPainter, label_object: LabelObject):
+        """Move the painter origin to the object's top left corner, applying
+        the object's rotation."""
+        bounds = label_object.bounds
+        painter.translate(bounds.x + bounds.width / 2, bounds.y + bounds.height / 2)
+        painter.rotate(-label_object.rotation)
+        width, height = LabelRenderer._unrotated_size(label_object)
+        painter.translate(-width / 2, -height / 2)
+
+    @staticmethod
+    def _unrotated_size(label_object: LabelObject) -> tuple[float, float]:
+        bounds = label_object.bounds
+        if label_object.rotation in (90, 270):
+            return bounds.height, bounds.width
+        return bounds.width, bounds.height
+
+    def draw_text(self, painter: QtGui.QPainter, label_object: LabelObject, text: str):
+        width, height = self._unrotated_size(label_object)
+        rect = QtCore.QRectF(0, 0, width, height)
+        flags = HORIZONTAL_ALIGNMENTS.get(
+            label_object.horizontal_alignment, QtCore.Qt.AlignLeft
+        ) | VERTICAL_ALIGNMENTS.get(label_object.vertical_alignment, QtCore.Qt.AlignTop)
+
+        font = QtGui.QFont(label_object.font_family)
+        font.setBold(label_object.bold)
+        font.setItalic(label_object.italic)
+        font.setPixelSize(round(label_object.font_size * TWIPS_PER_POINT))
+        painter.setFont(font)
+
+        if label_object.text_fit_mode == "ShrinkToFit":
+            needed = painter.boundingRect(rect, flags, text)
+            if needed.width() > width or needed.height() > height:
+                factor = min(width / needed.width(), height / needed.height())
+                font.setPixelSize(max(1, int(font.pixelSize() * factor)))
+                painter.setFont(font)
+
+        painter.setPen(QtCore.Qt.black)
+        painter.drawText(rect, flags, text)
+
+    def draw_barcode(
+        self, painter: QtGui.QPainter, label_object: LabelObject, text: str
+    ):
+        width, height = self._unrotated_size(label_object)
+        key = (text, label_object.error_correction, width, height)
+        with self._paths_lock:
+            path = self._paths.get(key)
+            if path is not None:
+                self._paths.move_to_end(key)
+        if path is None and label_object.barcode_type == "QRCode":
+            matrix = barcode.qr_matrix(text, label_object.error_correction)
+            if matrix is not None:
+                path = self._barcode_path(matrix, width, height)
+                with self._paths_lock:
+                    self._paths[key] = path
+                    if len(self._paths) > BARCODE_PATH_CACHE_SIZE:
+                        self._paths.popitem(last=False)
+
+        if path is None:
+            # Unsupported barcode or the qrcode package is missing.
+            painter.setPen(QtGui.QPen(QtCore.Qt.black, 0))
+            painter.setBrush(QtGui.QBrush(QtCore.Qt.black, QtCore.Qt.BDiagPattern))
+            painter.drawRect(QtCore.QRectF(0, 0, width, height))
+            return
+
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+        painter.fillPath(path, QtCore.Qt.black)
+
+    @staticmethod
+    def _barcode_path(
+        matrix: barcode.Matrix, width: float, height: float
+    ) -> QtGui.QPainterPath:
+        """The dark modules, centered in the object's bounds."""
+        modules = len(matrix)
+        module_size = min(width, height) / modules
+        left = (width - module_size * modules) / 2
+        top = (height - module_size * modules) / 2
+
+        path = QtGui.QPainterPath()
+        for row_index, row in enumerate(matrix):
+            for column_index, dark in enumerate(row):
+                if dark:
+                    path.addRect(
+                        left + column_index * module_size,
+                        top + row_index * module_size,
+                        module_size,
+                        module_size,
+                    )
+        return path
+
+
+class RenderCache:
+    """Least recently used cache of rendered labels, keyed by field content."""
+
+    def __init__(self, renderer: LabelRenderer, max_size: int = 256):
+        self.renderer = renderer
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()  # type: OrderedDict[str, QtGui.QImage]
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def get(self, fields: dict[str, str]) -> QtGui.QImage:
+        """Get the rendered label, rendering it only if it is not cached."""
+        key = fields_hash(fields)
+        image = self._images.get(key)
+        if image is not None:
+            self.hits += 1
+            self._images.move_to_end(key)
+            return image
+
+        self.misses += 1
+        image = self.renderer.render(fields)
+        self._images[key] = image
+        if len(self._images) > self.max_size:
+            self._images.popitem(last=False)
+        return image
+
+    def clear(self):
+        self._images.clear()
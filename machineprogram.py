@@ -0,0 +1,280 @@
+"""Module to export a cut sheet as a program for a cut and strip machine.
+
+Each wire table row becomes a batch: the length, strip and gap of each end,
+the number of wires to cut and the bundle size. Batches refer to an article,
+one for each distinct wire. Rows are written as they are read, so a job of
+any size is exported in one pass.
+
+    python machineprogram.py "PN-12345 Customer.xlsx" program.xml --total-qty 20 --batch-size 10
+"""
+
+from __future__ import annotations
+import os
+import sys
+import csv
+import logging
+import argparse
+from dataclasses import dataclass
+from typing import Iterator, TextIO
+from xml.sax.saxutils import quoteattr
+import pandas
+
+from errors import *
+from excelparser import parse_cut_sheet, iter_cut_sheet_table_rows
+from materials import parse_length, parse_inches
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+MILLIMETERS = "mm"
+INCHES = "in"
+UNITS = {MILLIMETERS: 25.4, INCHES: 1.0}  # Units per inch.
+DECIMALS = {MILLIMETERS: 1, INCHES: 3}
+
+# Rows of the same wire are cut together, so reels and terminals change least.
+CUT_ORDER_COLUMNS = ["Gauge", "Type", "Color", "Left Terminal", "Right Terminal"]
+
+BATCH_COLUMNS = [
+    "Line",
+    "Article",
+    "Gauge",
+    "Type",
+    "Color",
+    "Length",
+    "Left Strip",
+    "Left Gap",
+    "Right Strip",
+    "Right Gap",
+    "Left Terminal",
+    "Right Terminal",
+    "Quantity",
+    "Bundle Size",
+    "Bundles",
+    "Units",
+]
+
+
+@dataclass
+class CutBatch:
+    """The wires to cut for a wire table row. Lengths are in the units."""
+
+    line: str
+    gauge: str
+    wire_type: str
+    color: str
+    length: float
+    left_strip: float
+    left_gap: float
+    right_strip: float
+    right_gap: float
+    left_terminal: str
+    right_terminal: str
+    quantity: int  # Wires to cut.
+    bundle_size: int  # Wires in each bundle.
+    bundles: int
+    units: str
+
+    @property
+    def article(self) -> str:
+        """Name of the wire cut, the same for every batch of the same wire."""
+        return (
+            f"{self.gauge}{self.wire_type} {self.color} {self.length:g}{self.units} "
+            f"{self.left_strip:g}/{self.left_gap:g} {self.right_strip:g}/{self.right_gap:g}"
+        )
+
+    @property
+    def values(self) -> list[str]:
+        """The batch, in the order of BATCH_COLUMNS."""
+        return [
+            self.line,
+            self.article,
+            self.gauge,
+            self.wire_type,
+            self.color,
+            f"{self.length:g}",
+            f"{self.left_strip:g}",
+            f"{self.left_gap:g}",
+            f"{self.right_strip:g}",
+            f"{self.right_gap:g}",
+            self.left_terminal,
+            self.right_terminal,
+            str(self.quantity),
+            str(self.bundle_size),
+            str(self.bundles),
+            self.units,
+        ]
+
+
+def optimize_cut_order(cut_sheet: pandas.DataFrame) -> pandas.DataFrame:
+    """Order the rows so the same wire, with the same terminals, is cut one
+    after the other, longest first. Rows keep their line numbers."""
+    keys = cut_sheet[CUT_ORDER_COLUMNS].astype(str)
+    keys["Length"] = -parse_inches(cut_sheet["Length"]).fillna(0)
+    order = keys.sort_values(CUT_ORDER_COLUMNS + ["Length"], kind="stable").index
+    return cut_sheet.loc[order]
+
+
+def cut_batches(
+    cut_sheet: pandas.DataFrame,
+    total_qty: int,
+    batch_size: int,
+    units: str = MILLIMETERS,
+    optimize: bool = False,
+) -> Iterator[CutBatch]:
+    """Build the batch for each wire table row, one at a time.
+
+    Raises:
+        InvalidLengthError: If a length can not be read, or a strip or gap
+            that is not blank. Blank strips and gaps are 0.
+    """
+    if units not in UNITS:
+        raise ValueError(f"Unknown units: {units}")
+    if optimize:
+        cut_sheet = optimize_cut_order(cut_sheet)
+    scale = UNITS[units]
+    lengths = {}  # type: dict[str, float]
+
+    def length(row: dict[str, str], column: str, required: bool = True) -> float:
+        text = row[column]
+        if not required and text.strip() in ("", "nan", "None"):
+            return 0.0
+        if text not in lengths:
+            inches = parse_length(text)
+            if inches is None:
+                raise InvalidLengthError(
+                    f"Line {row['Line']}: {column} can not be read: {text}"
+                )
+            lengths[text] = round(inches * scale, DECIMALS[units])
+        return lengths[text]
+
+    for values in iter_cut_sheet_table_rows(cut_sheet, total_qty, batch_size):
+        row = dict(zip(TABLE_COLUMNS, values))
+        yield CutBatch(
+            line=row["Line"],
+            gauge=row["Gauge"],
+            wire_type=row["Type"],
+            color=row["Color"],
+            length=length(row, "Length"),
+            left_strip=length(row, "Left Strip", required=False),
+            left_gap=length(row, "Left Gap", required=False),
+            right_strip=length(row, "Right Strip", required=False),
+            right_gap=length(row, "Right Gap", required=False),
+            left_terminal=row["Left Terminal"],
+            right_terminal=row["Right Terminal"],
+            quantity=int(row["Qty"]) * total_qty,
+            bundle_size=batch_size,
+            bundles=int(row["Bundles"]),
+            units=units,
+        )
+
+
+def write_csv(batches: Iterator[CutBatch], file: TextIO) -> int:
+    """One line per batch, with the columns in BATCH_COLUMNS."""
+    writer = csv.writer(file, lineterminator="\r\n")
+    writer.writerow(BATCH_COLUMNS)
+    count = 0
+    for batch in batches:
+        writer.writerow(batch.values)
+        count += 1
+    return count
+
+
+def write_xml(batches: Iterator[CutBatch], file: TextIO) -> int:
+    """An article list and batch list. Each article is written before the
+    first batch that uses it."""
+    file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+    file.write("<Program>\n")
+    articles = set()  # type: set[str]
+    count = 0
+    for batch in batches:
+        if batch.article not in articles:
+            articles.add(batch.article)
+            file.write(
+                f"  <Article name={quoteattr(batch.article)}"
+                f" gauge={quoteattr(batch.gauge)}"
+                f" type={quoteattr(batch.wire_type)}"
+                f" color={quoteattr(batch.color)}"
+                f' length="{batch.length:g}"'
+                f' leftStrip="{batch.left_strip:g}" leftGap="{batch.left_gap:g}"'
+                f' rightStrip="{batch.right_strip:g}" rightGap="{batch.right_gap:g}"'
+                f" leftTerminal={quoteattr(batch.left_terminal)}"
+                f" rightTerminal={quoteattr(batch.right_terminal)}"
+                f" units={quoteattr(batch.units)}/>\n"
+            )
+        file.write(
+            f"  <Batch line={quoteattr(batch.line)} article={quoteattr(batch.article)}"
+            f' quantity="{batch.quantity}" bundleSize="{batch.bundle_size}"'
+            f' bundles="{batch.bundles}"/>\n'
+        )
+        count += 1
+    file.write("</Program>\n")
+    return count
+
+
+PROGRAM_FORMATS = {
+    ".csv": write_csv,
+    ".xml": write_xml,
+}
+
+
+def export_program(batches: Iterator[CutBatch], file_path: str) -> int:
+    """Write batches to a program file. The format is picked from the file
+    extension. The file is only replaced once every batch is written, so a
+    failed export never leaves half a program behind.
+
+    Returns:
+        int: The number of batches written.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    writer = PROGRAM_FORMATS.get(extension)
+    if writer is None:
+        raise UnsupportedExportFormatError(
+            f"Can not export programs to {extension} files. Supported: {', '.join(PROGRAM_FORMATS)}"
+        )
+    backend_logger.info(f"Exporting machine program to: {file_path}")
+    temp_path = f"{file_path}.tmp"
+    try:
+        with open(temp_path, "w", newline="", encoding="utf-8") as file:
+            count = writer(batches, file)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return count
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cut_sheet", help="The cut sheet excel file.")
+    parser.add_argument(
+        "output", help=f"The file to write. One of: {', '.join(PROGRAM_FORMATS)}"
+    )
+    parser.add_argument("--total-qty", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--units", choices=list(UNITS), default=MILLIMETERS)
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Cut the same wire one after the other, instead of in line order.",
+    )
+    args = parser.parse_args(argv)
+
+    dataframe = parse_cut_sheet(args.cut_sheet)
+    batches = cut_batches(
+        dataframe[CUT_SHEET_NAME],
+        args.total_qty,
+        args.batch_size,
+        args.units,
+        args.optimize,
+    )
+    try:
+        count = export_program(batches, args.output)
+    except Error as error:
+        print(error)
+        return 1
+    print(f"Exported {count} batch(es) to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""Module to work out the wire and terminals a set of jobs use.
+
+Every row of every job is put in one table and worked out with column
+operations, so a week of jobs is totaled as fast as one."""
+
+from __future__ import annotations
+import re
+import math
+import logging
+from dataclasses import dataclass
+from typing import Mapping
+import numpy
+import pandas
+
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+INCHES_PER_FOOT = 12
+# IE. 1/4 or 46 1/2, after the inch mark is removed.
+FRACTION_PATTERN = r"^(?:(\d+(?:\.\d+)?)\s+)?(\d+)\s*/\s*(\d+)$"
+
+WIRE_COLUMNS = ["Gauge", "Type", "Color"]
+TERMINAL_COLUMNS = ["Left Terminal", "Right Terminal"]
+
+
+@dataclass
+class MaterialJob:
+    """A cut sheet and the number of harnesses cut from it."""
+
+    name: str
+    cut_sheet: pandas.DataFrame
+    harnesses: int
+
+
+@dataclass
+class MaterialReport:
+    wire: pandas.DataFrame  # Gauge, Type, Color, Wires, Feet, Reels, Left Over
+    terminals: pandas.DataFrame  # Terminal, Count
+    invalid_lengths: int  # Rows with a length that could not be read.
+
+
+def parse_inches(values: pandas.Series) -> pandas.Series:
+    """Read lengths in inches, IE. 8, 0.125, 46" or 46 1/2". Values that can
+    not be read are NaN. Cut sheets repeat the same few lengths, so each
+    distinct value is only read once."""
+    codes, uniques = pandas.factorize(values)
+    inches = _parse_inches(pandas.Series(uniques, dtype=object)).to_numpy(float)
+    parsed = numpy.append(inches, numpy.nan)[codes]  # Code -1, a blank, is NaN.
+    return pandas.Series(parsed, index=values.index)
+
+
+def _parse_inches(values: pandas.Series) -> pandas.Series:
+    text = values.astype(str).str.strip().str.rstrip('"').str.strip()
+    inches = pandas.to_numeric(text, errors="coerce")
+    missing = inches.isna() & values.notna()
+    if missing.any():
+        parts = text[missing].str.extract(FRACTION_PATTERN)
+        whole = pandas.to_numeric(parts[0], errors="coerce").fillna(0)
+        denominator = pandas.to_numeric(parts[2], errors="coerce").replace(0, numpy.nan)
+        inches[missing] = (
+            whole + pandas.to_numeric(parts[1], errors="coerce") / denominator
+        )
+    return inches
+
+
+def parse_length(text: str) -> float:
+    """Read one length in inches, the same as parse_inches. None if it can not
+    be read."""
+    text = str(text).strip().rstrip('"').strip()
+    try:
+        inches = float(text)
+    except ValueError:
+        match = re.match(FRACTION_PATTERN, text)
+        if match is None or float(match.group(3)) == 0:
+            return None
+        whole, numerator, denominator = match.groups()
+        inches = float(whole or 0) + float(numerator) / float(denominator)
+    return inches if math.isfinite(inches) else None
+
+
+def job_rows(jobs: list[MaterialJob]) -> pandas.DataFrame:
+    """The wire rows of every job in one table, with the number of wires cut
+    and the length in inches of each row. Blank rows are left out."""
+    frames = []
+    for job in jobs:
+        frame = job.cut_sheet.dropna(subset=["Qty"])
+        frame = frame[
+            WIRE_COLUMNS
+            + ["Qty", "Length", "Left Strip", "Right Strip"]
+            + TERMINAL_COLUMNS
+        ]
+        frames.append(frame.assign(Job=job.name, Harnesses=job.harnesses))
+    if not frames:
+        columns = WIRE_COLUMNS + ["Length", "Left Strip", "Right Strip"]
+        return pandas.DataFrame(
+            columns=columns + TERMINAL_COLUMNS + ["Job", "Wires", "Inches"]
+        )
+    rows = pandas.concat(frames, ignore_index=True)
+    rows["Wires"] = (
+        pandas.to_numeric(rows["Qty"], errors="coerce").fillna(0) * rows["Harnesses"]
+    )
+    rows["Inches"] = parse_inches(rows["Length"])
+    return rows
+
+
+def wire_consumption(
+    rows: pandas.DataFrame, include_strip: bool = True
+) -> pandas.DataFrame:
+    """Total the wires and feet of wire for each gauge, type and color.
+
+    Args:
+        rows (pandas.DataFrame): As returned by job_rows.
+        include_strip (bool): Add the left and right strip to each length.
+
+    Returns:
+        pandas.DataFrame: Gauge, Type, Color, Wires and Feet columns.
+    """
+    inches = rows["Inches"]
+    if include_strip:
+        for column in ("Left Strip", "Right Strip"):
+            inches = inches + parse_inches(rows[column]).fillna(0)
+    frame = rows[WIRE_COLUMNS].assign(
+        Wires=rows["Wires"], Feet=inches.fillna(0) * rows["Wires"] / INCHES_PER_FOOT
+    )
+    # Group the raw values first, then tidy the few groups left, IE. gauge 18.0
+    # and "18 " are both 18. Cheaper than tidying every row.
+    wire = frame.groupby(WIRE_COLUMNS, sort=False, dropna=False).sum().reset_index()
+    for column in WIRE_COLUMNS:
+        wire[column] = wire[column].fillna("").astype(str).str.strip()
+    wire["Gauge"] = wire["Gauge"].str.replace(r"\.0$", "", regex=True)
+    wire = wire.groupby(WIRE_COLUMNS, sort=True).sum().reset_index()
+    wire["Wires"] = wire["Wires"].astype(int)
+    return wire
+
+
+def terminal_counts(rows: pandas.DataFrame) -> pandas.DataFrame:
+    """Total the terminals used, from both ends of each wire."""
+    ends = pandas.concat(
+        [
+            rows[[column, "Wires"]].rename(columns={column: "Terminal"})
+            for column in TERMINAL_COLUMNS
+        ],
+        ignore_index=True,
+    )
+    terminals = ends.groupby("Terminal", sort=False)["Wires"].sum().reset_index()
+    terminals["Terminal"] = terminals["Terminal"].astype(str).str.strip()
+    terminals = terminals[terminals["Terminal"].ne("")]
+    terminals = terminals.groupby("Terminal", sort=True)["Wires"].sum().astype(int)
+    return terminals.rename("Count").reset_index()
+
+
+def allocate_reels(
+    wire: pandas.DataFrame,
+    reel_lengths: Mapping[str, float] = None,
+    default_reel_length: float = REEL_LENGTH_FEET,
+) -> pandas.DataFrame:
+    """Add the number of reels needed for each wire and the feet left over.
+
+    Args:
+        wire (pandas.DataFrame): As returned by wire_consumption.
+        reel_lengths (Mapping[str, float]): Gauge: feet on a reel.
+        default_reel_length (float): Feet on a reel of any other gauge.
+    """
+    lengths = wire["Gauge"].map(
+        {gauge: float(feet) for gauge, feet in (reel_lengths or {}).items()}
+    )
+    lengths = lengths.fillna(default_reel_length).to_numpy(float)
+    reels = numpy.ceil(wire["Feet"].to_numpy(float) / lengths)
+    return wire.assign(
+        Reels=reels.astype(int), **{"Left Over": reels * lengths - wire["Feet"]}
+    )
+
+
+def material_report(
+    jobs: list[MaterialJob],
+    reel_lengths: Mapping[str, float] = None,
+    include_strip: bool = True,
+) -> MaterialReport:
+    """Work out the wire, reels and terminals a set of jobs use."""
+    rows = job_rows(jobs)
+    invalid_lengths = int((rows["Wires"].gt(0) & rows["Inches"].isna()).sum())
+    if invalid_lengths:
+        backend_logger.warning(
+            f"{invalid_lengths} row(s) have a length that can not be read."
+        )
+    wire = allocate_reels(wire_consumption(rows, include_strip), reel_lengths)
+    return MaterialReport(wire, terminal_counts(rows), invalid_lengths)
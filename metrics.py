@@ -0,0 +1,296 @@
+"""Module to record production metrics and roll them up for reports.
+
+Each print is recorded as an event. Events are stored in a file per month,
+one numpy array per column with text stored as category codes, so a year of
+history loads in well under a second. New events are appended to a small
+pending CSV file for the month, which is merged into the month file every
+METRICS_COMPACT_EVERY events."""
+
+from __future__ import annotations
+import os
+import csv
+import logging
+import datetime
+from dataclasses import dataclass, astuple
+import numpy
+import pandas
+from pandas.api.types import union_categoricals
+
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+MONTH_FILE_EXTENSION = ".npz"
+PENDING_FILE_EXTENSION = ".csv"
+
+TEXT_COLUMNS = ["operator", "customer", "part_number", "gauge", "wire_type"]
+NUMBER_COLUMNS = ["copies", "wires"]
+COLUMNS = ["timestamp"] + TEXT_COLUMNS + NUMBER_COLUMNS
+
+# Rollup keys
+HOUR = "Hour"
+DAY = "Day"
+SHIFT = "Shift"
+OPERATOR = "Operator"
+CUSTOMER = "Customer"
+PART_NUMBER = "Part Number"
+WIRE = "Wire"
+ROLLUP_KEYS = [HOUR, DAY, SHIFT, OPERATOR, CUSTOMER, PART_NUMBER, WIRE]
+
+ROLLUP_TOTALS = ["Lines", "Bundles", "Wires"]
+
+
+@dataclass
+class MetricEvent:
+    """A printed wire table row. Each label is one bundle of wires."""
+
+    timestamp: datetime.datetime
+    operator: str  # User initials.
+    customer: str
+    part_number: str
+    gauge: str
+    wire_type: str
+    copies: int  # Labels printed.
+    wires: int  # Wires in the bundles printed.
+
+
+def month_key(day: datetime.date) -> str:
+    return f"{day:%Y-%m}"
+
+
+def empty_frame() -> pandas.DataFrame:
+    frame = pandas.DataFrame({column: [] for column in COLUMNS})
+    frame["timestamp"] = frame["timestamp"].astype("datetime64[s]")
+    for column in TEXT_COLUMNS:
+        frame[column] = frame[column].astype(str).astype("category")
+    for column in NUMBER_COLUMNS:
+        frame[column] = frame[column].astype(numpy.int32)
+    return frame
+
+
+def concat_frames(frames: list[pandas.DataFrame]) -> pandas.DataFrame:
+    """Concatenate frames, keeping the text columns as categories."""
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return empty_frame()
+    if len(frames) == 1:
+        return frames[0]
+    data = {
+        "timestamp": numpy.concatenate(
+            [frame["timestamp"].to_numpy("datetime64[s]") for frame in frames]
+        )
+    }
+    for column in TEXT_COLUMNS:
+        data[column] = union_categoricals(
+            [frame[column].astype("category") for frame in frames]
+        )
+    for column in NUMBER_COLUMNS:
+        data[column] = numpy.concatenate(
+            [frame[column].to_numpy(numpy.int32) for frame in frames]
+        )
+    return pandas.DataFrame(data)
+
+
+class MetricsStore:
+    """Production metrics, in a pair of files per month."""
+
+    def __init__(
+        self, folder: str = METRICS_FOLDER, compact_every: int = METRICS_COMPACT_EVERY
+    ):
+        self.folder = folder
+        self.compact_every = compact_every
+        self._pending_counts = {}  # type: dict[str, int]
+        self._cache = {}  # type: dict[str, tuple[float, pandas.DataFrame]]
+
+    def month_path(self, month: str) -> str:
+        return os.path.join(self.folder, f"{month}{MONTH_FILE_EXTENSION}")
+
+    def pending_path(self, month: str) -> str:
+        return os.path.join(self.folder, f"{month}{PENDING_FILE_EXTENSION}")
+
+    def months(self) -> list[str]:
+        """The months with recorded events, oldest first."""
+        months = set()
+        for file_name in os.listdir(self.folder):
+            month, extension = os.path.splitext(file_name)
+            if extension in (MONTH_FILE_EXTENSION, PENDING_FILE_EXTENSION):
+                months.add(month)
+        return sorted(months)
+
+    def record(self, events: list[MetricEvent]):
+        """Append events to the pending file of their month."""
+        by_month = {}  # type: dict[str, list[MetricEvent]]
+        for event in events:
+            by_month.setdefault(month_key(event.timestamp), []).append(event)
+
+        for month, month_events in by_month.items():
+            with open(
+                self.pending_path(month), "a", newline="", encoding="utf-8"
+            ) as file:
+                writer = csv.writer(file)
+                for event in month_events:
+                    values = list(astuple(event))
+                    values[0] = event.timestamp.isoformat(timespec="seconds")
+                    writer.writerow(values)
+            count = self._pending_count(month) + len(month_events)
+            self._pending_counts[month] = count
+            if count >= self.compact_every:
+                self.compact(month)
+
+    def _pending_count(self, month: str) -> int:
+        if month not in self._pending_counts:
+            count = 0
+            if os.path.exists(self.pending_path(month)):
+                with open(self.pending_path(month), "r", encoding="utf-8") as file:
+                    count = sum(1 for _ in file)
+            self._pending_counts[month] = count
+        return self._pending_counts[month]
+
+    def compact(self, month: str):
+        """Merge the pending events of a month into the month file."""
+        frame = self.read_month(month)
+        arrays = {"timestamp": frame["timestamp"].to_numpy("datetime64[s]")}
+        for column in TEXT_COLUMNS:
+            values = frame[column].astype("category")
+            arrays[f"{column}_codes"] = values.cat.codes.to_numpy(numpy.int32)
+            arrays[f"{column}_categories"] = numpy.array(
+                values.cat.categories, dtype=str
+            )
+        for column in NUMBER_COLUMNS:
+            arrays[column] = frame[column].to_numpy(numpy.int32)
+
+        temp_path = f"{self.month_path(month)}.tmp"
+        with open(temp_path, "wb") as file:
+            numpy.savez_compressed(file, **arrays)
+        os.replace(temp_path, self.month_path(month))
+        if os.path.exists(self.pending_path(month)):
+            os.remove(self.pending_path(month))
+        self._pending_counts[month] = 0
+        backend_logger.debug(f"Compacted {len(frame)} metric event(s) for {month}.")
+
+    def _read_month_file(self, month: str) -> pandas.DataFrame:
+        path = self.month_path(month)
+        if not os.path.exists(path):
+            return empty_frame()
+        modified = os.path.getmtime(path)
+        cached = self._cache.get(month)
+        if cached is not None and cached[0] == modified:
+            return cached[1]
+
+        with numpy.load(path, allow_pickle=False) as arrays:
+            data = {"timestamp": arrays["timestamp"]}
+            for column in TEXT_COLUMNS:
+                data[column] = pandas.Categorical.from_codes(
+                    arrays[f"{column}_codes"], arrays[f"{column}_categories"]
+                )
+            for column in NUMBER_COLUMNS:
+                data[column] = arrays[column]
+        frame = pandas.DataFrame(data)
+        self._cache[month] = (modified, frame)
+        return frame
+
+    def _read_pending_file(self, month: str) -> pandas.DataFrame:
+        path = self.pending_path(month)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return empty_frame()
+        frame = pandas.read_csv(
+            path,
+            names=COLUMNS,
+            dtype={column: str for column in TEXT_COLUMNS},
+            keep_default_na=False,
+            on_bad_lines="warn",
+        )
+        frame["timestamp"] = pandas.to_datetime(frame["timestamp"], errors="coerce")
+        for column in NUMBER_COLUMNS:
+            frame[column] = pandas.to_numeric(frame[column], errors="coerce")
+        # A line cut short by a crash is missing values, drop it.
+        frame = frame.dropna()
+        frame["timestamp"] = frame["timestamp"].astype("datetime64[s]")
+        for column in TEXT_COLUMNS:
+            frame[column] = frame[column].astype("category")
+        for column in NUMBER_COLUMNS:
+            frame[column] = frame[column].astype(numpy.int32)
+        return frame
+
+    def read_month(self, month: str) -> pandas.DataFrame:
+        return concat_frames(
+            [self._read_month_file(month), self._read_pending_file(month)]
+        )
+
+    def read(self, start: datetime.date, end: datetime.date) -> pandas.DataFrame:
+        """Read the events from the start day up to and including the end day."""
+        first, last = month_key(start), month_key(end)
+        frame = concat_frames(
+            [
+                self.read_month(month)
+                for month in self.months()
+                if first <= month <= last
+            ]
+        )
+        timestamps = frame["timestamp"].to_numpy("datetime64[s]")
+        in_range = (timestamps >= numpy.datetime64(start, "s")) & (
+            timestamps < numpy.datetime64(end + datetime.timedelta(days=1), "s")
+        )
+        if in_range.all():
+            return frame
+        return frame[in_range].reset_index(drop=True)
+
+
+def shift_columns(
+    timestamps: pandas.Series, shifts: dict[str, int] = SHIFTS
+) -> tuple[pandas.Series, pandas.Series]:
+    """Get the day and name of the shift each timestamp falls in. Time after
+    midnight, before the first shift starts, belongs to the last shift of the
+    day before."""
+    ordered = sorted(shifts.items(), key=lambda item: item[1])
+    names = numpy.array([name for name, _ in ordered])
+    start_hours = numpy.array([hour for _, hour in ordered])
+    index = numpy.searchsorted(start_hours, timestamps.dt.hour.to_numpy(), "right")
+    # Index -1, before the first shift, wraps around to the last shift.
+    shift = pandas.Categorical.from_codes((index - 1) % len(names), names)
+    day = (timestamps - pandas.Timedelta(hours=int(start_hours[0]))).dt.floor("D")
+    return day, pandas.Series(shift, index=timestamps.index)
+
+
+def rollup(
+    frame: pandas.DataFrame, keys: list[str], shifts: dict[str, int] = SHIFTS
+) -> pandas.DataFrame:
+    """Total the lines, bundles and wires printed for each group.
+
+    Args:
+        frame (pandas.DataFrame): Events, as read from a MetricsStore.
+        keys (list[str]): What to group by, from ROLLUP_KEYS.
+        shifts (dict[str, int]): Shift name: start hour.
+
+    Returns:
+        pandas.DataFrame: A column per key, then the ROLLUP_TOTALS columns.
+    """
+    groups = {}  # type: dict[str, pandas.Series]
+    for key in keys:
+        if key == HOUR:
+            groups[HOUR] = frame["timestamp"].dt.floor("h")
+        elif key == DAY:
+            groups[DAY] = frame["timestamp"].dt.floor("D")
+        elif key == SHIFT:
+            groups[DAY], groups[SHIFT] = shift_columns(frame["timestamp"], shifts)
+        elif key == OPERATOR:
+            groups[OPERATOR] = frame["operator"]
+        elif key == CUSTOMER:
+            groups[CUSTOMER] = frame["customer"]
+        elif key == PART_NUMBER:
+            groups[PART_NUMBER] = frame["part_number"]
+        elif key == WIRE:
+            groups["Gauge"] = frame["gauge"]
+            groups["Type"] = frame["wire_type"]
+        else:
+            raise ValueError(f"Unknown rollup key: {key}")
+
+    grouped = frame[NUMBER_COLUMNS].groupby(
+        [series.rename(name) for name, series in groups.items()],
+        observed=True,
+        sort=True,
+    )
+    result = grouped.agg(
+        Lines=("copies", "size"), Bundles=("copies", "sum"), Wires=("wires", "sum")
+    )
+    return result.reset_index()
@@ -0,0 +1,227 @@
+"""Module to print to networked label printers listening on a raw TCP port.
+Labels are drawn from the `.label` template and sent as ZPL graphics."""
+
+from __future__ import annotations
+import os
+import socket
+import logging
+import threading
+from PyQt5 import QtCore, QtGui
+
+from errors import *
+from label import Label, LabelTemplate
+from labelrenderer import LabelRenderer
+from printerpool import PrinterBackend, PrintJob
+from renderpool import RenderEngine, RenderTask, default_render_engine
+from templateregistry import TemplateRegistry
+
+backend_logger = logging.getLogger("backend")
+
+RAW_PRINT_PORT = 9100
+MAX_WRITE_SIZE = 1024 * 1024  # Bytes of ZPL sent per write.
+
+# Swaps black and white in a row of 1 bit pixels.
+_INVERT_BITS = bytes(255 - value for value in range(256))
+
+
+def image_to_zpl(image: QtGui.QImage, copies: int = 1) -> bytes:
+    """Convert a rendered label to a ZPL label format printing it as a graphic."""
+    mono = image.convertToFormat(
+        QtGui.QImage.Format_Mono, QtCore.Qt.ThresholdDither | QtCore.Qt.MonoOnly
+    )
+    width, height = mono.width(), mono.height()
+    bytes_per_row = (width + 7) // 8
+    bits = mono.constBits()
+    bits.setsize(mono.bytesPerLine() * height)
+    data = bits.asstring()
+
+    # ZPL expects 1 to be a black dot.
+    black_index = 0 if QtGui.QColor(mono.color(0)).lightness() < 128 else 1
+    rows = []
+    for row in range(height):
+        start = row * mono.bytesPerLine()
+        row_bits = data[start : start + bytes_per_row]
+        if black_index == 0:
+            row_bits = row_bits.translate(_INVERT_BITS)
+        rows.append(row_bits)
+    graphic = b"".join(rows)
+
+    total = len(graphic)
+    return (
+        f"^XA^PW{width}^LL{height}^FO0,0"
+        f"^GFA,{total},{total},{bytes_per_row},{graphic.hex().upper()}^FS"
+        f"^PQ{copies}^XZ\n"
+    ).encode("ascii")
+
+
+class ConnectionPool:
+    """Keeps one open socket per printer address."""
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._sockets = {}  # type: dict[tuple[str, int], socket.socket]
+        self._lock = threading.Lock()
+
+    def get(self, address: tuple[str, int]) -> socket.socket:
+        """Get the open socket for an address, connecting if needed."""
+        with self._lock:
+            connection = self._sockets.get(address)
+            if connection is None:
+                backend_logger.debug(f"Connecting to printer at {address}")
+                connection = self.connect(address)
+                self._sockets[address] = connection
+            return connection
+
+    def connect(self, address: tuple[str, int]) -> socket.socket:
+        """Open a new connection to a printer."""
+        connection = socket.create_connection(address, timeout=self.timeout)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connection
+
+    def discard(self, address: tuple[str, int]):
+        """Close the socket for an address, the next get will reconnect."""
+        with self._lock:
+            connection = self._sockets.pop(address, None)
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        for address in list(self._sockets):
+            self.discard(address)
+
+
+default_connection_pool = ConnectionPool()
+
+
+class NetworkLabelPrinter(PrinterBackend):
+    """A label printer that accepts ZPL on a raw TCP port."""
+
+    streams = True  # Writes block while the printer's buffer is full.
+
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        port: int = RAW_PRINT_PORT,
+        template_registry: TemplateRegistry = None,
+        dpi: int = 203,
+        connection_pool: ConnectionPool = None,
+        render_engine: RenderEngine = None,
+    ):
+        self.name = name
+        self.address = (host, port)
+        self.template_registry = template_registry
+        self.dpi = dpi
+        self.connection_pool = connection_pool or default_connection_pool
+        self.render_engine = render_engine or default_render_engine
+        self._renderers = {}  # type: dict[int, LabelRenderer]
+
+    def get_template(self, label: Label) -> LabelTemplate:
+        template_name = os.path.splitext(os.path.basename(label.file_path))[0]
+        return self.template_registry.get(template_name)
+
+    def render(self, label: Label, copies: int = 1) -> bytes:
+        """Render a label to ZPL."""
+        template = self.get_template(label)
+        renderer = self._renderers.get(id(template))
+        if renderer is None:
+            renderer = LabelRenderer(template, self.dpi)
+            self._renderers = {id(template): renderer}
+        return image_to_zpl(renderer.render(label.fields), copies)
+
+    def print(self, label: Label, copies: int = 1):
+        self.send(self.render(label, copies))
+
+    def print_many(self, jobs: list[PrintJob]):
+        """Render every job and send them in as few writes as possible. Large
+        batches are rendered by the render engine's workers while the labels
+        already rendered are sent. Jobs are marked printed once they are sent."""
+        tasks = [
+            RenderTask(
+                self.get_template(job.label), self.dpi, job.label.fields, job.copies
+            )
+            for job in jobs
+        ]
+        buffer = []
+        buffered_jobs = []
+        size = 0
+        for job, data in zip(jobs, self.render_engine.render_many(tasks, image_to_zpl)):
+            buffer.append(data)
+            buffered_jobs.append(job)
+            size += len(data)
+            if size >= MAX_WRITE_SIZE:
+                self.send_jobs(buffer, buffered_jobs)
+                buffer, buffered_jobs, size = [], [], 0
+        if buffer:
+            self.send_jobs(buffer, buffered_jobs)
+
+    def send_jobs(self, buffer: list[bytes], jobs: list[PrintJob]):
+        """Send the data of each job in one write. A job is printed once all
+        of its bytes are written, so if the write fails part way the jobs
+        written before stay printed and only the rest are sent again."""
+        try:
+            self.send(b"".join(buffer))
+        except PrinterSendError as error:
+            sent = error.sent
+            for job, data in zip(jobs, buffer):
+                if sent < len(data):
+                    break
+                job.mark_printed(self.name)
+                sent -= len(data)
+            raise
+        for job in jobs:
+            job.mark_printed(self.name)
+
+    def send(self, data: bytes):
+        """Write to the printer. A connection lost before any of the data was
+        written is reconnected once. Once part of it was written it is never
+        sent again, the printer may have printed it already.
+
+        Raises:
+            PrinterSendError: With the bytes written before the failure.
+        """
+        view = memoryview(data)
+        sent = 0
+        for attempt in range(2):
+            try:
+                connection = self.connection_pool.get(self.address)
+                while sent < len(view):
+                    sent += connection.send(view[sent:])
+                return
+            except OSError as error:
+                self.connection_pool.discard(self.address)
+                if attempt or sent:
+                    raise PrinterSendError(
+                        f"Could not send to printer {self.name} at {self.address}, "
+                        f"{sent} of {len(data)} bytes sent: {error}",
+                        sent,
+                    ) from error
+                backend_logger.warning(
+                    f"Lost connection to printer {self.name}, reconnecting."
+                )
+
+    def health_check(self) -> bool:
+        try:
+            self.connection_pool.discard(self.address)
+            self.connection_pool.get(self.address)
+        except OSError as error:
+            backend_logger.error(f"Printer {self.name} is not reachable: {error}")
+            return False
+        return True
+
+    @staticmethod
+    def from_setting(
+        name: str,
+        value: str,
+        template_registry: TemplateRegistry,
+        render_engine: RenderEngine = None,
+    ) -> NetworkLabelPrinter:
+        """Create a printer from a `host` or `host:port` setting value."""
+        host, _, port = value.partition(":")
+        return NetworkLabelPrinter(
+            name,
+            host,
+            int(port or RAW_PRINT_PORT),
+            template_registry,
+            render_engine=render_engine,
+        )
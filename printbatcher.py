@@ -0,0 +1,313 @@
+"""Module to size print batches from the measured speed of each printer.
+
+The labels sent to a printer are split into batches, each sent as one print
+job. Sending a batch costs a fixed time for the job plus a time for each label,
+both learned from the batches already sent. If the printer can report the
+labels waiting in its queue, the rate it prints them is learned as well.
+
+Batches are sized to hold about PRINT_BATCH_TARGET_SECONDS of labels, so the
+cost of a job is spread over many labels. The next batch is only sent once the
+printer has less than PRINT_MAX_QUEUE_SECONDS of labels waiting. The printer
+always has labels waiting, but its buffer and the spooler are never flooded.
+The first batch is one label and each batch is at most twice the size of the
+last, until the printer's speed is known."""
+
+from __future__ import annotations
+import math
+import time
+import logging
+from typing import Callable, Iterator
+
+from errors import *
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+MIN_WAIT_SECONDS = 0.001  # Shorter waits are not worth it.
+# Labels to see printed for a measurement of the rate. A queue counts whole
+# labels, so over fewer the rate is off by too much.
+MIN_DRAINED_LABELS = 10
+
+
+class AdaptiveBatcher:
+    """Learns how fast a printer prints and sizes the batches sent to it.
+
+    Args:
+        name (str): The printer name.
+        target_seconds (float): Seconds of labels in a batch.
+        max_queue_seconds (float): Most seconds of labels left waiting at the
+            printer before the next batch is sent.
+        max_batch_labels (int): Most labels in a batch.
+        smoothing (float): Weight of the newest measurement, 0 to 1.
+        poll_seconds (float): Most seconds between checks of a queue.
+        max_wait_seconds (float): Most seconds to wait for a queue to drain.
+        clock (Callable[[], float]): Seconds, for measuring.
+        sleep (Callable[[float], None]): Waits for the printer's queue to drain.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        target_seconds: float = PRINT_BATCH_TARGET_SECONDS,
+        max_queue_seconds: float = PRINT_MAX_QUEUE_SECONDS,
+        max_batch_labels: int = PRINT_MAX_BATCH_LABELS,
+        smoothing: float = PRINT_LATENCY_SMOOTHING,
+        poll_seconds: float = PRINT_QUEUE_POLL_SECONDS,
+        max_wait_seconds: float = PRINT_MAX_QUEUE_WAIT_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.name = name
+        self.target_seconds = target_seconds
+        self.max_queue_seconds = max_queue_seconds
+        self.max_batch_labels = max_batch_labels
+        self.smoothing = smoothing
+        self.poll_seconds = poll_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+        self.batch_labels = 1  # Labels in the next batch.
+        self.job_seconds = 0.0  # Fixed time to send a batch.
+        self.label_seconds = None  # type: float # Time to send each label.
+        self.drain_rate = None  # type: float # Labels per second, from the queue.
+        self.batches = 0
+        self.labels = 0
+        self.send_seconds = 0.0  # Spent sending batches.
+        self.wait_seconds = 0.0  # Spent waiting for the queue to drain.
+        self.queued = None  # type: int # Labels waiting, when last checked.
+
+        # Exponentially weighted sums of (labels, seconds) of each batch, to
+        # fit seconds = job_seconds + label_seconds * labels.
+        self._weight = 0.0
+        self._sum_labels = 0.0
+        self._sum_seconds = 0.0
+        self._sum_labels_squared = 0.0
+        self._sum_labels_seconds = 0.0
+
+        # Queue checks, to measure the drain rate.
+        self._checked_at = None  # type: float
+        self._checked_queue = None  # type: int
+        self._sent_since_check = 0
+        # Queue estimate, for printers that can not report their queue.
+        self._estimated_queue = 0.0
+        self._estimated_at = None  # type: float
+
+    @property
+    def seconds_per_label(self) -> float:
+        """Time the printer takes for each label, the slower of the time to
+        send one and the time to print one. None until a batch is sent."""
+        if self.label_seconds is None:
+            return None
+        if self.drain_rate:
+            return max(self.label_seconds, 1 / self.drain_rate)
+        return self.label_seconds
+
+    @property
+    def labels_per_second(self) -> float:
+        seconds = self.seconds_per_label
+        return 1 / seconds if seconds else None
+
+    def batches_of(
+        self,
+        jobs: list,
+        queued_labels: Callable[[], int] = None,
+        split: bool = True,
+        interrupted: Callable[[], bool] = None,
+    ) -> Iterator[list]:
+        """Split print jobs into batches, waiting before each one until the
+        printer has room. Each batch is timed from when it is yielded until
+        the next one is asked for, so it must be sent in between.
+
+        Args:
+            jobs (list[PrintJob]): The jobs, with the copies of each.
+            queued_labels (Callable[[], int]): Labels waiting at the printer,
+                or None if it can not tell.
+            split (bool): If False, all the jobs are one batch. It is still
+                timed, to learn the printer's speed.
+            interrupted (Callable[[], bool]): True once printing should stop.
+
+        Raises:
+            PrintInterruptedError: If interrupted before a batch.
+            PrinterQueueTimeoutError: If the printer's queue does not drain.
+        """
+        start = 0
+        while start < len(jobs):
+            self.wait_for_room(queued_labels, interrupted)
+            end = start + 1
+            labels = jobs[start].copies
+            while end < len(jobs) and (
+                not split or labels + jobs[end].copies <= self.batch_labels
+            ):
+                labels += jobs[end].copies
+                end += 1
+            sent_at = self.clock()
+            yield jobs[start:end]
+            self.record(labels, self.clock() - sent_at)
+            start = end
+
+    def wait_for_room(
+        self,
+        queued_labels: Callable[[], int] = None,
+        interrupted: Callable[[], bool] = None,
+    ):
+        """Wait until the printer has less than max_queue_seconds of labels
+        waiting. A printer that reports its queue is checked again every
+        poll_seconds, and until the rate it prints is measured, only one
+        batch is left waiting.
+
+        Raises:
+            PrintInterruptedError: If interrupted returns True.
+            PrinterQueueTimeoutError: If the queue is still full after
+                max_wait_seconds.
+        """
+        self._check_interrupted(interrupted)
+        if self.seconds_per_label is None:
+            return
+        waited = 0.0
+        while True:
+            queued, reported = self._check_queue(queued_labels)
+            seconds_per_label = self.seconds_per_label
+            if reported and self.drain_rate is None:
+                wait = self.poll_seconds if queued > self.batch_labels else 0
+            else:
+                wait = queued * seconds_per_label - self.max_queue_seconds
+            if wait < MIN_WAIT_SECONDS:
+                return
+            if waited >= self.max_wait_seconds:
+                raise PrinterQueueTimeoutError(
+                    f"Printer {self.name} still has {queued:.0f} label(s) waiting "
+                    f"after {waited:.0f}s."
+                )
+            if reported:
+                wait = min(wait, self.poll_seconds)
+            backend_logger.debug(
+                f"Printer {self.name} has {queued:.0f} label(s) waiting, waiting {wait:.2f}s."
+            )
+            waited += self._sleep(wait, interrupted)
+            if not reported:
+                return
+
+    def _sleep(self, seconds: float, interrupted: Callable[[], bool] = None) -> float:
+        """Sleep, checking for an interruption every poll_seconds. Returns
+        the seconds slept."""
+        slept = 0.0
+        while slept < seconds:
+            wait = min(seconds - slept, self.poll_seconds)
+            self.sleep(wait)
+            self.wait_seconds += wait
+            slept += wait
+            self._check_interrupted(interrupted)
+        return slept
+
+    @staticmethod
+    def _check_interrupted(interrupted: Callable[[], bool] = None):
+        if interrupted is not None and interrupted():
+            raise PrintInterruptedError("Printing was stopped.")
+
+    def _check_queue(
+        self, queued_labels: Callable[[], int] = None
+    ) -> tuple[float, bool]:
+        """Labels waiting at the printer, and if the printer reported them or
+        they are estimated. A printer busy since the last check gives a
+        measurement of its rate."""
+        now = self.clock()
+        queued = queued_labels() if queued_labels is not None else None
+        if queued is None:
+            return self._estimate_queue(now), False
+
+        self.queued = queued
+        if self._checked_queue and queued:  # Busy since the last check.
+            drained = self._checked_queue + self._sent_since_check - queued
+            if drained < MIN_DRAINED_LABELS:
+                return queued, True  # Keep measuring from the last check.
+            elapsed = now - self._checked_at
+            self.drain_rate = self._smooth(self.drain_rate, drained / elapsed)
+        self._checked_at = now
+        self._checked_queue = queued
+        self._sent_since_check = 0
+        return queued, True
+
+    def record(self, labels: int, seconds: float):
+        """Learn from a batch sent, and size the next one."""
+        self.batches += 1
+        self.labels += labels
+        self.send_seconds += seconds
+        self._sent_since_check += labels
+
+        decay = 1 - self.smoothing
+        self._weight = self._weight * decay + 1
+        self._sum_labels = self._sum_labels * decay + labels
+        self._sum_seconds = self._sum_seconds * decay + seconds
+        self._sum_labels_squared = self._sum_labels_squared * decay + labels * labels
+        self._sum_labels_seconds = self._sum_labels_seconds * decay + labels * seconds
+        self._fit()
+
+        now = self.clock()
+        self._estimated_queue = self._estimate_queue(now) + labels
+        self._estimated_at = now
+
+        self.batch_labels = min(self.ideal_batch_labels(), self.batch_labels * 2)
+        if self.queued is not None and self.drain_rate is None:
+            # Not enough printed yet to know how fast the printer prints.
+            self.batch_labels = min(self.batch_labels, MIN_DRAINED_LABELS)
+        backend_logger.debug(
+            f"Printer {self.name} sent {labels} label(s) in {seconds:.3f}s, "
+            f"next batch {self.batch_labels}."
+        )
+
+    def _estimate_queue(self, now: float) -> float:
+        """Labels sent that the printer has not had time to print yet."""
+        seconds_per_label = self.seconds_per_label
+        if self._estimated_at is None or not seconds_per_label:
+            return 0.0
+        elapsed = now - self._estimated_at
+        return max(0.0, self._estimated_queue - elapsed / seconds_per_label)
+
+    def _fit(self):
+        """Fit the job and label times to the batches sent. With batches all
+        the same size, the whole time is put on the labels."""
+        mean_labels = self._sum_labels / self._weight
+        mean_seconds = self._sum_seconds / self._weight
+        variance = self._sum_labels_squared / self._weight - mean_labels**2
+        covariance = (
+            self._sum_labels_seconds / self._weight - mean_labels * mean_seconds
+        )
+        slope = covariance / variance if variance > 1e-9 else 0.0
+        intercept = mean_seconds - slope * mean_labels
+        if slope <= 0 or intercept < 0:
+            slope, intercept = mean_seconds / mean_labels, 0.0
+        self.label_seconds = slope
+        self.job_seconds = intercept
+
+    def _smooth(self, average: float, value: float) -> float:
+        if average is None:
+            return value
+        return average + self.smoothing * (value - average)
+
+    def ideal_batch_labels(self) -> int:
+        """Labels that take target_seconds to print."""
+        seconds_per_label = self.seconds_per_label
+        if not seconds_per_label:
+            return self.max_batch_labels
+        labels = math.floor(self.target_seconds / seconds_per_label)
+        return max(1, min(self.max_batch_labels, labels))
+
+    def diagnostics(self) -> dict:
+        """What has been learned about the printer, for display."""
+        return {
+            "Printer": self.name,
+            "Labels/s": _round(self.labels_per_second, 2),
+            "Job ms": _round(self.job_seconds * 1000, 1),
+            "Label ms": _round(self.label_seconds and self.label_seconds * 1000, 1),
+            "Printed/s": _round(self.drain_rate, 2),
+            "Batch": self.batch_labels,
+            "Queued": self.queued,
+            "Batches": self.batches,
+            "Labels": self.labels,
+            "Waited s": round(self.wait_seconds, 1),
+        }
+
+
+def _round(value: float, digits: int) -> float:
+    return None if value is None else round(value, digits)
@@ -1,8 +1,11 @@
 from __future__ import annotations
 from win32com.client import Dispatch
 
+import os
 import logging
+import itertools
 import utilities
+from typing import Iterator
 from errors import *
 from label import Label
 
@@ -10,22 +13,23 @@ backend_logger = logging.getLogger("backend")
 
 
 class DymoLabelPrinter:
-    def __init__(self) -> object:
+    def __init__(self, printer_engine=None, label_engine=None) -> object:
+        """The Dymo COM objects are created unless engines are passed in."""
         self.printer_name = None
         self.label_file_path = None
+        self.label_file_mtime = None
         self.is_open = False
 
         try:
-            self.printer_engine = Dispatch("Dymo.DymoAddIn")
-            self.label_engine = Dispatch("Dymo.DymoLabels")
+            self.printer_engine = printer_engine or Dispatch("Dymo.DymoAddIn")
+            self.label_engine = label_engine or Dispatch("Dymo.DymoLabels")
         except Exception as error:
             if error.strerror == "Invalid class string":
                 raise MissingRequiredSoftwareError(
                     "Missing required software program. Please install DLS8Setup.8.7.exe."
                 )
 
-        printers = self.printer_engine.GetDymoPrinters()
-        self.PRINTERS = [printer for printer in printers.split("|") if printer]
+        self.PRINTERS = self.get_printers()
         backend_logger.info(f"Printers: {self.PRINTERS}")
 
     def __enter__(self):
@@ -36,12 +40,38 @@ class DymoLabelPrinter:
         return self.printer_engine
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        """End the print job. An error in the job is raised to the caller, so
+        the label is not taken as printed. An error ending the job after a
+        failure is only logged, so it does not hide the first one."""
         backend_logger.debug("Ending print job.")
-        if exc_type is not None:
-            backend_logger.exception(
-                f"Exception occurred during print job. Exception: {exc_tb}"
-            )
-        self.printer_engine.EndPrintJob()
+        if exc_type is None:
+            self.printer_engine.EndPrintJob()
+            return
+        backend_logger.error(
+            f"Print job failed: {exc_val}", exc_info=(exc_type, exc_val, exc_tb)
+        )
+        self.end_failed_job()
+
+    def end_failed_job(self) -> bool:
+        """End a print job after an error. Returns False if it could not be
+        ended, otherwise the labels added before the error are printed."""
+        try:
+            self.printer_engine.EndPrintJob()
+        except Exception as error:
+            backend_logger.error(f"Could not end the failed print job: {error}")
+            return False
+        return True
+
+    def get_printers(self) -> list[str]:
+        """Get the names of all Dymo printers installed."""
+        printers = self.printer_engine.GetDymoPrinters()
+        return [printer for printer in printers.split("|") if printer]
+
+    def is_printer_online(self, printer_name: str) -> bool:
+        """Check if a printer is still installed and online."""
+        if printer_name not in self.get_printers():
+            return False
+        return bool(self.printer_engine.IsPrinterOnline(printer_name))
 
     def set_printer(self, printer_name: str):
         """Set the printer to use for printing."""
@@ -54,7 +84,8 @@ class DymoLabelPrinter:
     def print(self, label: Label, copies: int = 1):
         """Prints a label. This will set the file to what is defined in the label.
         Then it will set the fields to the values in the label."""
-        self.register_label_file(label.file_path)
+        if self.label_file_changed(label.file_path):
+            self.register_label_file(label.file_path)
 
         for field, text in label.fields.items():
             self.set_field(field, text)
@@ -63,13 +94,58 @@ class DymoLabelPrinter:
             backend_logger.debug(f"Printing {copies} copies.")
             printer.Print(copies, False)
 
+    def print_many(self, labels: list[tuple[Label, int]]) -> Iterator[int]:
+        """Print labels and their copies as one print job, instead of a job
+        for each. Labels of another file start a new job. Yields the index of
+        each label of a job once the job has ended, so if ending it fails none of
+        its labels are taken as printed. If a label fails, the job is still
+        ended and the labels added before it are yielded before the error is
+        raised, as they print with the job."""
+        index = 0
+        for file_path, group in itertools.groupby(
+            labels, key=lambda item: item[0].file_path
+        ):
+            if self.label_file_changed(file_path):
+                self.register_label_file(file_path)
+            job_indexes = []
+            printer = self.__enter__()
+            try:
+                for label, copies in group:
+                    for field, text in label.fields.items():
+                        self.set_field(field, text)
+                    backend_logger.debug(f"Printing {copies} copies.")
+                    printer.Print(copies, False)
+                    job_indexes.append(index)
+                    index += 1
+            except Exception as error:
+                backend_logger.exception(f"Print job failed: {error}")
+                if self.end_failed_job():
+                    yield from job_indexes
+                raise
+            self.__exit__(None, None, None)
+            yield from job_indexes
+
     def set_field(self, field_name: str, field_value):
         """Set a field of the label."""
         backend_logger.debug(f"Setting field: {field_name} to: {field_value}")
         self.label_engine.SetField(field_name, field_value)
 
+    def label_file_changed(self, label_file_path: str) -> bool:
+        """Check if the label file needs to be opened by the Dymo engine.
+        Either a different file or the open file was modified since opening."""
+        if not self.is_open or label_file_path != self.label_file_path:
+            return True
+        try:
+            return os.path.getmtime(label_file_path) != self.label_file_mtime
+        except OSError:
+            return True
+
     def register_label_file(self, label_file_path: str) -> object:
         self.label_file_path = label_file_path
+        try:
+            self.label_file_mtime = os.path.getmtime(label_file_path)
+        except OSError:
+            self.label_file_mtime = None
         self.is_open = self.printer_engine.Open(label_file_path)
         if not self.is_open:
             backend_logger.error(f"Could not open label file: {label_file_path}")
@@ -0,0 +1,434 @@
+"""Module to spread print jobs across several label printers.
+
+The jobs sent to a printer are split into batches sized by its
+AdaptiveBatcher, from how fast it was measured to print.
+
+Each print job has an ID and an outcome. A backend marks each job printed as
+soon as it is sent, so when a batch fails part way only the jobs not printed
+are retried. Failed jobs are retried with a growing delay, and can be passed
+to the pool again later, jobs already printed are skipped."""
+
+from __future__ import annotations
+import time
+import uuid
+import logging
+import itertools
+import threading
+import contextlib
+from dataclasses import dataclass, field
+from typing import Callable
+
+try:
+    import win32print
+except ImportError:  # Not on Windows, Dymo queues can not be read.
+    win32print = None
+
+from errors import *
+from fieldformulas import LabelFieldsFunction
+from label import Label
+from printbatcher import AdaptiveBatcher
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+PENDING = "pending"
+PRINTED = "printed"
+FAILED = "failed"
+
+ROUND_ROBIN = "round_robin"
+LEAST_LOADED = "least_loaded"
+SCHEDULERS = [ROUND_ROBIN, LEAST_LOADED]
+
+
+class PrinterBackend:
+    """Base class for a single printer that can be added to a PrinterPool."""
+
+    name = ""
+    # Sends all the jobs given as a stream, held back by the printer, instead
+    # of in batches sized by the pool.
+    streams = False
+
+    def print(self, label: Label, copies: int = 1):
+        """Print copies of a label. Raise an exception on failure."""
+        raise NotImplementedError
+
+    def print_many(self, jobs: list[PrintJob]):
+        """Print several jobs, marking each one printed as soon as it is sent.
+        Backends that can send many labels at once should override this."""
+        for job in jobs:
+            self.print(job.label, job.copies)
+            job.mark_printed(self.name)
+
+    def health_check(self) -> bool:
+        """Check if the printer is able to print."""
+        return True
+
+    def queued_labels(self) -> int:
+        """Labels sent but not printed yet, or None if it can not tell."""
+        return None
+
+
+class DymoPrinterBackend(PrinterBackend):
+    """A single Dymo printer, printed to through a shared DymoLabelPrinter.
+    The Dymo COM objects can only be called from the thread that created
+    them, so a thread printing in the background uses its own printer, set
+    with `thread_printer`."""
+
+    thread = threading.local()
+
+    def __init__(self, dymo_printer, printer_name: str):
+        self._dymo_printer = dymo_printer  # type: DymoLabelPrinter
+        self.name = printer_name
+
+    @property
+    def dymo_printer(self):
+        return getattr(self.thread, "dymo_printer", None) or self._dymo_printer
+
+    @classmethod
+    @contextlib.contextmanager
+    def thread_printer(cls, dymo_printer):
+        """Print through dymo_printer on this thread, instead of the shared one."""
+        cls.thread.dymo_printer = dymo_printer
+        try:
+            yield
+        finally:
+            cls.thread.dymo_printer = None
+
+    def print(self, label: Label, copies: int = 1):
+        self.dymo_printer.set_printer(self.name)
+        self.dymo_printer.print(label, copies)
+
+    def print_many(self, jobs: list[PrintJob]):
+        """Print the jobs as one spooler job."""
+        self.dymo_printer.set_printer(self.name)
+        labels = [(job.label, job.copies) for job in jobs]
+        for index in self.dymo_printer.print_many(labels):
+            jobs[index].mark_printed(self.name)
+
+    def health_check(self) -> bool:
+        return self.dymo_printer.is_printer_online(self.name)
+
+    def queued_labels(self) -> int:
+        """Labels in the printer's Windows print queue."""
+        if win32print is None:
+            return None
+        try:
+            handle = win32print.OpenPrinter(self.name)
+            try:
+                jobs = win32print.EnumJobs(handle, 0, -1, 1)
+            finally:
+                win32print.ClosePrinter(handle)
+        except Exception as error:
+            backend_logger.debug(f"Could not read print queue of {self.name}: {error}")
+            return None
+        return sum(max(0, job["TotalPages"] - job["PagesPrinted"]) for job in jobs)
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+@dataclass
+class PrintJob:
+    """Copies of a label to print as one job."""
+
+    label: Label
+    copies: int = 1
+    printer_name: str = None  # Set to the printer that printed the job.
+    error: Exception = None
+    job_id: str = field(default_factory=new_job_id)
+    status: str = PENDING  # PENDING, PRINTED or FAILED
+    attempts: int = 0  # Times the job was sent to a printer.
+
+    @property
+    def printed(self) -> bool:
+        return self.status == PRINTED
+
+    def mark_printed(self, printer_name: str):
+        self.status = PRINTED
+        self.printer_name = printer_name
+        self.error = None
+
+    def mark_failed(self, error: Exception):
+        self.status = FAILED
+        self.error = error
+
+
+def label_print_jobs(
+    file_path: str,
+    data: list[dict[str, str]],
+    label_fields: LabelFieldsFunction,
+    timestamp: str,
+) -> list[PrintJob]:
+    """Build the print job for each wire table row, a label with the row's
+    field values and a copy for each bundle.
+
+    Args:
+        file_path (str): The label file to print.
+        data (list[dict[str, str]]): The wire table rows, keyed by column.
+        label_fields (LabelFieldsFunction): Gets the field values of a row.
+        timestamp (str): Printed on every label.
+    """
+    jobs = []
+    for row in data:
+        label = Label(file_path)
+        for field_name, value in label_fields(row, timestamp).items():
+            label.set_field(field_name, value)
+        jobs.append(PrintJob(label, int(row["Bundles"])))
+    return jobs
+
+
+@dataclass
+class BatchResult:
+    """The outcome of printing a batch of jobs."""
+
+    printed: list[PrintJob] = field(default_factory=list)
+    failed: list[PrintJob] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+@dataclass(eq=False)
+class PooledPrinter:
+    """Tracks the state of a printer in the pool."""
+
+    backend: PrinterBackend
+    in_rotation: bool = True
+    load: int = 0  # Labels sent to this printer.
+    errors: int = 0
+
+
+class PrinterPool:
+    """Spreads print jobs across printers. A printer that fails a job and then
+    fails its health check is taken out of rotation, the job is retried on the
+    remaining printers. Jobs no printer could print are retried after a delay
+    that doubles each time, up to `retries` times.
+
+    Args:
+        retries (int): Times to retry the jobs that failed on every printer.
+        retry_delay (float): Seconds to wait before the first retry.
+        max_retry_delay (float): Most seconds to wait before a retry.
+        sleep (Callable[[float], None]): Waits between retries and batches.
+        clock (Callable[[], float]): Seconds, for measuring printers.
+        batchers (dict[str, AdaptiveBatcher]): Printer name: batcher. Pass the
+            same dict to a new pool to keep what was learned about each printer.
+    """
+
+    def __init__(
+        self,
+        backends: list[PrinterBackend],
+        scheduler: str = LEAST_LOADED,
+        retries: int = PRINT_RETRIES,
+        retry_delay: float = PRINT_RETRY_DELAY,
+        max_retry_delay: float = PRINT_RETRY_MAX_DELAY,
+        sleep=time.sleep,
+        clock=time.monotonic,
+        batchers: dict[str, AdaptiveBatcher] = None,
+    ):
+        if scheduler not in SCHEDULERS:
+            raise ValueError(f"Unknown scheduler: {scheduler}")
+        self.scheduler = scheduler
+        self.printers = [PooledPrinter(backend) for backend in backends]
+        self._round_robin = itertools.cycle(self.printers)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.sleep = sleep
+        self.clock = clock
+        self.batchers = batchers if batchers is not None else {}
+
+    @property
+    def printer_names(self) -> list[str]:
+        return [printer.backend.name for printer in self.printers]
+
+    @property
+    def available(self) -> list[PooledPrinter]:
+        """Printers currently in rotation."""
+        return [printer for printer in self.printers if printer.in_rotation]
+
+    def next_printer(self, exclude: list[PooledPrinter] = None) -> PooledPrinter:
+        """Pick the printer for the next job. Returns None if none are available."""
+        exclude = exclude or []
+        candidates = [printer for printer in self.available if printer not in exclude]
+        if not candidates:
+            return None
+
+        if self.scheduler == LEAST_LOADED:
+            return min(candidates, key=lambda printer: printer.load)
+
+        for printer in self._round_robin:
+            if printer in candidates:
+                return printer
+
+    def check_printers(self) -> list[str]:
+        """Run a health check on printers out of rotation, returning any that
+        are healthy again to rotation. Returns the names of printers in rotation."""
+        for printer in self.printers:
+            if printer.in_rotation:
+                continue
+            if self._health_check(printer):
+                backend_logger.info(f"Printer {printer.backend.name} back in rotation.")
+                printer.in_rotation = True
+        return [printer.backend.name for printer in self.available]
+
+    def print_job(self, job: PrintJob) -> PrintJob:
+        """Print a job on the next available printer, moving on to the other
+        printers if it fails."""
+        self.print_batch([job])
+        return job
+
+    def batcher(self, printer_name: str) -> AdaptiveBatcher:
+        batcher = self.batchers.get(printer_name)
+        if batcher is None:
+            batcher = AdaptiveBatcher(printer_name, clock=self.clock, sleep=self.sleep)
+            self.batchers[printer_name] = batcher
+        return batcher
+
+    def diagnostics(self) -> list[dict]:
+        """What was learned about the speed of each printer in the pool."""
+        return [self.batcher(name).diagnostics() for name in self.printer_names]
+
+    def retry_wait(self, retry: int) -> float:
+        """Seconds to wait before a retry, counting from 1."""
+        return min(self.max_retry_delay, self.retry_delay * 2 ** (retry - 1))
+
+    def print_batch(
+        self, jobs: list[PrintJob], interrupted: Callable[[], bool] = None
+    ) -> BatchResult:
+        """Print every job, continuing on the remaining printers if one fails.
+        The jobs assigned to a printer are sent to it together. Jobs already
+        printed are not sent again, so the failed jobs of a batch can be
+        passed in again as they are.
+
+        Args:
+            jobs (list[PrintJob]): The jobs to print.
+            interrupted (Callable[[], bool]): True once printing should stop.
+                Checked before each batch and while waiting, the jobs not
+                sent yet fail with a PrintInterruptedError.
+        """
+        result = BatchResult()
+        pending = []
+        for job in jobs:
+            if job.printed:
+                backend_logger.info(f"Job {job.job_id} was already printed, skipping.")
+                result.printed.append(job)
+            else:
+                pending.append(job)
+
+        try:
+            for retry in range(self.retries + 1):
+                if not pending:
+                    break
+                if retry:
+                    wait = self.retry_wait(retry)
+                    backend_logger.warning(
+                        f"Retrying {len(pending)} job(s) in {wait:g}s, retry {retry} of {self.retries}."
+                    )
+                    self.sleep(wait)
+                    if interrupted is not None and interrupted():
+                        raise PrintInterruptedError("Printing was stopped.")
+                    self.check_printers()
+                pending = self._print_round(pending, result, interrupted)
+        except PrintInterruptedError as error:
+            result.printed = [job for job in jobs if job.printed]
+            pending = [job for job in jobs if not job.printed]
+            for job in pending:
+                job.error = error
+            backend_logger.warning(f"Printing stopped, {len(pending)} job(s) left.")
+
+        for job in pending:
+            if job.error is None:
+                job.error = NoPrinterAvailableError("No printers available.")
+            job.mark_failed(job.error)
+            result.failed.append(job)
+        return result
+
+    def _print_round(
+        self,
+        jobs: list[PrintJob],
+        result: BatchResult,
+        interrupted: Callable[[], bool] = None,
+    ) -> list[PrintJob]:
+        """Try each job once on every printer in rotation. Returns the jobs
+        no printer could print."""
+        tried = {id(job): [] for job in jobs}  # type: dict[int, list[PooledPrinter]]
+        unprinted = []
+        pending = list(jobs)
+        while pending:
+            assignments = {}  # type: dict[int, tuple[PooledPrinter, list[PrintJob]]]
+            for job in pending:
+                printer = self.next_printer(exclude=tried[id(job)])
+                if printer is None:
+                    backend_logger.error(
+                        f"Could not print job {job.job_id} on any printer. Tried: {[p.backend.name for p in tried[id(job)]]}"
+                    )
+                    unprinted.append(job)
+                    continue
+                printer.load += job.copies
+                tried[id(job)].append(printer)
+                assignments.setdefault(id(printer), (printer, []))[1].append(job)
+
+            pending = []
+            for printer, printer_jobs in assignments.values():
+                self._send(printer, printer_jobs, interrupted)
+                for job in printer_jobs:
+                    if job.printed:
+                        result.printed.append(job)
+                    else:
+                        pending.append(job)
+        return unprinted
+
+    def _send(
+        self,
+        printer: PooledPrinter,
+        jobs: list[PrintJob],
+        interrupted: Callable[[], bool] = None,
+    ):
+        """Send jobs to a printer, in batches sized to its speed. If it fails
+        part way, the jobs sent before the failure stay printed and the rest
+        keep the error. An interruption is raised to the caller."""
+        for job in jobs:
+            job.attempts += 1
+        backend = printer.backend
+        try:
+            for batch in self.batcher(backend.name).batches_of(
+                jobs, backend.queued_labels, not backend.streams, interrupted
+            ):
+                backend.print_many(batch)
+        except PrintInterruptedError:
+            printer.load -= sum(job.copies for job in jobs if not job.printed)
+            raise
+        except Exception as error:
+            printer.errors += 1
+            unprinted = [job for job in jobs if not job.printed]
+            printer.load -= sum(job.copies for job in unprinted)
+            for job in unprinted:
+                job.error = error
+            backend_logger.exception(
+                f"Printer {printer.backend.name} failed to print {len(unprinted)} of {len(jobs)} job(s): {error}"
+            )
+            if not self._health_check(printer):
+                backend_logger.warning(
+                    f"Taking printer {printer.backend.name} out of rotation."
+                )
+                printer.in_rotation = False
+            return
+
+        for job in jobs:
+            if not job.printed:  # Backends that do not mark the jobs they send.
+                job.mark_printed(printer.backend.name)
+        backend_logger.debug(
+            f"Printed {len(jobs)} job(s), {sum(job.copies for job in jobs)} copies on {printer.backend.name}."
+        )
+
+    @staticmethod
+    def _health_check(printer: PooledPrinter) -> bool:
+        try:
+            return bool(printer.backend.health_check())
+        except Exception as error:
+            backend_logger.error(
+                f"Health check failed for printer {printer.backend.name}: {error}"
+            )
+            return False
@@ -0,0 +1,66 @@
+"""Module to keep a journal of the labels printed.
+
+Each print job is appended to a file per day as one JSON line, so a journal
+can be read back line by line no matter how many labels were printed."""
+
+from __future__ import annotations
+import os
+import json
+import logging
+import datetime
+from dataclasses import dataclass, asdict
+from typing import Iterator
+
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+JOURNAL_FILE_EXTENSION = ".jsonl"
+
+
+@dataclass
+class JournalEntry:
+    """A label printed, with the number of copies."""
+
+    printed_at: str  # ISO format
+    station: str
+    printer_name: str
+    job_id: str
+    line: str
+    copies: int
+    barcode: str  # The payload encoded in the labels QR code.
+    print_job_id: str = ""  # ID of the print job.
+
+
+class PrintJournal:
+    """Appends print jobs to a journal file for each day."""
+
+    def __init__(self, folder: str = PRINT_JOURNAL_FOLDER):
+        self.folder = folder
+
+    def file_path(self, day: datetime.date = None) -> str:
+        day = day or datetime.date.today()
+        return os.path.join(self.folder, f"{day:%Y-%m-%d}{JOURNAL_FILE_EXTENSION}")
+
+    def write(self, entries: list[JournalEntry]):
+        """Append entries to todays journal file."""
+        if not entries:
+            return
+        text = "".join(json.dumps(asdict(entry)) + "\n" for entry in entries)
+        with open(self.file_path(), "a", encoding="utf-8") as file:
+            file.write(text)
+
+
+def read_journal(file_path: str) -> Iterator[JournalEntry]:
+    """Read the entries of a journal file. Lines that can not be read,
+    IE. cut short by a crash, are logged and skipped."""
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield JournalEntry(**json.loads(line))
+            except (ValueError, TypeError) as error:
+                backend_logger.warning(
+                    f"Skipping invalid journal line {file_path}:{line_number}: {error}"
+                )
@@ -0,0 +1,186 @@
+"""Module to render labels for raster printers in worker processes.
+
+Drawing a label (text layout, shrink to fit and QR codes) is CPU bound, so a
+large batch is split into chunks that are rendered by a pool of processes.
+Results come back in the order the labels were given. Only a few chunks per
+worker are queued at a time and more are only queued as the printer takes the
+results, so memory stays flat however many labels are printed. Small batches
+are rendered in this process, where starting the workers would cost more than
+it saves."""
+
+from __future__ import annotations
+import os
+import sys
+import math
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Iterator
+from PyQt5 import QtGui
+
+from label import LabelTemplate
+from labelrenderer import LabelRenderer
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+# Turns a rendered label and its copies into the data sent to the printer.
+Encoder = Callable[[QtGui.QImage, int], bytes]
+
+
+@dataclass
+class RenderTask:
+    """A label to render."""
+
+    template: LabelTemplate
+    dpi: int
+    fields: dict[str, str]
+    copies: int = 1
+
+
+# Renderers of the templates used by this process. (file_path, dpi): renderer
+_renderers = {}  # type: dict[tuple[str, int], LabelRenderer]
+_renderers_lock = threading.Lock()  # Labels are rendered on the print thread too.
+_application = None  # type: QtGui.QGuiApplication
+
+
+def _renderer(template: LabelTemplate, dpi: int) -> LabelRenderer:
+    key = (template.file_path, dpi)
+    with _renderers_lock:
+        renderer = _renderers.get(key)
+        if renderer is None or renderer.template != template:
+            renderer = LabelRenderer(template, dpi)
+            _renderers[key] = renderer
+    return renderer
+
+
+def render_chunk(tasks: list[RenderTask], encoder: Encoder) -> list[bytes]:
+    """Render and encode each label. Run in a worker, or in this process."""
+    renderers = [_renderer(task.template, task.dpi) for task in tasks]
+    fields_lists = {}  # type: dict[LabelRenderer, list[dict[str, str]]]
+    for renderer, task in zip(renderers, tasks):
+        fields_lists.setdefault(renderer, []).append(task.fields)
+    for renderer, fields_list in fields_lists.items():
+        renderer.encode_barcodes(fields_list)
+    return [
+        encoder(renderer.render(task.fields), task.copies)
+        for renderer, task in zip(renderers, tasks)
+    ]
+
+
+def _init_worker():
+    """Drawing text needs a QGuiApplication, a worker has no screen to use.
+    Workers leave logging to the main process, which also lets go of the log
+    files so they can be rotated."""
+    for logger in [logging.getLogger()] + [
+        logging.getLogger(name) for name in logging.root.manager.loggerDict
+    ]:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+    if sys.platform != "win32":
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    global _application
+    _application = QtGui.QGuiApplication([])
+
+
+class RenderEngine:
+    """Renders labels, spread over worker processes for large batches.
+
+    Args:
+        workers (int): Worker processes, 0 for one per CPU.
+        chunk_size (int): Most labels sent to a worker at once.
+        chunks_per_worker (int): Chunks queued for each worker ahead of the
+            printer. Bounds the labels rendered but not yet printed.
+        min_parallel_labels (int): Smaller batches are rendered in this process.
+    """
+
+    def __init__(
+        self,
+        workers: int = 0,
+        chunk_size: int = RENDER_CHUNK_SIZE,
+        chunks_per_worker: int = RENDER_CHUNKS_PER_WORKER,
+        min_parallel_labels: int = RENDER_MIN_PARALLEL_LABELS,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.chunks_per_worker = chunks_per_worker
+        self.min_parallel_labels = min_parallel_labels
+        self._executor = None  # type: ProcessPoolExecutor
+
+    @property
+    def max_in_flight(self) -> int:
+        """Most chunks queued at once."""
+        return self.workers * self.chunks_per_worker
+
+    def is_parallel(self, label_count: int) -> bool:
+        return self.workers > 1 and label_count >= self.min_parallel_labels
+
+    def render_many(self, tasks: list[RenderTask], encoder: Encoder) -> Iterator[bytes]:
+        """Render and encode the labels, yielding them in the order given.
+        Labels are rendered ahead of the one yielded, up to max_in_flight
+        chunks. If the workers stop, the rest are rendered in this process."""
+        if not self.is_parallel(len(tasks)):
+            yield from render_chunk(tasks, encoder)
+            return
+
+        # Small enough chunks that every worker gets a few, to even out the load.
+        chunk_size = max(
+            1, min(self.chunk_size, math.ceil(len(tasks) / (self.workers * 4)))
+        )
+        chunks = deque(
+            tasks[start : start + chunk_size]
+            for start in range(0, len(tasks), chunk_size)
+        )
+        pending: deque[tuple[list[RenderTask], Future]] = deque()
+        try:
+            executor = self._get_executor()
+            while chunks or pending:
+                while chunks and len(pending) < self.max_in_flight:
+                    chunk = chunks.popleft()
+                    pending.append(
+                        (chunk, executor.submit(render_chunk, chunk, encoder))
+                    )
+                chunk, future = pending.popleft()
+                try:
+                    results = future.result()
+                except BrokenProcessPool as error:
+                    backend_logger.error(
+                        f"Render workers stopped, rendering in this process: {error}"
+                    )
+                    self.close()
+                    remaining = [chunk] + [chunk for chunk, _ in pending] + list(chunks)
+                    pending.clear()
+                    for chunk in remaining:
+                        yield from render_chunk(chunk, encoder)
+                    return
+                yield from results
+        finally:
+            # The printer failed or stopped taking labels.
+            for _, future in pending:
+                future.cancel()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Workers are started on first use and kept for the next batch."""
+        if self._executor is None:
+            backend_logger.info(f"Starting {self.workers} render worker(s).")
+            # Spawned, as forking a process running Qt is not safe.
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    def close(self):
+        """Stop the workers."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+default_render_engine = RenderEngine()
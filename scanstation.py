@@ -0,0 +1,155 @@
+"""Scan station to check printed labels against the print journal.
+
+Every label printed is indexed by its QR code payload. Scanned payloads are
+looked up in constant time and flagged as duplicates (scanned more times than
+printed) or unknown (never printed). Labels not scanned yet are missing.
+
+A barcode scanner in keyboard wedge mode types the payload followed by enter,
+so scans can be typed into the scan station window, or piped in:
+
+    python scanstation.py "Print Journal/2022-02-03.jsonl" < scans.txt
+"""
+
+from __future__ import annotations
+import sys
+import json
+import argparse
+from collections import Counter
+from dataclasses import dataclass
+
+from printjournal import JournalEntry, PrintJournal, read_journal
+
+MATCHED = "matched"
+DUPLICATE = "duplicate"
+UNKNOWN = "unknown"
+INVALID = "invalid"
+
+
+def payload_key(payload: dict) -> str:
+    """Key that is the same for equal payloads, whatever the key order."""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+def decode_payload(text: str) -> dict:
+    """Decode a scanned QR code payload. Raises ValueError if invalid."""
+    payload = json.loads(text)
+    if not isinstance(payload, dict):
+        raise ValueError(f"Expected a json object, got: {text}")
+    return payload
+
+
+@dataclass(eq=False)
+class ExpectedLabel:
+    """A printed label and the number of times it was scanned."""
+
+    entry: JournalEntry
+    copies: int
+    scanned: int = 0
+
+    @property
+    def missing(self) -> int:
+        return max(self.copies - self.scanned, 0)
+
+
+@dataclass
+class ScanResult:
+    status: str
+    text: str
+    label: ExpectedLabel = None
+
+
+class ScanIndex:
+    """Index of the printed labels by QR code payload."""
+
+    def __init__(self):
+        self.labels = {}  # type: dict[str, ExpectedLabel]
+        self._by_text = {}  # type: dict[str, ExpectedLabel]  # Exact payload.
+        self.printed = 0  # Copies printed.
+        self.matched = 0  # Copies scanned.
+        self.counts = Counter()  # type: Counter[str]
+
+    def add(self, entry: JournalEntry):
+        """Add a printed label. Reprints of the same label add copies."""
+        label = self._by_text.get(entry.barcode)
+        if label is None:
+            try:
+                key = payload_key(decode_payload(entry.barcode))
+            except ValueError:
+                key = entry.barcode
+            label = self.labels.get(key)
+            if label is None:
+                label = ExpectedLabel(entry, 0)
+                self.labels[key] = label
+            self._by_text[entry.barcode] = label
+        label.copies += entry.copies
+        self.printed += entry.copies
+
+    def load(self, file_paths: list[str]) -> ScanIndex:
+        for file_path in file_paths:
+            for entry in read_journal(file_path):
+                self.add(entry)
+        return self
+
+    def scan(self, text: str) -> ScanResult:
+        """Check a scanned payload against the printed labels."""
+        text = text.strip()
+        label = self._by_text.get(text)
+        if label is None:
+            try:
+                label = self.labels.get(payload_key(decode_payload(text)))
+            except ValueError:
+                return self._result(INVALID, text)
+        if label is None:
+            return self._result(UNKNOWN, text)
+
+        label.scanned += 1
+        if label.scanned > label.copies:
+            return self._result(DUPLICATE, text, label)
+        self.matched += 1
+        return self._result(MATCHED, text, label)
+
+    def _result(
+        self, status: str, text: str, label: ExpectedLabel = None
+    ) -> ScanResult:
+        self.counts[status] += 1
+        return ScanResult(status, text, label)
+
+    @property
+    def outstanding(self) -> int:
+        """Copies printed but not scanned yet."""
+        return self.printed - self.matched
+
+    def missing(self) -> list[ExpectedLabel]:
+        """Labels with copies not scanned yet, in print order."""
+        return [label for label in self.labels.values() if label.missing]
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "journals", nargs="*", help="Journal files. Defaults to todays journal."
+    )
+    args = parser.parse_args(argv)
+
+    index = ScanIndex().load(args.journals or [PrintJournal().file_path()])
+    print(f"Loaded {index.printed} printed label(s). Waiting for scans.")
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        result = index.scan(line)
+        if result.status != MATCHED:
+            print(f"{result.status.upper()}: {result.text}")
+
+    print(
+        f"Matched {index.matched}, duplicate {index.counts[DUPLICATE]}, "
+        f"unknown {index.counts[UNKNOWN]}, invalid {index.counts[INVALID]}, "
+        f"missing {index.outstanding}."
+    )
+    for label in index.missing():
+        entry = label.entry
+        print(f"MISSING {label.missing}x: {entry.job_id} line {entry.line}")
+    return 1 if index.outstanding or index.counts[DUPLICATE] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""Module to save the working session, so it can be resumed after a crash.
+
+Changes are appended to a journal file as JSON lines, which is cheap enough to
+do on every print. Every so often the whole state is written to a snapshot
+file and the journal is started over. The state is the snapshot with the
+journal replayed on top of it. Replaying an event twice gives the same state,
+so a crash between writing the snapshot and clearing the journal is safe."""
+
+from __future__ import annotations
+import os
+import json
+import logging
+from dataclasses import dataclass, field, asdict, fields
+
+from settings import *
+
+backend_logger = logging.getLogger("backend")
+
+SNAPSHOT_FILE = "session.json"
+JOURNAL_FILE = "session.jsonl"
+
+# Event types
+LOADED = "loaded"
+OPTIONS = "options"
+PRINTED = "printed"
+PREVIOUS_LABEL = "previous_label"
+CLOSED = "closed"
+
+
+@dataclass
+class SessionState:
+    file_path: str = ""
+    customer_name: str = ""
+    template_name: str = ""
+    total_qty: int = 0
+    batch_size: int = 0
+    rows: list[list[str]] = field(default_factory=list)  # The parsed table rows.
+    printed_lines: list[str] = field(default_factory=list)
+    previous_label: dict = None  # {"file_path": str, "fields": dict, "line": str}
+    closed: bool = True
+
+    @property
+    def resumable(self) -> bool:
+        """True if the program closed without finishing the session."""
+        return bool(self.file_path) and not self.closed
+
+    def apply(self, event: dict):
+        event_type = event["type"]
+        if event_type == LOADED:
+            self.file_path = event["file_path"]
+            self.customer_name = event["customer_name"]
+            self.rows = event["rows"]
+            self.printed_lines = list(event.get("printed_lines", []))
+            self.previous_label = None
+            self.closed = False
+        if event_type in (LOADED, OPTIONS):
+            self.template_name = event["template_name"]
+            self.total_qty = event["total_qty"]
+            self.batch_size = event["batch_size"]
+        elif event_type == PRINTED:
+            # May repeat lines, they are removed when compacted.
+            self.printed_lines.extend(event["lines"])
+        elif event_type == PREVIOUS_LABEL:
+            self.previous_label = {
+                "file_path": event["file_path"],
+                "fields": event["fields"],
+                "line": event.get("line", ""),  # Not saved by older versions.
+            }
+        elif event_type == CLOSED:
+            self.closed = True
+
+
+class SessionJournal:
+    """Saves session events to disk and rebuilds the state from them."""
+
+    def __init__(
+        self, folder: str = SESSION_FOLDER, compact_every: int = SESSION_COMPACT_EVERY
+    ):
+        self.folder = folder
+        self.compact_every = compact_every
+        self.snapshot_path = os.path.join(folder, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(folder, JOURNAL_FILE)
+        self.state = SessionState()
+        self._journal_length = 0
+        self._file = None
+
+    def load(self) -> SessionState:
+        """Read the snapshot and replay the journal. A line cut short by a
+        crash ends the replay."""
+        self.state = SessionState()
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                names = {setting.name for setting in fields(SessionState)}
+                self.state = SessionState(
+                    **{key: value for key, value in data.items() if key in names}
+                )
+            except (ValueError, TypeError) as error:
+                backend_logger.error(f"Could not read session snapshot: {error}")
+
+        self._journal_length = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        self.state.apply(json.loads(line))
+                    except (ValueError, KeyError) as error:
+                        backend_logger.warning(f"Session journal cut short: {error}")
+                        break
+                    self._journal_length += 1
+        return self.state
+
+    def record(self, event_type: str, **data):
+        """Apply an event to the state and append it to the journal."""
+        event = {"type": event_type, **data}
+        self.state.apply(event)
+        if event_type == LOADED or self._journal_length >= self.compact_every:
+            self.compact()
+            return
+        if self._file is None:
+            self._file = open(self.journal_path, "a", encoding="utf-8")
+        self._file.write(json.dumps(event) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._journal_length += 1
+
+    def compact(self):
+        """Write the whole state to the snapshot and start a new journal."""
+        self.state.printed_lines = list(dict.fromkeys(self.state.printed_lines))
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(asdict(self.state), file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        self.close()
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+        self._journal_length = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,6 +1,6 @@
 import os
-from utilities import Version
-from excelparser import RequiredSheet
+import sys
+from utilities import Version, RequiredSheet
 
 
 COMPANY_NAME = "DF-Software"
@@ -10,6 +10,8 @@ USER_HOME_FOLDER = os.path.expanduser("~")
 COMPANY_FOLDER = os.path.join(USER_HOME_FOLDER, "Documents", COMPANY_NAME)
 PROGRAM_FOLDER = os.path.join(COMPANY_FOLDER, PROGRAM_NAME)
 
+SETTINGS_INI_FILE = os.path.join(PROGRAM_FOLDER, "settings.ini")
+
 # Logging
 LOG_FOLDER = os.path.join(PROGRAM_FOLDER, "Logs")
 FRONT_END_LOG_FILE = "frontend.log"
@@ -17,6 +19,33 @@ BACK_END_LOG_FILE = "backend.log"
 
 # Program Settings
 DATE_TIME_FORMAT = "%m-%d-%Y %H:%M"
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+DEFAULT_LABEL_TEMPLATE = "WireBundleLabel"
+SETTINGS_SAVE_INTERVAL_MS = 5000  # How often changed settings are written.
+CUT_SHEET_CACHE_SIZE = 16  # Parsed cut sheets kept in memory, shared by every tab.
+LABEL_PREVIEW_DPI = 150
+LABEL_PREVIEW_CACHE_SIZE = 512  # Rendered previews kept in memory.
+QR_CACHE_SIZE = 1024  # Encoded QR codes kept in memory.
+BARCODE_PATH_CACHE_SIZE = 256  # Drawn QR codes kept by each label renderer.
+PRINT_JOURNAL_FOLDER = os.path.join(PROGRAM_FOLDER, "Print Journal")
+SESSION_FOLDER = os.path.join(PROGRAM_FOLDER, "Session")
+SESSION_COMPACT_EVERY = 500  # Journaled session changes between snapshots.
+METRICS_FOLDER = os.path.join(PROGRAM_FOLDER, "Metrics")
+METRICS_COMPACT_EVERY = 1000  # Pending metric events before merging a month.
+SHIFTS = {"1st": 6, "2nd": 14, "3rd": 22}  # Shift name: start hour.
+REEL_LENGTH_FEET = 500  # Wire on a reel, for gauges without a ReelLengths setting.
+RENDER_CHUNK_SIZE = 16  # Most labels sent to a render worker at once.
+RENDER_CHUNKS_PER_WORKER = 4  # Chunks queued for each worker ahead of the printer.
+RENDER_MIN_PARALLEL_LABELS = 200  # Smaller batches are rendered without workers.
+PRINT_RETRIES = 2  # Retries of labels that failed on every printer.
+PRINT_RETRY_DELAY = 0.5  # Seconds before the first retry, doubled for each one after.
+PRINT_RETRY_MAX_DELAY = 4.0  # Most seconds to wait before a retry.
+PRINT_BATCH_TARGET_SECONDS = 10.0  # Seconds of labels sent to a printer as one job.
+PRINT_MAX_QUEUE_SECONDS = 15.0  # Most seconds of labels left waiting at a printer.
+PRINT_MAX_BATCH_LABELS = 50  # Most labels sent to a printer as one job.
+PRINT_LATENCY_SMOOTHING = 0.2  # Weight of the newest printer speed measurement.
+PRINT_QUEUE_POLL_SECONDS = 0.5  # Most seconds between checks of a printer's queue.
+PRINT_MAX_QUEUE_WAIT_SECONDS = 300.0  # Most seconds to wait for a queue to drain.
 
 
 # Github
@@ -28,6 +57,21 @@ GITHUB_LATEST_RELEASE_ENDPOINT = (
 )
 
 
+# Updates
+if getattr(sys, "frozen", False):
+    INSTALL_FOLDER = os.path.dirname(sys.executable)
+else:
+    INSTALL_FOLDER = os.path.dirname(os.path.abspath(__file__))
+# Next to the install, so it is on the same drive when it is copied over.
+UPDATE_STAGING_FOLDER = f"{INSTALL_FOLDER} Update"
+UPDATE_DOWNLOAD_FOLDER = os.path.join(PROGRAM_FOLDER, "Updates")
+UPDATE_ASSET_PATTERNS = ["*win*64*.zip", "*.zip"]  # In order of preference.
+UPDATE_CHECKSUM_ASSETS = ["SHA256SUMS", "SHA256SUMS.txt", "{name}.sha256"]
+UPDATE_CHUNK_SIZE = 64 * 1024
+UPDATE_DOWNLOAD_ATTEMPTS = 3  # Each attempt resumes where the last stopped.
+UPDATE_TIMEOUT = 30  # Seconds, for each request.
+
+
 # Excel
 CUT_SHEET_NAME = "Cut Sheet"
 
@@ -50,6 +94,43 @@ REQUIRED_SHEETS = [
     ),
 ]
 
+# Columns shown in the wire table. Line and Bundles are calculated.
+TABLE_COLUMNS = ["Line", "Bundles"]
+for required_sheet in REQUIRED_SHEETS:
+    if required_sheet.name != CUT_SHEET_NAME:
+        continue
+    for column in required_sheet.columns:
+        TABLE_COLUMNS.append(column)
+
+# Label field: formula, see fieldformulas.py. Fields can be set per customer or
+# template with LabelFormulas settings.
+WIRE_BUNDLE_TEXT_FORMULA = "\n".join(
+    [
+        "Cut By: {initials}",
+        "{customer} {part_number}",
+        "{Gauge}GA {Color} {Type}",
+        "{Length}",
+        "{Left Terminal}",
+        "{Right Terminal}",
+    ]
+)
+DEFAULT_FIELD_FORMULAS = {
+    "timestamp": "{timestamp}",
+    "left_text_box": WIRE_BUNDLE_TEXT_FORMULA,
+    "right_text_box": WIRE_BUNDLE_TEXT_FORMULA,
+    "barcode": {
+        "Timestamp": "{timestamp}",
+        "Cut By": {"first_name": "{first_name}", "last_name": "{last_name}"},
+        "Customer": "{customer}",
+        "PN": "{part_number}",
+        "Line": "{Line}",
+        "Wire": "{Gauge}GA {Color} {Type}",
+        "Length": "{Length!n}",
+        "Left Term": "{Left Terminal}",
+        "Right Term": "{Right Terminal}",
+    },
+}
+
 
 if not os.path.exists(COMPANY_FOLDER):
     os.makedirs(COMPANY_FOLDER)
@@ -59,3 +140,15 @@ if not os.path.exists(PROGRAM_FOLDER):
 
 if not os.path.exists(LOG_FOLDER):
     os.makedirs(LOG_FOLDER)
+
+if not os.path.exists(PRINT_JOURNAL_FOLDER):
+    os.makedirs(PRINT_JOURNAL_FOLDER)
+
+if not os.path.exists(SESSION_FOLDER):
+    os.makedirs(SESSION_FOLDER)
+
+if not os.path.exists(METRICS_FOLDER):
+    os.makedirs(METRICS_FOLDER)
+
+if not os.path.exists(UPDATE_DOWNLOAD_FOLDER):
+    os.makedirs(UPDATE_DOWNLOAD_FOLDER)
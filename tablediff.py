@@ -0,0 +1,88 @@
+"""Module to find what changed between two loads of a cut sheet.
+
+Rows are compared by a hash of their content, without the line number, so a
+row that only moved because rows were added or removed above it is matched
+to its old line and keeps its printed status."""
+
+from __future__ import annotations
+import hashlib
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+
+
+def row_hash(row: list[str]) -> str:
+    """Hash the cut sheet columns of a wire table row. The line number and the
+    bundles, worked out from the job's total qty and batch size, are left out."""
+    return hashlib.sha1("\x1f".join(row[2:]).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class TableDiff:
+    """The changes to go from the old rows to the new rows, by line number."""
+
+    unchanged: list[str] = field(default_factory=list)
+    moved: dict[str, str] = field(default_factory=dict)  # old_line: new_line
+    updated: list[str] = field(default_factory=list)
+    inserted: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.moved or self.updated or self.inserted or self.deleted)
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.unchanged)} unchanged, {len(self.moved)} moved, "
+            f"{len(self.updated)} updated, {len(self.inserted)} inserted, "
+            f"{len(self.deleted)} deleted"
+        )
+
+
+def diff_table_rows(old: dict[str, str], new: dict[str, str]) -> TableDiff:
+    """Compare two loads of a cut sheet.
+
+    Args:
+        old (dict[str, str]): line: row hash, of the rows loaded.
+        new (dict[str, str]): line: row hash, of the rows just parsed.
+
+    Returns:
+        TableDiff: Rows with the same content on the same line are unchanged.
+            Rows with the same content on another line are moved. Otherwise
+            a row on a line in both is updated, else inserted or deleted.
+    """
+    diff = TableDiff()
+    remaining_new = []
+    for line, new_hash in new.items():
+        if old.get(line) == new_hash:
+            diff.unchanged.append(line)
+        else:
+            remaining_new.append(line)
+
+    # Old lines not matched yet, by content. Duplicate rows match in order.
+    remaining_old = defaultdict(deque)  # type: dict[str, deque[str]]
+    for line, old_hash in old.items():
+        if new.get(line) != old_hash:
+            remaining_old[old_hash].append(line)
+
+    matched_old = set()
+    unmatched_new = []
+    for line in remaining_new:
+        old_lines = remaining_old.get(new[line])
+        if old_lines:
+            old_line = old_lines.popleft()
+            diff.moved[old_line] = line
+            matched_old.add(old_line)
+        else:
+            unmatched_new.append(line)
+
+    for line in unmatched_new:
+        if line in old and line not in matched_old:
+            diff.updated.append(line)
+            matched_old.add(line)
+        else:
+            diff.inserted.append(line)
+
+    for line in old:
+        if new.get(line) != old[line] and line not in matched_old:
+            diff.deleted.append(line)
+    return diff
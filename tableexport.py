@@ -0,0 +1,53 @@
+"""Module to format table rows as CSV, TSV or an HTML table.
+
+Each format is built in one buffer, so thousands of rows can be copied to the
+clipboard or written to a file at once."""
+
+from __future__ import annotations
+import io
+import csv
+import html
+
+CSV = "csv"
+TSV = "tsv"
+HTML = "html"
+
+FILE_EXTENSIONS = {".csv": CSV, ".tsv": TSV, ".txt": TSV, ".html": HTML, ".htm": HTML}
+
+
+def to_delimited(
+    headers: list[str], rows: list[list[str]], delimiter: str = ","
+) -> str:
+    """Format rows as CSV, or TSV with a tab delimiter. Values with quotes,
+    delimiters or new lines are quoted the way Excel expects."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator="\r\n")
+    writer.writerow(headers)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def to_html(headers: list[str], rows: list[list[str]]) -> str:
+    """Format rows as an HTML table. Excel keeps the cells as text when pasted."""
+    parts = ["<html><body><table>", "<tr>"]
+    parts.extend(f"<th>{html.escape(header)}</th>" for header in headers)
+    parts.append("</tr>")
+    for row in rows:
+        parts.append("<tr>")
+        parts.extend(
+            f'<td style="mso-number-format:\\@">{html.escape(value)}</td>'
+            for value in row
+        )
+        parts.append("</tr>")
+    parts.append("</table></body></html>")
+    return "".join(parts)
+
+
+def format_table(headers: list[str], rows: list[list[str]], table_format: str) -> str:
+    if table_format == CSV:
+        return to_delimited(headers, rows, ",")
+    if table_format == TSV:
+        return to_delimited(headers, rows, "\t")
+    if table_format == HTML:
+        return to_html(headers, rows)
+    raise ValueError(f"Unknown table format: {table_format}")
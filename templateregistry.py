@@ -0,0 +1,83 @@
+"""Module to discover and cache the label templates in the templates folder."""
+
+from __future__ import annotations
+import os
+import logging
+from dataclasses import dataclass
+
+from errors import InvalidLabelFileError
+from label import LabelTemplate
+
+backend_logger = logging.getLogger("backend")
+
+LABEL_FILE_EXTENSION = ".label"
+
+
+@dataclass
+class TemplateEntry:
+    """A parsed template and the modified time of the file it came from."""
+
+    name: str
+    file_path: str
+    mtime: float = None
+    template: LabelTemplate = None
+
+
+class TemplateRegistry:
+    """Finds every `.label` file in a folder. Each file is parsed once and only
+    parsed again when its modified time changes."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._entries = {}  # type: dict[str, TemplateEntry]
+        self.refresh()
+
+    def refresh(self) -> list[str]:
+        """Rescan the templates folder. Returns the template names found."""
+        found = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    name, extension = os.path.splitext(entry.name)
+                    if extension.lower() != LABEL_FILE_EXTENSION or not entry.is_file():
+                        continue
+                    found[name] = self._entries.get(
+                        name, TemplateEntry(name=name, file_path=entry.path)
+                    )
+        except FileNotFoundError:
+            backend_logger.error(f"Template folder not found: {self.folder}")
+
+        self._entries = found
+        backend_logger.debug(f"Label templates: {self.names()}")
+        return self.names()
+
+    def names(self) -> list[str]:
+        """Get the names of all known templates, sorted."""
+        return sorted(self._entries)
+
+    def file_path(self, name: str) -> str:
+        """Get the file path of a template."""
+        if name not in self._entries:
+            raise InvalidLabelFileError(f"Label template not found: {name}")
+        return self._entries[name].file_path
+
+    def get(self, name: str) -> LabelTemplate:
+        """Get a parsed template, reparsing it if the file has changed."""
+        file_path = self.file_path(name)
+        entry = self._entries[name]
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            raise InvalidLabelFileError(f"Label template not found: {file_path}")
+
+        if entry.template is None or entry.mtime != mtime:
+            backend_logger.info(f"Loading label template: {file_path}")
+            entry.template = LabelTemplate.from_file(file_path)
+            entry.mtime = mtime
+        return entry.template
+
+    @staticmethod
+    def missing_fields(template: LabelTemplate, field_names: list[str]) -> list[str]:
+        """Get the field names that do not exist in the template."""
+        object_names = {label_object.name for label_object in template.objects}
+        return [name for name in field_names if name not in object_names]
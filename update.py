@@ -1,19 +1,47 @@
 """"Module to add update functionality to the program.
-    Checking github for a newer release."""
+    Checking github for a newer release.
+
+The release asset is downloaded in the background, resuming a partial download
+where it stopped, and checked against its checksum. It is then extracted next
+to the install and copied over it the next time the program starts. Downloads
+can be shared through a cache folder, so only one PC downloads each release."""
 
 from __future__ import annotations
+import os
+import sys
+import shutil
+import fnmatch
+import hashlib
+import zipfile
+import platform
+import subprocess
 import webbrowser
 import requests
 import json
 import logging
+from typing import Callable
+from PyQt5 import QtCore
 from PyQt5.QtWidgets import QMessageBox, QApplication
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from errors import *
 from settings import *
 
 
 backend_logger = logging.getLogger("backend")
 root_logger = logging.getLogger("root")
 
+STAGED_MARKER_FILE = "staged.json"
+INSTALL_SCRIPT_FILE = "install_update.bat"
+INSTALL_SCRIPT = """@echo off
+rem Wait for the program to exit, so its files can be replaced.
+:wait
+tasklist /fi "PID eq {pid}" | find "{pid}" >nul && (timeout /t 1 /nobreak >nul & goto wait)
+robocopy "{source}" "{target}" /E /IS /IT /NFL /NDL /NJH /NJS /NP >nul
+del "{marker}"
+rmdir /s /q "{source}"
+start "" "{executable}"
+"""
+
 
 @dataclass
 class Author:
@@ -64,6 +92,7 @@ class Asset:
     created_at: str
     updated_at: str
     browser_download_url: str
+    digest: str = None  # IE. "sha256:<hex>", not given for older releases.
 
     def json(self) -> str:
         """Return the release as a json string."""
@@ -71,10 +100,10 @@ class Asset:
 
     @staticmethod
     def from_dict(data: dict) -> Asset:
-        """Create a new Asset object from a dictionary."""
-        if "uploader" in data:
-            del data["uploader"]
-        return Asset(**data)
+        """Create a new Asset object from a dictionary. Keys not used, such as
+        the uploader, are left out."""
+        names = {asset_field.name for asset_field in fields(Asset)}
+        return Asset(**{key: value for key, value in data.items() if key in names})
 
 
 @dataclass
@@ -151,10 +180,12 @@ class ReleaseResponse:
         )
 
 
-def get_latest_release() -> ReleaseResponse:
+def get_latest_release(
+    endpoint: str = GITHUB_LATEST_RELEASE_ENDPOINT, session: requests.Session = None
+) -> ReleaseResponse:
     """Get the latest release from the github API."""
     backend_logger.debug("Getting latest release from Github.")
-    response = requests.get(GITHUB_LATEST_RELEASE_ENDPOINT)
+    response = (session or requests).get(endpoint, timeout=UPDATE_TIMEOUT)
     response.raise_for_status()
     return ReleaseResponse.from_json(json.loads(response.text))
 
@@ -196,6 +227,335 @@ def check_for_updates() -> bool:
     return True
 
 
+def select_asset(
+    release: ReleaseResponse, patterns: list[str] = UPDATE_ASSET_PATTERNS
+) -> Asset:
+    """Pick the asset to install, the first uploaded asset matching the first
+    pattern that matches any."""
+    assets = [asset for asset in release.assets if asset.state == "uploaded"]
+    for pattern in patterns:
+        for asset in assets:
+            if fnmatch.fnmatch(asset.name.lower(), pattern.lower()):
+                return asset
+    raise UpdateError(
+        f"Release {release.version} has no asset matching: {', '.join(patterns)}"
+    )
+
+
+def file_checksum(file_path: str) -> str:
+    """SHA-256 of a file, as hex."""
+    checksum = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(UPDATE_CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def parse_checksums(text: str, name: str) -> str:
+    """Find the checksum of a file in a checksums file. Lines are either
+    "<hex>  <file name>" or just "<hex>" for a file of its own."""
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 1:
+            return parts[0].lower()
+        if len(parts) >= 2 and parts[-1].lstrip("*") == name:
+            return parts[0].lower()
+    return None
+
+
+def read_staged_update(staging_folder: str = UPDATE_STAGING_FOLDER) -> dict:
+    """Get the staged update, {"version": str, "folder": str}, if there is one."""
+    marker_path = os.path.join(staging_folder, STAGED_MARKER_FILE)
+    if not os.path.exists(marker_path):
+        return None
+    try:
+        with open(marker_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except ValueError as error:
+        backend_logger.error(f"Invalid staged update: {error}")
+        return None
+
+
+class Updater:
+    """Downloads the latest release and stages it to be installed.
+
+    Args:
+        endpoint (str): The latest release API endpoint.
+        download_folder (str): Where downloads, and partial downloads, are kept.
+        staging_folder (str): Where releases are extracted to be installed.
+        cache_folder (str): A folder shared by every PC. Downloads are taken
+            from it when there, and copied to it otherwise. Blank to disable.
+        session (requests.Session): The session to make requests with.
+        current_version (Version): The version running.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = GITHUB_LATEST_RELEASE_ENDPOINT,
+        download_folder: str = UPDATE_DOWNLOAD_FOLDER,
+        staging_folder: str = UPDATE_STAGING_FOLDER,
+        cache_folder: str = "",
+        session: requests.Session = None,
+        current_version: Version = VERSION,
+    ):
+        self.endpoint = endpoint
+        self.download_folder = download_folder
+        self.staging_folder = staging_folder
+        self.cache_folder = cache_folder
+        self.session = session or requests.Session()
+        self.current_version = current_version
+
+    def update(self, progress: Callable[[int, int], None] = None) -> ReleaseResponse:
+        """Download and stage the latest release, if it is newer.
+
+        Args:
+            progress (Callable[[int, int], None]): Called with the bytes
+                downloaded and the total, as the download goes.
+
+        Returns:
+            ReleaseResponse: The release staged, or None if up to date.
+        """
+        release = get_latest_release(self.endpoint, self.session)
+        if not is_new_release(self.current_version, release):
+            backend_logger.info("No new release available.")
+            return None
+        staged = read_staged_update(self.staging_folder)
+        if staged is not None and staged["version"] == release.version:
+            backend_logger.info(f"Release {release.version} is already staged.")
+            return release
+
+        root_logger.info(f"New release available: {release.version}")
+        asset = select_asset(release)
+        checksum = self.expected_checksum(release, asset)
+        file_path = self.cached_download(asset, checksum)
+        if file_path is None:
+            file_path = self.download(asset, checksum, progress)
+            self.store_in_cache(file_path)
+        self.stage(release, file_path)
+        return release
+
+    def expected_checksum(self, release: ReleaseResponse, asset: Asset) -> str:
+        """The SHA-256 published for an asset. Either the assets digest or a
+        checksums file attached to the release. None if not published."""
+        if asset.digest and asset.digest.startswith("sha256:"):
+            return asset.digest.split(":", 1)[1].lower()
+        names = [name.format(name=asset.name) for name in UPDATE_CHECKSUM_ASSETS]
+        for other in release.assets:
+            if other.name not in names:
+                continue
+            response = self.session.get(
+                other.browser_download_url, timeout=UPDATE_TIMEOUT
+            )
+            response.raise_for_status()
+            checksum = parse_checksums(response.text, asset.name)
+            if checksum is not None:
+                return checksum
+        backend_logger.warning(f"No checksum published for {asset.name}.")
+        return None
+
+    def is_valid(self, file_path: str, asset: Asset, checksum: str) -> bool:
+        if os.path.getsize(file_path) != asset.size:
+            return False
+        return checksum is None or file_checksum(file_path) == checksum
+
+    def cached_download(self, asset: Asset, checksum: str) -> str:
+        """Path to the asset in the shared cache, if it is there and valid."""
+        if not self.cache_folder:
+            return None
+        file_path = os.path.join(self.cache_folder, asset.name)
+        try:
+            if os.path.exists(file_path) and self.is_valid(file_path, asset, checksum):
+                backend_logger.info(f"Using cached update: {file_path}")
+                return file_path
+        except OSError as error:
+            backend_logger.warning(f"Could not read update cache: {error}")
+        return None
+
+    def store_in_cache(self, file_path: str):
+        """Copy a download to the shared cache, for the other PCs."""
+        if not self.cache_folder:
+            return
+        target_path = os.path.join(self.cache_folder, os.path.basename(file_path))
+        # Copied under a name of its own first, so no PC reads it half copied.
+        temp_path = f"{target_path}.{platform.node()}.tmp"
+        try:
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, target_path)
+        except OSError as error:
+            backend_logger.warning(f"Could not copy update to cache: {error}")
+
+    def download(
+        self,
+        asset: Asset,
+        checksum: str = None,
+        progress: Callable[[int, int], None] = None,
+    ) -> str:
+        """Download an asset, resuming a partial download if there is one.
+
+        Raises:
+            UpdateError: If the download fails every attempt.
+            ChecksumMismatchError: If the download does not match the checksum.
+
+        Returns:
+            str: Path to the downloaded file.
+        """
+        file_path = os.path.join(self.download_folder, asset.name)
+        if os.path.exists(file_path) and self.is_valid(file_path, asset, checksum):
+            return file_path
+        partial_path = f"{file_path}.part"
+
+        for attempt in range(1, UPDATE_DOWNLOAD_ATTEMPTS + 1):
+            try:
+                self._download_remaining(asset, partial_path, progress)
+                break
+            except requests.RequestException as error:
+                backend_logger.warning(
+                    f"Download of {asset.name} failed, attempt {attempt}: {error}"
+                )
+        else:
+            raise UpdateError(f"Could not download {asset.name}.")
+
+        if not self.is_valid(partial_path, asset, checksum):
+            os.remove(partial_path)
+            raise ChecksumMismatchError(
+                f"Download of {asset.name} does not match its size or checksum."
+            )
+        os.replace(partial_path, file_path)
+        backend_logger.info(f"Downloaded update: {file_path}")
+        return file_path
+
+    def _download_remaining(
+        self, asset: Asset, partial_path: str, progress: Callable[[int, int], None]
+    ):
+        """Download the part of an asset not in the partial file yet."""
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        if offset >= asset.size:
+            if offset == asset.size:
+                return
+            offset = 0  # Not the same file, start over.
+        headers = {"Accept": "application/octet-stream"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            backend_logger.info(f"Resuming download of {asset.name} at {offset}.")
+        with self.session.get(
+            asset.browser_download_url,
+            headers=headers,
+            stream=True,
+            timeout=UPDATE_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                offset = 0  # The server sent the whole file.
+            with open(partial_path, "ab" if offset else "wb") as file:
+                for chunk in response.iter_content(UPDATE_CHUNK_SIZE):
+                    file.write(chunk)
+                    offset += len(chunk)
+                    if progress is not None:
+                        progress(offset, asset.size)
+
+    def stage(self, release: ReleaseResponse, file_path: str) -> str:
+        """Extract a release next to the install. Returns the staged folder."""
+        folder = os.path.join(self.staging_folder, release.version)
+        temp_folder = f"{folder}.tmp"
+        for path in (folder, temp_folder):
+            shutil.rmtree(path, ignore_errors=True)
+        with zipfile.ZipFile(file_path) as archive:
+            archive.extractall(temp_folder)
+
+        # Releases are zipped with the program folder at the top.
+        entries = os.listdir(temp_folder)
+        if len(entries) == 1 and os.path.isdir(os.path.join(temp_folder, entries[0])):
+            os.replace(os.path.join(temp_folder, entries[0]), folder)
+            shutil.rmtree(temp_folder)
+        else:
+            os.replace(temp_folder, folder)
+
+        marker_path = os.path.join(self.staging_folder, STAGED_MARKER_FILE)
+        with open(f"{marker_path}.tmp", "w", encoding="utf-8") as file:
+            json.dump({"version": release.version, "folder": folder}, file)
+        os.replace(f"{marker_path}.tmp", marker_path)
+        root_logger.info(f"Staged release {release.version}: {folder}")
+        return folder
+
+
+def apply_staged_update(
+    staging_folder: str = UPDATE_STAGING_FOLDER,
+    install_folder: str = INSTALL_FOLDER,
+    current_version: Version = VERSION,
+) -> bool:
+    """Install a staged update, if newer than the running version.
+
+    Returns:
+        bool: True if the install was started. The program must then exit, so
+            its files can be replaced. It is started again when done.
+    """
+    staged = read_staged_update(staging_folder)
+    if staged is None:
+        return False
+    marker_path = os.path.join(staging_folder, STAGED_MARKER_FILE)
+    if not Version.from_string(staged["version"]) > current_version:
+        backend_logger.info(f"Removing old staged update: {staged['version']}")
+        os.remove(marker_path)
+        shutil.rmtree(staged["folder"], ignore_errors=True)
+        return False
+    if not getattr(sys, "frozen", False):
+        backend_logger.warning("Staged updates are only installed by the built exe.")
+        return False
+
+    root_logger.info(f"Installing update {staged['version']} to {install_folder}")
+    script_path = os.path.join(staging_folder, INSTALL_SCRIPT_FILE)
+    with open(script_path, "w", encoding="utf-8") as file:
+        file.write(
+            INSTALL_SCRIPT.format(
+                pid=os.getpid(),
+                source=staged["folder"],
+                target=install_folder,
+                marker=marker_path,
+                executable=sys.executable,
+            )
+        )
+    subprocess.Popen(
+        ["cmd", "/c", script_path],
+        creationflags=getattr(subprocess, "DETACHED_PROCESS", 0),
+        close_fds=True,
+    )
+    return True
+
+
+class UpdateThread(QtCore.QThread):
+    """Downloads and stages the latest release in the background."""
+
+    progress = QtCore.pyqtSignal(int, int)  # Bytes downloaded, total.
+    staged = QtCore.pyqtSignal(str)  # Version
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, updater: Updater, parent=None):
+        super().__init__(parent)
+        self.updater = updater
+
+    def on_progress(self, downloaded: int, total: int):
+        if self.isInterruptionRequested():
+            # The partial download is kept, to resume next time.
+            raise InterruptedError("Update download stopped.")
+        self.progress.emit(downloaded, total)
+
+    def run(self):
+        try:
+            release = self.updater.update(self.on_progress)
+        except (
+            Error,
+            requests.RequestException,
+            OSError,
+            ValueError,
+            zipfile.BadZipFile,
+        ) as error:
+            backend_logger.error(f"Could not update: {error}")
+            self.failed.emit(str(error))
+            return
+        if release is not None:
+            self.staged.emit(release.version)
+
+
 if __name__ == "__main__":
     app = QApplication([])
     check_for_updates()
@@ -2,34 +2,6 @@ from __future__ import annotations
 from asyncio import protocols
 from typing import Any
 from dataclasses import dataclass
-from PyQt5.QtCore import QSettings
-
-
-@dataclass
-class DefaultSetting:
-    """Default settings."""
-
-    settings: QSettings
-    group_name: str
-    name: str
-    value: Any
-
-    def set(self, value) -> None:
-        """Set the default setting."""
-        self.value = value
-        self.settings.beginGroup(self.group_name)
-        self.settings.setValue(self.name, self.value)
-        self.settings.endGroup()
-
-    def initialize_setting(self) -> DefaultSetting:
-        """Initialize the default setting or pulls the current setting value."""
-        self.settings.beginGroup(self.group_name)
-        if not self.settings.contains(self.name):
-            self.settings.setValue(self.name, self.value)
-        else:
-            self.value = self.settings.value(self.name)
-        self.settings.endGroup()
-        return self
 
 
 @dataclass
@@ -47,20 +19,26 @@ class Version:
     def total(self) -> int:
         return self.major + self.minor + self.patch
 
+    @property
+    def parts(self) -> tuple[int, int, int]:
+        """The version as a tuple, which compares major first, then minor,
+        then patch. IE. 1.0.3 is newer than 0.2.5."""
+        return (self.major, self.minor, self.patch)
+
     def __eq__(self, __o: Version) -> bool:
-        return self.total == __o.total
+        return self.parts == __o.parts
 
     def __lt__(self, __o: Version) -> bool:
-        return self.total < __o.total
+        return self.parts < __o.parts
 
     def __gt__(self, __o: Version) -> bool:
-        return self.total > __o.total
+        return self.parts > __o.parts
 
     def __le__(self, __o: Version) -> bool:
-        return self.total <= __o.total
+        return self.parts <= __o.parts
 
     def __ge__(self, __o: Version) -> bool:
-        return self.total >= __o.total
+        return self.parts >= __o.parts
 
     @staticmethod
     def from_string(version: str) -> Version:
@@ -69,6 +47,14 @@ class Version:
         return Version(int(major), int(minor), int(patch))
 
 
+@dataclass
+class RequiredSheet:
+    """A class to represent a required sheet."""
+
+    name: str
+    columns: list
+
+
 @dataclass
 class User:
     first_name: str
@@ -116,6 +102,8 @@ def parse_version(version: str) -> tuple[int, int, int]:
     Returns:
         tuple[int, int, int]: Returns the major, minor, patch for the version.
     """
-    version = version.replace("v", "")
+    version = version.strip().lstrip("vV")
+    # Pre-release and build metadata, IE. 1.1.0-beta+2, are ignored.
+    version = version.split("-")[0].split("+")[0]
     major, minor, patch = version.split(".")
     return major, minor, patch